@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+""" Measures the startup time of puzzle_maker.py for the cases that must not start an engine
+    and lists the slowest imports (python -X importtime)
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+parser.add_argument("--runs", default=5, type=int,
+                    help="Number of runs per case, the best one is reported")
+parser.add_argument("--top", default=10, type=int,
+                    help="Number of slowest imports to list per case")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(args):
+    """
+    Returns the wall time of a puzzle_maker.py run and its import times (us) by module
+    """
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT, 'puzzle_maker.py')] + args,
+                             cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    imports = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        imports[module.strip()] = int(cumulative)
+
+    return elapsed, imports
+
+
+def main():
+    settings = parser.parse_args()
+
+    empty_csv = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+    empty_csv.write('id,rplayer,bplayer,moves_count,moves\n')
+    empty_csv.close()
+
+    cases = {
+        'help': ['-h'],
+        'missing input': ['--games_csv', 'missing-games.csv'],
+        'empty input': ['--games_csv', empty_csv.name, '--quiet', '--out-csv', os.devnull],
+    }
+    try:
+        for name, args in cases.items():
+            elapsed, imports = min((run(args) for _ in range(settings.runs)), key=lambda r: r[0])
+            print(f'{name}: {elapsed * 1000:.1f}ms')
+            slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:settings.top]
+            for module, cumulative in slowest:
+                print(f'  {cumulative / 1000:8.1f}ms  {module}')
+    finally:
+        os.unlink(empty_csv.name)
+
+
+if __name__ == '__main__':
+    main()
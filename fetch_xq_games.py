@@ -3,6 +3,8 @@ import time
 
 import requests
 
+from xqpuzzles.fileio import open_file
+
 # --------------------------------------------------------------------
 # Required: Get admin JWT from browser cookies or storage data
 JWT = 'admin-JWT'
@@ -10,6 +12,8 @@ JWT = 'admin-JWT'
 USERS = ['SeeShuk', 'lemontea', 'MartyJr', 'DavidK', 'maxland', 'ngkaizhe', 'Mann']
 # Optional: Mention, how many recent games should be fetched of each user
 DEFAULT_TOTAL_GAMES = 150
+# Optional: The output CSV file, compressed when it ends with .gz, .bz2, .xz or .zst
+OUT_FILE = 'out-games.csv'
 # --------------------------------------------------------------------
 
 BASE_URL = 'https://api.play.xiangqi.com'
@@ -69,6 +73,9 @@ def parse_games(res_json):
             'rplayer': game['rplayer']['username'],
             'bplayer': game['bplayer']['username'],
             'moves_count': game['moves_count'],
+            'end_reason': game['end_reason'],
+            'rrating': game['rplayer'].get('rating'),
+            'brating': game['bplayer'].get('rating'),
             'moves': game['uci_moves'],
         })
 
@@ -76,9 +83,9 @@ def parse_games(res_json):
 
 
 if __name__ == '__main__':
-    file_name = 'out-games.csv'
-    with open(file_name, 'w', newline='') as csvfile:
-        fieldnames = ['id', 'rplayer', 'bplayer', 'moves_count', 'moves']
+    file_name = OUT_FILE
+    with open_file(file_name, 'w') as csvfile:
+        fieldnames = ['id', 'rplayer', 'bplayer', 'moves_count', 'end_reason', 'rrating', 'brating', 'moves']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+""" Generates synthetic xiangqi game corpora and load tests the scan pipeline on them with a
+    stand-in engine, reporting the throughput and memory as the corpus size grows
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+subparsers = parser.add_subparsers(dest='command', required=True)
+
+generate_parser = subparsers.add_parser('generate', help="Write a synthetic games CSV")
+generate_parser.add_argument("out_csv", type=str, help="The games CSV file")
+generate_parser.add_argument("--games", default=1000, type=int, help="Number of games")
+generate_parser.add_argument("--seed", default=0, type=int, help="Random seed, the same seed gives the same games")
+generate_parser.add_argument("--min-plies", default=20, type=int, help="Minimum plies per game")
+generate_parser.add_argument("--max-plies", default=120, type=int, help="Maximum plies per game")
+
+run_parser = subparsers.add_parser('run', help="Scan synthetic corpora of growing sizes")
+run_parser.add_argument("--sizes", default='100,1000,10000', type=str, help="Corpus sizes (games)")
+run_parser.add_argument("--workers", default=1, type=int, help="Number of scanning workers")
+run_parser.add_argument("--latency", default=0.0, type=float, help="Seconds per stand-in engine search")
+run_parser.add_argument("--seed", default=0, type=int, help="Random seed of the corpora")
+
+scan_parser = subparsers.add_parser('scan', help="Scan one corpus and print its measurements as JSON")
+scan_parser.add_argument("games_csv", type=str)
+scan_parser.add_argument("--workers", default=1, type=int)
+scan_parser.add_argument("--latency", default=0.0, type=float)
+
+
+def scan(settings):
+    import logging
+    from xqpuzzles.logger import configure_logging
+    from xqpuzzles.resources import EnginePlan
+    from xqpuzzles.scanner import scan_games
+    from xqpuzzles.utils import PuzzleWriter, open_games
+
+    configure_logging(level=logging.WARNING)
+    plans = [EnginePlan(1, 16, None)] * settings.workers
+    out_csv = settings.games_csv + '.puzzles.csv'
+
+    games_count, plies_count, puzzles_count = 0, 0, 0
+    start = time.perf_counter()
+    with open_games(settings.games_csv) as games, PuzzleWriter(out_csv) as writer:
+        for scanned in scan_games('standin', games, plans, cache_size=0, latency=settings.latency):
+            writer.write(scanned.puzzles, game_id=scanned.game['id'])
+            games_count += 1
+            plies_count += len(scanned.timeline)
+            puzzles_count += len(scanned.puzzles)
+    elapsed = time.perf_counter() - start
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({'games': games_count, 'plies': plies_count, 'puzzles': puzzles_count, 'seconds': elapsed,
+                      'max_rss_kb': max_rss, 'max_worker_rss_kb': children_rss}))
+
+
+def run(settings):
+    from xqpuzzles.synthetic import write_synthetic_csv
+
+    print('%8s %10s %10s %10s %12s %12s' % ('games', 'seconds', 'games/s', 'plies/s', 'rss (MB)', 'worker (MB)'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in [int(size) for size in settings.sizes.split(',')]:
+            games_csv = os.path.join(tmp_dir, f'games-{size}.csv')
+            write_synthetic_csv(games_csv, size, seed=settings.seed)
+
+            # Every size is scanned by a new process so that its peak memory is measured alone
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), 'scan', games_csv,
+                                     '--workers', str(settings.workers), '--latency', str(settings.latency)],
+                                    check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print('%8d %10.2f %10.1f %10.1f %12.1f %12.1f' % (
+                result['games'], result['seconds'], result['games'] / result['seconds'],
+                result['plies'] / result['seconds'], result['max_rss_kb'] / 1024, result['max_worker_rss_kb'] / 1024))
+
+
+def main():
+    settings = parser.parse_args()
+    if settings.command == 'generate':
+        from xqpuzzles.synthetic import write_synthetic_csv
+        write_synthetic_csv(settings.out_csv, settings.games, settings.seed, settings.min_plies, settings.max_plies)
+    elif settings.command == 'run':
+        run(settings)
+    else:
+        scan(settings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+""" Sends scan jobs to a running puzzle daemon (puzzle_maker.py --daemon SOCKET)
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+parser = argparse.ArgumentParser(
+    description=__doc__,
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+
+group = parser.add_mutually_exclusive_group(required=True)
+group.add_argument("--moves", metavar="MOVES", type=str,
+                   help="UCI moves of a xiangqi game")
+group.add_argument("--games_csv", metavar="GAMES_CSV", type=str,
+                   help="A CSV file with games to scan for puzzles, it's read by the daemon")
+
+parser.add_argument("--socket", default='puzzle_maker.sock', type=str,
+                    help="The Unix socket of the puzzle daemon")
+parser.add_argument("--out-csv", default=None, type=str,
+                    help="The name of output CSV file where founded puzzles will be imported")
+
+
+def request(socket_path, job):
+    """
+    Sends a scan job to the daemon and yields its JSON replies
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(job) + '\n').encode())
+        with sock.makefile('r') as replies:
+            for line in replies:
+                reply = json.loads(line)
+                yield reply
+                if 'game_id' not in reply:
+                    return
+
+
+if __name__ == '__main__':
+    settings = parser.parse_args()
+
+    if settings.moves:
+        job = {'moves': settings.moves.split(',')}
+    else:
+        # The daemon writes the puzzles of CSV jobs itself
+        job = {'games_csv': os.path.abspath(settings.games_csv)}
+        if settings.out_csv:
+            job['out_csv'] = os.path.abspath(settings.out_csv)
+
+    for reply in request(settings.socket, job):
+        if 'error' in reply:
+            print(reply['error'], file=sys.stderr)
+            sys.exit(1)
+
+        for puzzle in reply.get('puzzles', []):
+            print(json.dumps(puzzle))
+
+        if settings.moves and settings.out_csv:
+            from xqpuzzles.utils import export_puzzles_to_csv
+            export_puzzles_to_csv(settings.out_csv, reply['puzzles'])
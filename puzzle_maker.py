@@ -4,17 +4,22 @@
 """
 
 import argparse
-import ast
-import csv
+import itertools
 import logging
+import os
 import sys
+import time
+
+# Keep the startup fast: the engine and board modules (python-chess, pyffish) are
+# imported only by the mode that needs them, after the arguments are validated
+from xqpuzzles.constants import DEFAULT_NODES, WORKERS, THREADS, MEMORY, EVAL_CACHE_SIZE, SHARD_SIZE, SHARD_LEASE, \
+    SHARD_ATTEMPTS, MIN_SCORE_SWING, MAX_WINNING_SCORE, MAX_MATE_MOVES, MAX_MATERIAL_DIFF, PENDING_GAMES, MAX_RSS, \
+    GAME_TIMEOUT, GAME_NODES, MAX_GAME_PLIES
+
+
+def auto_int(value):
+    return None if value == 'auto' else int(value)
 
-from xqpuzzles.colors import Color
-from xqpuzzles.logger import configure_logging, log
-from xqpuzzles.logger import ENGINE
-from xqpuzzles.puzzle_finder import find_puzzle_candidates
-from xqpuzzles.analysis import Stockfish, Pikafish
-from xqpuzzles.utils import export_puzzles_to_csv
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -27,10 +32,108 @@ group.add_argument("--moves", metavar="MOVES", type=str,
                     help="UCI moves of a xiangqi game")
 group.add_argument("--games_csv", metavar="GAMES_CSV", type=str,
                     help="A CSV file with games to scan for puzzles")
+group.add_argument("--fens", metavar="FENS", type=str,
+                   help="A file with a FEN per line (optionally 'id,FEN') to evaluate as single positions")
+group.add_argument("--games_archive", metavar="GAMES_ARCHIVE", type=str,
+                    help="A binary game archive (.xqg) with games to scan for puzzles, see --to-archive")
+group.add_argument("--daemon", metavar="SOCKET", type=str,
+                    help="Keep the engines loaded and serve scan jobs on a Unix socket (see puzzle_client.py)")
+group.add_argument("--reclassify", metavar="TIMELINES", type=str,
+                    help="Find puzzles in stored evaluation timelines (see --timelines) without an engine")
+group.add_argument("--work", metavar="QUEUE", type=str,
+                    help="Scan shards leased from a job queue (see --enqueue) until all of them are done")
+group.add_argument("--merge", metavar="QUEUE", type=str,
+                    help="Combine the outputs of the done shards of a job queue into --out-csv")
+group.add_argument("--serve-engines", metavar="HOST:PORT", type=str,
+                    help="Serve --workers local engines over TCP to scanning hosts (see --remote), "
+                         "without authentication: bind it to a trusted interface")
+group.add_argument("--serve-puzzles", metavar="HOST:PORT|SOCKET", type=str,
+                   help="Serve puzzle queries of the --store over HTTP on a TCP address or a Unix socket")
+group.add_argument("--import-puzzles", metavar="PUZZLES_CSV", type=str,
+                   help="Add the puzzles of a puzzles CSV file to the --store")
+group.add_argument("--calibrate", default=False, action="store_true",
+                    help="Measure engine speed on this machine and suggest a node budget for --nodes")
 
 # Misc settings
 parser.add_argument("--engine", metavar="ENGINE", type=str, choices=['pikafish', 'stockfish'],
                     help="Give a valid engine name ('pikafish', 'stockfish')", default='pikafish')
+parser.add_argument("--verify-engine", metavar="ENGINE", type=str, choices=['pikafish', 'stockfish'], default=None,
+                    help="Re-check every found puzzle with a second engine while the games are scanned")
+parser.add_argument("--on-disagreement", type=str, choices=['flag', 'drop'], default='flag',
+                    help="Flag (cross_check column) or drop the puzzles the second engine disagrees on")
+parser.add_argument("--nodes", metavar="NODES", type=int, default=DEFAULT_NODES,
+                    help="Limit every search by a node budget instead of movetime (reproducible results)")
+parser.add_argument("--workers", metavar="WORKERS", type=auto_int, default=WORKERS,
+                    help="Number of engines scanning games in parallel, 'auto' to use one per available CPU")
+parser.add_argument("--threads", metavar="THREADS", type=auto_int, default=THREADS,
+                    help="Threads per engine, 'auto' to share the available CPUs between engines")
+parser.add_argument("--hash", metavar="MB", type=auto_int, default=MEMORY,
+                    help="Hash size per engine, 'auto' to share the available memory between engines")
+parser.add_argument("--eval-cache", metavar="MB", type=int, default=EVAL_CACHE_SIZE,
+                    help="Size of the evaluation cache shared by the workers, 0 to disable it")
+parser.add_argument("--remote", metavar="HOST:PORT,...", type=lambda value: value.split(','), default=None,
+                    help="Use the engines of these engine servers instead of local engines")
+parser.add_argument("--pending-games", metavar="GAMES", type=int, default=PENDING_GAMES,
+                    help="Games handed to every worker ahead of the scan, bounds the games and results held in memory")
+parser.add_argument("--max-rss", metavar="MB", type=int, default=MAX_RSS,
+                    help="Stop reading games while the scanning process uses more memory than this")
+parser.add_argument("--record", metavar="DIR", type=str, default=None,
+                    help="Record the searches of every engine session into this directory (see --replay)")
+parser.add_argument("--replay", metavar="DIR", type=str, default=None,
+                    help="Answer the searches from recorded engine sessions instead of running the engines")
+parser.add_argument("--pin-cpus", default=False, action="store_true",
+                    help="Pin every engine process to its own CPUs")
+parser.add_argument("--to-archive", metavar="ARCHIVE", type=str, default=None,
+                    help="Convert the games CSV into a binary game archive (.xqg) instead of scanning it")
+parser.add_argument("--enqueue", metavar="QUEUE", type=str, default=None,
+                    help="Split the games into shards of a job queue (SQLite file) instead of scanning them")
+parser.add_argument("--shard-size", metavar="GAMES", type=int, default=SHARD_SIZE,
+                    help="Number of games per shard of the job queue")
+parser.add_argument("--shard-attempts", metavar="ATTEMPTS", type=int, default=SHARD_ATTEMPTS,
+                    help="Scans of a shard which failed before the shard is given up")
+parser.add_argument("--shards-dir", metavar="DIR", type=str, default=None,
+                    help="Directory of the shard outputs, QUEUE.shards by default")
+parser.add_argument("--lease", metavar="SECONDS", type=int, default=SHARD_LEASE,
+                    help="Seconds a shard stays leased to a worker without heartbeat")
+parser.add_argument("--priority", default=False, action="store_true",
+                    help="Scan the games most likely to hold puzzles first "
+                         "(long decisive games with captures and checks)")
+parser.add_argument("--time-budget", metavar="SECONDS", type=int, default=None,
+                    help="Stop the scan cleanly after this many seconds")
+parser.add_argument("--game-timeout", metavar="SECONDS", type=int, default=GAME_TIMEOUT,
+                    help="Give up a game after this many seconds, a hung engine is killed and restarted "
+                         "(0 for no limit)")
+parser.add_argument("--game-nodes", metavar="NODES", type=int, default=GAME_NODES,
+                    help="Give up a game once its searches used this many engine nodes")
+parser.add_argument("--max-plies", metavar="PLIES", type=int, default=MAX_GAME_PLIES,
+                    help="Give up games longer than this many moves (0 for no limit)")
+parser.add_argument("--quarantine", metavar="FILE", type=str, default=None,
+                    help="Record the games with invalid moves or given up in this file and skip them in later scans")
+parser.add_argument("--timelines", metavar="TIMELINES", type=str, default=None,
+                    help="Store the evaluation of every scanned position in this file (.gz to compress)")
+parser.add_argument("--store", metavar="DB", type=str, default=None,
+                    help="Also write the found puzzles into this indexed puzzle store (SQLite file)")
+
+# Puzzle predicates
+parser.add_argument("--min-swing", metavar="CP", type=int, default=MIN_SCORE_SWING,
+                    help="Minimum score swing of a capturing puzzle")
+parser.add_argument("--max-score", metavar="CP", type=int, default=MAX_WINNING_SCORE,
+                    help="Maximum winning score of a capturing puzzle")
+parser.add_argument("--max-mate", metavar="MOVES", type=int, default=MAX_MATE_MOVES,
+                    help="Longest mate of a checkmate puzzle")
+parser.add_argument("--max-material-diff", metavar="PIECES", type=int, default=MAX_MATERIAL_DIFF,
+                    help="Positions with this difference of major pieces or more are not puzzles")
+parser.add_argument("--no-mate-verification", default=False, action="store_true",
+                    help="Don't prove the shortest forced mate and unique first move of checkmate puzzles")
+
+# Profiling
+parser.add_argument("--profile", metavar="PREFIX", type=str, default=None,
+                    help="Profile the scan (use --workers 1) and write PREFIX.folded/.prof and a PREFIX.txt summary")
+parser.add_argument("--profile-mode", type=str, choices=['sampling', 'deterministic'], default='sampling',
+                    help="Sample the stacks (flamegraph file) or trace every call (cProfile)")
+parser.add_argument("--profile-memory", default=False, action="store_true",
+                    help="Record tracemalloc snapshots between games while profiling")
+
 parser.add_argument("--quiet", default=False, action="store_true",
                     help="substantially reduce the number of logged messages")
 parser.add_argument("--out-csv", default='puzzles.csv', type=str,
@@ -41,6 +144,32 @@ if len(sys.argv) < 2:
     sys.exit(0)
 
 settings = parser.parse_args()
+deadline = time.monotonic() + settings.time_budget if settings.time_budget else None
+for input_file in (settings.games_csv, settings.games_archive, settings.fens, settings.reclassify, settings.work,
+                   settings.merge, settings.import_puzzles):
+    if input_file and not os.path.isfile(input_file):
+        parser.error(f'file not found: {input_file}')
+if settings.replay and not os.path.exists(settings.replay):
+    parser.error(f'recording not found: {settings.replay}')
+if settings.to_archive and not settings.games_csv:
+    parser.error('--to-archive requires --games_csv')
+if (settings.serve_puzzles or settings.import_puzzles) and not settings.store:
+    parser.error('--serve-puzzles and --import-puzzles require --store')
+if settings.enqueue and not (settings.games_csv or settings.games_archive):
+    parser.error('--enqueue requires --games_csv or --games_archive')
+if settings.work and (settings.timelines or settings.store):
+    # A shard may be scanned again once its lease expires, only the shard outputs are written exactly once
+    parser.error('--work only writes the shard outputs and can\'t be used with --timelines or --store, '
+                 'import the merged puzzles with --import-puzzles')
+if (settings.fens or settings.moves) and settings.timelines:
+    parser.error('--timelines requires --games_csv or --games_archive')
+if settings.profile and settings.workers != 1:
+    # The workers are other processes, only the parent process would be profiled
+    parser.error('--profile profiles the scanning process and requires --workers 1')
+if settings.verify_engine and settings.remote:
+    # The engine servers run their own --engine, the second engine could be the same engine
+    parser.error('--verify-engine runs local engines and can\'t be used with --remote')
+
 try:
     # Optionally fix colors on Windows and in journals if the colorama module
     # is available.
@@ -51,15 +180,289 @@ try:
 except ImportError:
     pass
 
+from xqpuzzles.colors import Color
+from xqpuzzles.logger import configure_logging, log
+from xqpuzzles.resources import plan_engines
+
 if settings.quiet:
     configure_logging(level=logging.INFO)
 else:
     configure_logging(level=logging.DEBUG)
     # configure_logging(level=ENGINE)
 
+# Convert a games CSV into a binary game archive
+if settings.to_archive:
+    from xqpuzzles.archive import write_archive
+    from xqpuzzles.utils import open_games
+
+    with open_games(settings.games_csv) as games:
+        games_count = write_archive(settings.to_archive, games)
+    log(Color.YELLOW, f"Saved {games_count} games to {settings.to_archive}")
+    exit(0)
+
+# Split the games into shards of a job queue
+if settings.enqueue:
+    from xqpuzzles.jobqueue import JobQueue
+
+    queue = JobQueue(settings.enqueue)
+    shards_count = queue.enqueue(settings.games_csv or settings.games_archive, settings.shard_size,
+                                 settings.shard_attempts)
+    queue.close()
+    log(Color.YELLOW, f"Added {shards_count} shards to {settings.enqueue}")
+    exit(0)
+
+# Combine the shard outputs of a job queue
+if settings.merge:
+    from xqpuzzles.jobqueue import merge
+
+    shards_count = merge(settings.merge, settings.out_csv)
+    log(Color.YELLOW, f"Merged {shards_count} shards into {settings.out_csv}")
+    exit(0)
+
+# Fill or serve the puzzle store
+if settings.import_puzzles:
+    from xqpuzzles.store import PuzzleStore
+
+    store = PuzzleStore(settings.store)
+    puzzles_count = store.import_csv(settings.import_puzzles)
+    store.close()
+    log(Color.YELLOW, f"Added {puzzles_count} puzzles to {settings.store}")
+    exit(0)
+
+if settings.serve_puzzles:
+    from xqpuzzles.store import serve_puzzles
+    serve_puzzles(settings.serve_puzzles, settings.store)
+    exit(0)
+
+from xqpuzzles.criteria import Criteria
+criteria = Criteria(settings.min_swing, settings.max_score, settings.max_mate, settings.max_material_diff,
+                    not settings.no_mate_verification)
+
+workers = 1 if settings.moves or settings.calibrate else settings.workers
+if settings.remote:
+    # The engine servers size their engines, local resources don't limit the number of remote engines
+    from xqpuzzles.resources import EnginePlan
+    plans = [EnginePlan(settings.threads, settings.hash, None)] * (workers or len(settings.remote))
+elif settings.verify_engine:
+    # Every worker runs a scanning and a cross-validation engine on their own cores
+    engine_plans = plan_engines(2 * workers if workers else None, threads=settings.threads, memory=settings.hash,
+                                pin_cpus=settings.pin_cpus)
+    if len(engine_plans) < 2:
+        logging.warning('Not enough CPUs to run the cross-validation engine on its own core')
+        engine_plans = engine_plans * 2
+    plans = engine_plans[0:len(engine_plans) // 2 * 2:2]
+else:
+    plans = plan_engines(workers, threads=settings.threads, memory=settings.hash, pin_cpus=settings.pin_cpus)
+
+validation = None
+if settings.verify_engine:
+    from xqpuzzles.ensemble import Validation
+    validation = Validation(settings.verify_engine, engine_plans[1::2], settings.on_disagreement)
+
+engine_options = {'nodes': settings.nodes, 'remote': settings.remote, 'record': settings.record,
+                  'replay': settings.replay}
+log(Color.DIM, "Engines: %d, threads: %s, hash: %sMB" % (len(plans), plans[0].threads, plans[0].memory))
+
+# Re-apply the puzzle predicates to stored timelines
+if settings.reclassify:
+    from xqpuzzles.timeline import read_timelines, reclassify
+    from xqpuzzles.utils import PuzzleWriter
+
+    store = None
+    if settings.store:
+        from xqpuzzles.store import PuzzleStore
+        store = PuzzleStore(settings.store)
+
+    # Checkmate puzzles are verified like in a scan, without verification no engine is started
+    engine = None
+    if criteria.verify_mates:
+        from xqpuzzles.scanner import start_engine
+        engine = start_engine(settings.engine, plans[0], **engine_options)
+
+    games_count, puzzles_count = 0, 0
+    with PuzzleWriter(settings.out_csv) as writer:
+        for record in read_timelines(settings.reclassify):
+            puzzles = reclassify(record, criteria, engine)
+            writer.write(puzzles, game_id=record['id'])
+            if store:
+                store.add(puzzles, game_id=record['id'])
+            games_count += 1
+            puzzles_count += len(puzzles)
+
+    if engine:
+        engine.quit()
+    if store:
+        store.close()
+    log(Color.YELLOW, f"Found {puzzles_count} valid positions in {games_count} games")
+    exit(0)
+
+if settings.serve_engines:
+    from xqpuzzles.remote import serve_engines
+    serve_engines(settings.serve_engines, settings.engine, plans)
+    exit(0)
+
+if settings.daemon:
+    from xqpuzzles.daemon import serve
+    serve(settings.daemon, settings.engine, plans, criteria, **engine_options)
+    exit(0)
+
+
+def scan_to_csv(games, out_csv, timelines=None, profiler=None, store=None):
+    """
+    Scans the game rows and exports their puzzles (and timelines) as they're found.
+    Returns False if the time budget stopped the scan before all games were scanned
+    """
+    from contextlib import nullcontext
+    from xqpuzzles.criteria import GameBudget
+    from xqpuzzles.scanner import scan_games
+    from xqpuzzles.timeline import write_timeline
+    from xqpuzzles.utils import PuzzleWriter
 
-engine_map = {'pikafish': Pikafish, 'stockfish': Stockfish}
-engine = engine_map[settings.engine]()
+    quarantine = None
+    if settings.quarantine:
+        from xqpuzzles.quarantine import Quarantine
+        quarantine = Quarantine(settings.quarantine)
+        games = quarantine.skip(games)
+
+    if settings.priority:
+        from xqpuzzles.scheduler import prioritize
+        games = prioritize(games, max_rss=settings.max_rss)
+
+    budget = GameBudget(settings.game_timeout, settings.game_nodes, settings.max_plies)
+    with PuzzleWriter(out_csv) as writer, quarantine or nullcontext():
+        for scanned in scan_games(settings.engine, games, plans, skip_initial=5, criteria=criteria,
+                                  cache_size=settings.eval_cache, validation=validation,
+                                  pending_games=settings.pending_games, max_rss=settings.max_rss, budget=budget,
+                                  **engine_options):
+            game, puzzles = scanned.game, scanned.puzzles
+            if scanned.failure:
+                failure = scanned.failure
+                log(Color.RED, f"Game ID {game['id']} failed at ply {failure.ply}: {failure.reason}")
+                if quarantine is not None:
+                    quarantine.add(game['id'], failure)
+            writer.write(puzzles, game_id=game['id'])
+            if store:
+                store.add(puzzles, game_id=game['id'])
+            if timelines and scanned.timeline:
+                write_timeline(timelines, game['id'], scanned.moves, 5, scanned.timeline, scanned.ucci)
+
+            log(Color.YELLOW, f"Found {len(puzzles)} valid positions from game ID {game['id']}")
+            for puzzle in puzzles:
+                log(Color.BOLD, f'First Turn ==> {puzzle["first_turn"]}')
+                url = f'https://xiangqi-dev.arbisoft.com/editor/{puzzle["fen"].split()[0]}'
+                log(Color.UNDERLINE, url)
+
+            if profiler is not None:
+                profiler.game_boundary(game['id'])
+
+            if deadline and time.monotonic() > deadline:
+                log(Color.YELLOW, "Time budget exhausted, stopping the scan")
+                return False
+
+    return True
+
+
+# Lease shards from the job queue until all shards are scanned
+if settings.work:
+    from xqpuzzles.jobqueue import work
+    work(settings.work, settings.shards_dir or settings.work + '.shards', scan_to_csv, lease=settings.lease)
+    exit(0)
+
+def first_rows(rows):
+    """
+    Returns the rows with their first row read ahead, or None if there are no rows: an empty
+    input is done before the engine and board modules are imported
+    """
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
+        log(Color.YELLOW, "Nothing to scan, the input is empty")
+        return None
+    return itertools.chain([first_row], rows)
+
+
+if settings.games_csv or settings.games_archive:
+    from contextlib import closing, nullcontext
+    from xqpuzzles.utils import open_games
+
+    with open_games(settings.games_csv or settings.games_archive) as games:
+        games = first_rows(games)
+        if games is None:
+            # The puzzles file is still written with its header
+            from xqpuzzles.utils import PuzzleWriter
+            PuzzleWriter(settings.out_csv).close()
+            exit(0)
+
+        from xqpuzzles.timeline import open_timelines
+        timelines = open_timelines(settings.timelines) if settings.timelines else nullcontext()
+        profiler = nullcontext()
+        if settings.profile:
+            from xqpuzzles.profiling import Profiler
+            profiler = Profiler(settings.profile, settings.profile_mode, trace_memory=settings.profile_memory)
+        store = nullcontext()
+        if settings.store:
+            from xqpuzzles.store import PuzzleStore
+            store = closing(PuzzleStore(settings.store))
+        with timelines, profiler as active_profiler, store as active_store:
+            scan_to_csv(games, settings.out_csv, timelines if settings.timelines else None, active_profiler,
+                        active_store)
+
+    exit(0)
+
+# Evaluate a list of positions
+if settings.fens:
+    from contextlib import closing, nullcontext
+    from xqpuzzles.criteria import GameBudget
+    from xqpuzzles.fileio import open_file
+    from xqpuzzles.utils import PuzzleWriter, read_positions
+
+    positions_count, puzzles_count, failed_count = 0, 0, 0
+    budget = GameBudget(settings.game_timeout, None, None)
+    store = nullcontext()
+    if settings.store:
+        from xqpuzzles.store import PuzzleStore
+        store = closing(PuzzleStore(settings.store))
+    with open_file(settings.fens) as file, PuzzleWriter(settings.out_csv) as writer, store as active_store:
+        positions = first_rows(read_positions(file))
+        if positions is None:
+            exit(0)
+
+        from xqpuzzles.scanner import scan_positions
+        for scanned in scan_positions(settings.engine, positions, plans, criteria=criteria,
+                                      cache_size=settings.eval_cache, validation=validation,
+                                      pending_games=settings.pending_games, max_rss=settings.max_rss,
+                                      budget=budget, **engine_options):
+            positions_count += 1
+            if scanned.failure:
+                log(Color.RED, f"Position {scanned.id} failed ({scanned.failure.reason}): {scanned.failure.message}")
+                failed_count += 1
+            elif scanned.puzzle:
+                writer.write([scanned.puzzle], game_id=scanned.id)
+                if active_store:
+                    active_store.add([scanned.puzzle], game_id=scanned.id)
+                puzzles_count += 1
+            if deadline and time.monotonic() > deadline:
+                log(Color.YELLOW, "Time budget exhausted, stopping the scan")
+                break
+
+    log(Color.YELLOW, f"Found {puzzles_count} valid positions in {positions_count} positions, "
+                      f"{failed_count} positions failed")
+    exit(0)
+
+from xqpuzzles.calibrate import calibrate
+from xqpuzzles.puzzle_finder import find_puzzle_candidates
+from xqpuzzles.scanner import start_engine, start_validator
+from xqpuzzles.utils import export_puzzles_to_csv
+
+engine = start_engine(settings.engine, plans[0], **engine_options)
+
+# Measure the engine speed and suggest a node budget equivalent to the movetime
+if settings.calibrate:
+    nps, nodes = calibrate(engine)
+    log(Color.YELLOW, "Engine speed: %d nps" % nps)
+    log(Color.YELLOW, "Suggested node budget: --nodes %d (or DEFAULT_NODES in xqpuzzles/local.py)" % nodes)
+    engine.quit()
+    exit(0)
 
 # Try to generate puzzle positions from given UCI moves
 if settings.moves:
@@ -68,11 +471,19 @@ if settings.moves:
         log(Color.DIM, engine.name)
         log(Color.DARK_BLUE, str(game_moves))
 
-        puzzles = find_puzzle_candidates(engine, game_moves)
+        validator = start_validator(validation, 0, **engine_options)
+        puzzles = find_puzzle_candidates(engine, game_moves, criteria=criteria, validator=validator)
+        if validator is not None:
+            validator.quit()
 
         log(Color.YELLOW, "# Found valid puzzle positions: %d" % len(puzzles))
 
         export_puzzles_to_csv(settings.out_csv, puzzles)
+        if settings.store:
+            from xqpuzzles.store import PuzzleStore
+            store = PuzzleStore(settings.store)
+            store.add(puzzles)
+            store.close()
 
         for puzzle in puzzles:
             url = f'https://xiangqi-dev.arbisoft.com/editor/{puzzle["fen"].split()[0]}'
@@ -85,25 +496,3 @@ if settings.moves:
         engine.quit()
         exit(0)
 
-log(Color.DIM, engine.name)
-
-with open(settings.games_csv, 'r') as file:
-    reader = csv.DictReader(file)
-    for game in reader:
-        try:
-            game_moves = ast.literal_eval(game['moves'])
-            log(Color.DARK_BLUE, str(game_moves))
-            puzzles = find_puzzle_candidates(engine, game_moves, skip_initial=5)
-            export_puzzles_to_csv(settings.out_csv, puzzles, game_id=game['id'])
-
-            log(Color.YELLOW, f"Found {len(puzzles)} valid positions from game ID {game['id']}")
-            for puzzle in puzzles:
-                log(Color.BOLD, f'First Turn ==> {puzzle["first_turn"]}')
-                url = f'https://xiangqi-dev.arbisoft.com/editor/{puzzle["fen"].split()[0]}'
-                log(Color.UNDERLINE, url)
-
-        except Exception as exp:
-            logging.info(f'Got exception in game: {game["id"]}')
-            logging.exception(exp)
-
-engine.quit()
@@ -0,0 +1,39 @@
+import ast
+
+import pytest
+
+from xqpuzzles.archive import GameArchive, decode_move, encode_move, write_archive
+from xqpuzzles.synthetic import synthetic_games
+
+
+def test_move_codes():
+    for move in ('a1a10', 'i10i1', 'h3e3', 'e10e9'):
+        assert decode_move(encode_move(move)) == move
+
+
+def test_archive_round_trip(tmp_path):
+    games = list(synthetic_games(5, max_plies=30))
+    # Columns missing from some games and string moves
+    games[1] = dict(games[1], extra='x', moves=str(games[1]['moves']))
+    path = str(tmp_path / 'games.xqg')
+    assert write_archive(path, games) == 5
+
+    with GameArchive(path) as archive:
+        assert len(archive) == 5
+        for game, archived in zip(games, archive):
+            moves = game['moves']
+            assert archived['moves'] == (ast.literal_eval(moves) if isinstance(moves, str) else moves)
+            assert archived['id'] == game['id']
+            assert archived['moves_count'] == str(game['moves_count'])
+        assert archive[1]['extra'] == 'x'
+        assert archive[0]['extra'] == ''
+        assert archive[-1]['id'] == games[-1]['id']
+        with pytest.raises(IndexError):
+            archive[5]
+
+
+def test_empty_archive(tmp_path):
+    path = str(tmp_path / 'empty.xqg')
+    assert write_archive(path, []) == 0
+    with GameArchive(path) as archive:
+        assert list(archive) == []
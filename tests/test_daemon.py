@@ -0,0 +1,50 @@
+import pytest
+
+from xqpuzzles import daemon
+from xqpuzzles.criteria import Criteria
+from xqpuzzles.resources import EnginePlan
+from xqpuzzles.synthetic import StandInEngine
+
+PLAN = EnginePlan(1, 16, None)
+
+
+class DyingEngine(StandInEngine):
+
+    def search(self, board, multipv=1, **limits):
+        raise EOFError()
+
+
+def test_failed_restart_drops_the_dead_engine(monkeypatch):
+    pool = daemon.EnginePool('standin', [PLAN])
+    monkeypatch.setattr(pool.idle.queue[0][1], 'search', DyingEngine().search)
+    monkeypatch.setattr(daemon, 'start_engine', _failing_start)
+    with pytest.raises(EOFError):
+        pool.scan(['h3e3'], 0)
+    assert list(pool.idle.queue) == [(PLAN, None)]
+
+    # The next job starts the engine again
+    monkeypatch.undo()
+    assert pool.scan(['h3e3', 'h8e8'], 0) == []
+    assert pool.idle.queue[0][1] is not None
+
+
+def test_scan_uses_the_criteria(monkeypatch):
+    criteria = Criteria(min_swing=500, verify_mates=False)
+    pool = daemon.EnginePool('standin', [PLAN], criteria)
+    scanned = []
+    monkeypatch.setattr(daemon, 'find_puzzle_candidates', lambda *args, **kwargs: scanned.append(kwargs) or [])
+    assert pool.scan(['h3e3'], 0) == []
+    assert scanned[0]['criteria'] == criteria
+    pool.quit()
+
+
+def test_serve_keeps_regular_files(tmp_path):
+    path = tmp_path / 'not-a-socket'
+    path.write_text('data')
+    with pytest.raises(FileExistsError):
+        daemon.serve(str(path), 'standin', [PLAN])
+    assert path.read_text() == 'data'
+
+
+def _failing_start(engine_name, plan, **options):
+    raise OSError('no engine')
@@ -0,0 +1,54 @@
+from chess.engine import Cp, Mate
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.ensemble import AGREE, DISAGREE, CrossValidator
+from xqpuzzles.xqboard import XiangqiBoard
+
+
+class ScriptedEngine(object):
+    name = 'scripted'
+    search_limits = {}
+
+    def __init__(self, lines):
+        self.lines = [AnalyzedMove(move, None, score, [move]) for move, score in lines]
+
+    def is_ucci(self):
+        return False
+
+    def search(self, board, multipv=1, **limits):
+        return self.lines[:multipv]
+
+    def quit(self):
+        pass
+
+
+def _check(lines, move='h3e3', score=Cp(500)):
+    validator = CrossValidator(ScriptedEngine(lines))
+    try:
+        puzzle = {'pv': [move, 'h8e8'], 'score': score}
+        return validator.submit(XiangqiBoard(), puzzle).result()['cross_check']
+    finally:
+        validator.quit()
+
+
+def test_same_winning_move_agrees():
+    assert _check([('h3e3', Cp(450)), ('b3e3', Cp(100))]) == AGREE
+
+
+def test_other_best_move_disagrees():
+    # Both engines find a win, but with different solutions
+    assert _check([('b3e3', Cp(900)), ('h3e3', Cp(450))]) == DISAGREE
+    assert _check([('b3e3', Cp(900)), ('c4c5', Cp(850))]) == DISAGREE
+
+
+def test_puzzle_move_within_the_margin_agrees():
+    assert _check([('b3e3', Cp(500)), ('h3e3', Cp(450))]) == AGREE
+
+
+def test_mates():
+    assert _check([('h3e3', Mate(3))], score=Mate(3)) == AGREE
+    assert _check([('b3e3', Mate(2)), ('h3e3', Cp(800))]) == DISAGREE
+
+
+def test_losing_puzzle_move_disagrees():
+    assert _check([('h3e3', Cp(-50))]) == DISAGREE
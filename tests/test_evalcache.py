@@ -0,0 +1,72 @@
+from chess.engine import Cp, Mate
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.evalcache import MAX_PV, SharedEvalCache
+from xqpuzzles.puzzle_finder import Criteria, find_puzzle_candidates
+from xqpuzzles.synthetic import StandInEngine, synthetic_games
+from xqpuzzles.xqboard import XiangqiBoard
+
+CRITERIA = Criteria(verify_mates=False)
+
+
+def _cache():
+    cache = SharedEvalCache(1)
+    return cache
+
+
+def test_round_trip_and_pv_truncation():
+    cache = _cache()
+    try:
+        board = XiangqiBoard()
+        assert cache.get(board) is None
+
+        pv = ['h3e3', 'h8e8'] * 10
+        cache.put(board, AnalyzedMove('h3e3', None, Cp(35), pv, 12, 5000))
+        analysis = cache.get(board)
+        assert (analysis.move, analysis.score, analysis.depth, analysis.nodes) == ('h3e3', Cp(35), 12, 5000)
+        assert analysis.pv == pv[:MAX_PV]
+
+        board.push(['h3e3'])
+        cache.put(board, AnalyzedMove('h8e8', None, Mate(-3), ['h8e8'], 7, 10))
+        assert cache.get(board).score == Mate(-3)
+        assert cache.stats()[:3] == (3, 2, 2)
+    finally:
+        cache.close(unlink=True)
+
+
+class LongPvEngine(StandInEngine):
+    """ Extends the stand-in PVs past the PV length of the cache """
+
+    def search(self, board, multipv=1, **limits):
+        return [analysis._replace(pv=_extend(board, analysis.pv)) if analysis.pv else analysis
+                for analysis in super().search(board, multipv, **limits)]
+
+
+def _extend(board, pv):
+    board = board.copy()
+    board.push(pv)
+    pv = list(pv)
+    while len(pv) <= MAX_PV:
+        legal_moves = sorted(board.legal_moves())
+        if not legal_moves:
+            break
+        pv.append(legal_moves[0])
+        board.push(legal_moves[:1])
+    return pv
+
+
+def test_cached_puzzles_keep_the_full_pv():
+    engine = LongPvEngine()
+    games = list(synthetic_games(3))
+    uncached = [find_puzzle_candidates(engine, game['moves'], criteria=CRITERIA) for game in games]
+    assert any(uncached)
+
+    cache = _cache()
+    try:
+        for _ in range(2):
+            cached = [find_puzzle_candidates(engine, game['moves'], criteria=CRITERIA, cache=cache) for game in games]
+            assert [[p['pv'] for p in puzzles] for puzzles in cached] == \
+                [[p['pv'] for p in puzzles] for puzzles in uncached]
+        assert cache.stats()[1]
+    finally:
+        cache.close(unlink=True)
@@ -0,0 +1,49 @@
+from chess.engine import Cp
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.exchange import capture_exchange, pv_captures, pv_exchange
+from xqpuzzles.features import HORSE
+from xqpuzzles.puzzle_finder import make_puzzle
+from xqpuzzles.xqboard import XiangqiBoard
+
+# The rook takes the horse on d9, the black rook on e9 is pinned to its king by the rook on e5
+PINNED = '4k4/3nr4/9/9/9/4R4/9/9/9/3R1K3 w - - 0 1'
+# The rook takes the horse on d6, defended by the black rook on d10
+DEFENDED = '3rk4/9/9/9/3n5/9/9/9/9/3R1K3 w - - 0 1'
+
+
+def _analysis(pv, cp=450):
+    return AnalyzedMove(pv[0], None, Cp(cp), pv)
+
+
+def test_static_exchange():
+    board = XiangqiBoard(DEFENDED)
+    assert capture_exchange(board, 'd1d6') == (-5.0, 2, ((0, 3), (4, 3)))
+    assert capture_exchange(board, 'd1d2') is None
+    assert capture_exchange(XiangqiBoard('4k4/9/9/9/3n5/9/9/9/9/3R1K3 w - - 0 1'), 'd1d6') == (4.0, 1, None)
+
+
+def test_recapture_of_the_pv_confirms_the_exchange():
+    board = XiangqiBoard(DEFENDED)
+    assert pv_exchange(board, ['d1d6', 'd10d6']).gain == -5.0
+    assert make_puzzle(board, _analysis(['d1d6', 'd10d6'])) is None
+
+
+def test_pinned_defender_keeps_the_puzzle():
+    board = XiangqiBoard(PINNED)
+    assert capture_exchange(board, 'd1d9').gain == -5.0
+    # The engine doesn't recapture with the pinned rook, the captures of its PV count
+    assert pv_exchange(board, ['d1d9', 'e10f10', 'd9d10']).gain == 4.0
+    puzzle = make_puzzle(board, _analysis(['d1d9', 'e10f10', 'd9d10']))
+    assert puzzle['theme'] == 'CAPTURING'
+    assert puzzle['moves_count'] == 1
+
+
+def test_quiet_solution_theme():
+    # The rook lines up on the horse without taking anything in the solution
+    board = XiangqiBoard('4k4/9/9/9/3n5/9/9/9/9/R4K3 w - - 0 1')
+    puzzle = make_puzzle(board, _analysis(['a1a6', 'd6e4', 'a6a7']))
+    assert puzzle['theme'] == 'MIDGAME'
+    assert pv_captures(board, ['a1a6', 'e10e9', 'a6d6']) == [0, 0, -HORSE]
+    puzzle = make_puzzle(board, _analysis(['a1a6', 'e10e9', 'a6d6']))
+    assert puzzle['theme'] == 'CAPTURING'
@@ -0,0 +1,35 @@
+import numpy as np
+
+from xqpuzzles.features import encode_boards, encode_fens, major_piece_diff, material_balance
+from xqpuzzles.synthetic import synthetic_games
+from xqpuzzles.xqboard import XiangqiBoard, game_boards
+
+
+def get_material_diff(board):
+    # The per-board count major_piece_diff replaced
+    red = 0
+    black = 0
+    for piece in board.fen.split(' ')[0]:
+        if piece in ('r', 'c', 'n', 'h'):
+            black += 1
+        elif piece in ('R', 'C', 'N', 'H'):
+            red += 1
+
+    return abs(red - black)
+
+
+def test_major_piece_diff_matches_the_fen_count():
+    game = next(synthetic_games(1, seed=3, min_plies=60, max_plies=60))
+    boards = game_boards(XiangqiBoard(), game['moves'])
+    diffs = major_piece_diff(encode_boards(boards))
+    assert diffs.tolist() == [get_material_diff(board) for board in boards]
+    # Captures happened, the counts aren't all zero
+    assert diffs.any()
+
+
+def test_material_balance():
+    start, = material_balance(encode_boards([XiangqiBoard()]))
+    assert start == 0
+    # Black lost a rook and a pawn, taken by a red pawn now across the river and worth twice as much
+    balance, = material_balance(encode_fens(['1nbakabnr/9/1c5c1/p1P1p1p1p/9/9/P3P1P1P/1C5C1/9/RNBAKABNR w']))
+    assert np.isclose(balance, 9 + 1 + 1)
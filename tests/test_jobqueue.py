@@ -0,0 +1,109 @@
+import csv
+import time
+
+import pytest
+
+from xqpuzzles.archive import write_archive
+from xqpuzzles.fileio import open_file
+from xqpuzzles.jobqueue import DONE, FAILED, PENDING, JobQueue, open_shard, work
+from xqpuzzles.synthetic import synthetic_games
+
+GAMES = list(synthetic_games(23, max_plies=30))
+FIELDS = ['id', 'rplayer', 'bplayer', 'moves_count', 'end_reason', 'rrating', 'brating', 'moves']
+
+
+def _games_csv(path, count):
+    with open_file(str(path), 'w') as f:
+        writer = csv.DictWriter(f, FIELDS)
+        writer.writeheader()
+        for game in GAMES[:count]:
+            # Multi-line values must not shift the shard offsets
+            writer.writerow(dict(game, rplayer='red\nplayer'))
+    return str(path)
+
+
+def _shard_ids(queue_path):
+    queue = JobQueue(queue_path)
+    try:
+        return [[game['id'] for game in games] for games in _read_shards(queue)]
+    finally:
+        queue.close()
+
+
+def _read_shards(queue):
+    for source, start, stop, offset in queue.db.execute('SELECT source, start, stop, byte_offset FROM shards'):
+        with open_shard(source, start, stop, offset) as games:
+            yield list(games)
+
+
+@pytest.mark.parametrize('name', ['games.csv', 'games.csv.gz', 'games.xqg'])
+def test_shards_read_their_own_games(tmp_path, name):
+    source = _games_csv(tmp_path / 'games.csv', 23)
+    if name.endswith('.xqg'):
+        with open_file(source) as f:
+            write_archive(str(tmp_path / name), csv.DictReader(f))
+        source = str(tmp_path / name)
+    elif name != 'games.csv':
+        source = _games_csv(tmp_path / name, 23)
+
+    queue = JobQueue(str(tmp_path / 'q.db'))
+    assert queue.enqueue(source, 10) == 3
+    queue.close()
+
+    shards = _shard_ids(str(tmp_path / 'q.db'))
+    assert [len(ids) for ids in shards] == [10, 10, 3]
+    assert sum(shards, []) == ['synthetic-0-%d' % i for i in range(23)]
+
+
+def test_failing_shard_is_retried_later_then_failed(tmp_path):
+    queue = JobQueue(str(tmp_path / 'q.db'))
+    queue.enqueue(_games_csv(tmp_path / 'games.csv', 5), 5, max_attempts=2)
+
+    shard = queue.lease_shard('w1')
+    queue.release(shard[0], 'w1', retry_delay=0.2)
+    assert queue.progress()[PENDING] == 1
+    # The retry waits for its delay
+    assert queue.lease_shard('w1') is None
+    time.sleep(0.3)
+    shard = queue.lease_shard('w1')
+    queue.release(shard[0], 'w1', retry_delay=0)
+    assert queue.progress()[FAILED] == 1
+    assert queue.lease_shard('w1') is None
+    queue.close()
+
+
+def test_expired_lease_does_not_overwrite_the_new_owner(tmp_path):
+    queue_path, shards_dir = str(tmp_path / 'q.db'), str(tmp_path / 'shards')
+    queue = JobQueue(queue_path)
+    queue.enqueue(_games_csv(tmp_path / 'games.csv', 3), 3)
+    other_output = str(tmp_path / 'other.csv')
+
+    def stalled_scan(games, out_csv):
+        # Another worker took the shard over and finished it while this one was stalled
+        queue.db.execute('UPDATE shards SET status = ?, worker = ?, output = ?', (DONE, 'other', other_output))
+        with open_file(out_csv, 'w') as f:
+            f.write('game_id\nstale\n')
+
+    work(queue_path, shards_dir, stalled_scan)
+    assert queue.outputs() == [other_output]
+    assert not any(path.name.endswith('.csv') for path in (tmp_path / 'shards').iterdir())
+    queue.close()
+
+
+def test_stopped_scan_gives_the_shard_back(tmp_path):
+    queue_path, shards_dir = str(tmp_path / 'q.db'), str(tmp_path / 'shards')
+    queue = JobQueue(queue_path)
+    queue.enqueue(_games_csv(tmp_path / 'games.csv', 6), 3)
+    scanned = []
+
+    def stopped_scan(games, out_csv):
+        scanned.append(next(games)['id'])
+        return False
+
+    work(queue_path, shards_dir, stopped_scan)
+    # The worker stopped after the first game and no game of the shard is lost
+    assert scanned == ['synthetic-0-0']
+    assert queue.progress()[PENDING] == 2
+    assert queue.db.execute('SELECT attempts FROM shards WHERE id = 1').fetchone() == (0,)
+    assert queue.lease_shard('w2')[0] == 1
+    queue.close()
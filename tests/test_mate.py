@@ -0,0 +1,43 @@
+from chess.engine import Cp, Mate
+
+from xqpuzzles import mate as mate_module
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.constants import MATE_REFUTE_NODES
+from xqpuzzles.puzzle_finder import Criteria, verify_mate_puzzle
+from xqpuzzles.xqboard import XiangqiBoard
+
+
+class MateEngine(object):
+    """ Finds a unique mate in `mate` for red and records its searches """
+
+    nodes = None
+
+    def __init__(self, mate):
+        self.mate = mate
+        self.searches = []
+
+    def search(self, board, multipv=1, new_game=True, **limits):
+        self.searches.append((new_game, limits))
+        if limits.get('mate', self.mate) < self.mate:
+            return [AnalyzedMove('h3e3', None, Cp(900), ['h3e3'], 20, limits.get('nodes'))]
+        trace = [(10, 'h3e3', Cp(500), 100), (20, 'h3e3', Mate(self.mate), 200)]
+        return [AnalyzedMove('h3e3', None, Mate(self.mate), ['h3e3', 'h8e8'], 20, 200, None, trace),
+                AnalyzedMove('b3e3', None, Mate(self.mate + 2), ['b3e3'], 20, 200)]
+
+
+def test_proof_starts_from_the_scan_mate_and_bounds_the_refutation():
+    mate_module._proofs.clear()
+    engine = MateEngine(3)
+    puzzle = {'theme': 'CHECKMATE', 'score': Mate(4), 'pv': ['h3e3'], 'moves_count': 4, 'difficulty': None}
+
+    verified = verify_mate_puzzle(engine, XiangqiBoard(), puzzle, Criteria())
+    assert (verified['moves_count'], verified['score'], verified['pv']) == (3, Mate(3), ['h3e3', 'h8e8'])
+    assert verified['difficulty'] is not None
+    assert [limits.get('mate') for _, limits in engine.searches] == [4, 2]
+    assert engine.searches[1][1]['nodes'] == MATE_REFUTE_NODES
+    # The hash is only cleared once
+    assert [new_game for new_game, _ in engine.searches] == [True, False]
+
+    # The proof is cached
+    assert verify_mate_puzzle(engine, XiangqiBoard(), puzzle, Criteria())['moves_count'] == 3
+    assert len(engine.searches) == 2
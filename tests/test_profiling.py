@@ -0,0 +1,23 @@
+import io
+
+from xqpuzzles import cmd
+from xqpuzzles.profiling import Profiler
+
+
+class FakeProcess(object):
+    pid = 0
+
+    def __init__(self, output):
+        self.stdout = io.StringIO(output)
+
+
+def test_engine_wait_is_only_timed_while_profiling(tmp_path):
+    assert cmd.RECV_STATS is None
+    assert cmd.recv(FakeProcess('readyok\n')) == 'readyok'
+    assert cmd.RECV_STATS is None
+
+    with Profiler(str(tmp_path / 'profile')):
+        assert cmd.recv(FakeProcess('\nreadyok\n')) == 'readyok'
+        assert cmd.RECV_STATS['calls'] == 2
+    assert cmd.RECV_STATS is None
+    assert 'over 2 lines' in (tmp_path / 'profile.txt').read_text()
@@ -0,0 +1,24 @@
+from chess.engine import Cp
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.puzzle_finder import is_winning_capture
+from xqpuzzles.xqboard import XiangqiBoard
+
+
+def _analysis(move, cp, *replies):
+    return AnalyzedMove(move, None, Cp(cp), [move, *replies])
+
+
+def test_winning_capture_is_measured_by_the_exchange():
+    # The rook takes a free horse
+    board = XiangqiBoard('4k4/9/9/9/3n5/9/9/9/9/3R1K3 w - - 0 1')
+    assert is_winning_capture(board, _analysis('d1d6', 450))
+    assert not is_winning_capture(board, _analysis('d1d6', 450), min_swing=500)
+    # Red is already far ahead, the capture of a pawn isn't a puzzle
+    board = XiangqiBoard('4k4/9/9/9/3p5/9/9/9/9/RR1R1K3 w - - 0 1')
+    assert not is_winning_capture(board, _analysis('d1d6', 1500))
+
+
+def test_defended_piece_is_not_a_winning_capture():
+    board = XiangqiBoard('3rk4/9/9/9/3n5/9/9/9/9/3R1K3 w - - 0 1')
+    assert not is_winning_capture(board, _analysis('d1d6', 450, 'd10d6'))
@@ -0,0 +1,18 @@
+from xqpuzzles.puzzle_finder import TIME
+from xqpuzzles.quarantine import Quarantine
+from xqpuzzles.scanner import ENGINE_FAILED, HUNG, INVALID_MOVE, GameFailure
+
+
+def test_only_repeating_failures_are_quarantined(tmp_path):
+    path = str(tmp_path / 'quarantine.jsonl')
+    with Quarantine(path) as quarantine:
+        assert quarantine.add('1', GameFailure(7, INVALID_MOVE, 'Invalid move'))
+        assert quarantine.add('2', GameFailure(40, TIME, 'time budget exceeded at ply 40'))
+        assert not quarantine.add('3', GameFailure(12, ENGINE_FAILED, 'EOFError'))
+        assert not quarantine.add('4', GameFailure(12, HUNG, 'engine killed'))
+        assert '1' in quarantine and '3' not in quarantine
+
+    # Later scans skip the quarantined games
+    with Quarantine(path) as quarantine:
+        games = [{'id': str(game_id)} for game_id in range(1, 6)]
+        assert [game['id'] for game in quarantine.skip(games)] == ['3', '4', '5']
@@ -0,0 +1,134 @@
+import itertools
+import socketserver
+import threading
+
+import pytest
+
+from xqpuzzles.cmd import RECORDERS
+from xqpuzzles.remote import Connection, ConnectionPool, RemoteEngine, client_option
+
+
+class UciHandler(socketserver.StreamRequestHandler):
+    """ Answers uci and isready, except on the connections the server was told to drop """
+
+    def handle(self):
+        if next(self.server.connections) in self.server.dropped:
+            return
+        for line in self.rfile:
+            if line.strip() == b'uci':
+                self.wfile.write(b'id name test\nuciok\n')
+            elif line.strip() == b'isready':
+                self.wfile.write(b'readyok\n')
+            self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), UciHandler)
+    server.daemon_threads = True
+    server.connections = itertools.count()
+    server.dropped = {0}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stale_idle_connection_is_replaced(server):
+    pool = ConnectionPool()
+    address = server.server_address
+    stale = Connection(address)
+    pool.release(stale)
+
+    connection = pool.connect([address])
+    assert connection is not stale
+    assert connection.check()
+    assert not pool.idle[address]
+    connection.close()
+
+
+class FlakyEngine(RemoteEngine):
+    """ A remote engine without server whose reconnections fail as told """
+
+    def __init__(self, reconnections):
+        self.reconnections = iter(reconnections)
+        self.engine = Connection.__new__(Connection)
+        self.engine.pid = 'test'
+
+    def reconnect(self):
+        if not next(self.reconnections):
+            raise ConnectionRefusedError()
+
+
+def test_failed_reconnection_is_retried():
+    engine = FlakyEngine([False, True])
+    results = iter([EOFError(), 'best move'])
+
+    def search():
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert engine._retry(search) == 'best move'
+
+
+def test_retries_are_bounded():
+    engine = FlakyEngine(itertools.repeat(True))
+
+    def search():
+        raise EOFError()
+
+    with pytest.raises(EOFError):
+        engine._retry(search)
+
+
+def test_aborted_search_is_not_retried():
+    engine = FlakyEngine(itertools.repeat(True))
+    engine.aborted = True
+
+    def search():
+        raise EOFError()
+
+    with pytest.raises(EOFError):
+        engine._retry(search)
+    # No reconnection was made
+    assert next(engine.reconnections)
+
+
+class ListRecorder(object):
+    def __init__(self):
+        self.lines = []
+
+    def sent(self, line):
+        self.lines.append(line)
+
+    received = sent
+
+
+def test_reconnection_keeps_recording(server):
+    server.dropped = set()
+    engine = RemoteEngine.__new__(RemoteEngine)
+    engine.addresses = [server.server_address]
+    engine.engine = lost = Connection(server.server_address)
+    recorder = ListRecorder()
+    RECORDERS[lost] = recorder
+    try:
+        engine.reconnect()
+        assert engine.engine is not lost
+        assert lost not in RECORDERS
+        assert RECORDERS[engine.engine] is recorder
+        assert recorder.lines == ['uci', 'id name test', 'uciok', 'isready', 'readyok']
+    finally:
+        RECORDERS.pop(engine.engine, None)
+        engine.engine.close()
+
+
+def test_clients_only_set_allowed_options():
+    assert client_option('setoption name MultiPV value 3')
+    assert client_option('setoption name UCI_Variant value xiangqi')
+    assert not client_option('setoption name Threads value 64')
+    assert not client_option('setoption name Debug Log File value /etc/passwd')
+    assert not client_option('setoption name VariantPath value /tmp/variants.ini')
+    assert not client_option('setoption')
@@ -0,0 +1,56 @@
+import os
+
+from xqpuzzles.replay import SESSION_EXTENSION, ReplayPipe, SessionRecorder, load_recordings
+
+BESTMOVE = 'bestmove h2e2'
+
+
+def _record(path, searches):
+    recorder = SessionRecorder(str(path), 'pikafish', 'Pikafish test')
+    for index in range(searches):
+        recorder.sent('setoption name MultiPV value 3')
+        recorder.sent('position fen %d' % index)
+        recorder.sent('go nodes 1000')
+        recorder.received('info depth 1 multipv 1 score cp 10 pv h2e2')
+        recorder.received('info depth 1 multipv 1 score cp 20 pv h2e2 h9g7')
+        recorder.received('info depth 1 multipv 2 score cp 5 pv b2e2')
+        recorder.received(BESTMOVE)
+    recorder.close()
+
+
+def test_recording_round_trip(tmp_path):
+    path = tmp_path / ('pikafish-1-0' + SESSION_EXTENSION)
+    _record(path, 3)
+    searches, names = load_recordings(str(tmp_path))
+    assert names == {'pikafish': 'Pikafish test'}
+    lines = searches['pikafish'][('3', 'position fen 1', 'go nodes 1000')]
+    assert lines == ['info depth 1 multipv 1 score cp 20 pv h2e2 h9g7', 'info depth 1 multipv 2 score cp 5 pv b2e2',
+                     BESTMOVE]
+
+    pipe = ReplayPipe(searches['pikafish'], names['pikafish'])
+    pipe.write('setoption name MultiPV value 3\nposition fen 2\ngo nodes 1000\n')
+    assert [pipe.readline() for _ in range(3)][-1] == BESTMOVE + '\n'
+
+
+def test_searches_ignore_the_move_counters(tmp_path):
+    path = tmp_path / ('pikafish-1-0' + SESSION_EXTENSION)
+    recorder = SessionRecorder(str(path), 'pikafish', 'Pikafish test')
+    recorder.sent('position fen 4k4/9/9/9/9/9/9/9/9/4K4 w - - 0 1')
+    recorder.sent('go nodes 1000')
+    recorder.received(BESTMOVE)
+    recorder.close()
+
+    searches, names = load_recordings(str(path))
+    pipe = ReplayPipe(searches['pikafish'], names['pikafish'])
+    # Another worker found the position in the shared evaluation cache after other moves
+    pipe.write('position fen 4k4/9/9/9/9/9/9/9/9/4K4 w - - 6 40\ngo nodes 1000\n')
+    assert pipe.readline() == BESTMOVE + '\n'
+
+
+def test_truncated_recording(tmp_path):
+    path = tmp_path / ('pikafish-1-0' + SESSION_EXTENSION)
+    _record(path, 300)
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) * 2 // 3)
+    searches, _ = load_recordings(str(path))
+    assert 0 < len(searches['pikafish']) < 300
@@ -0,0 +1,60 @@
+import multiprocessing
+
+from xqpuzzles import scanner
+from xqpuzzles.analysis import ENGINES
+from xqpuzzles.criteria import GameBudget
+from xqpuzzles.puzzle_finder import NODES
+from xqpuzzles.resources import EnginePlan
+from xqpuzzles.synthetic import StandInEngine, synthetic_games
+from xqpuzzles.xqboard import XIANGQI_START_FEN
+
+PLAN = EnginePlan(1, 16, None)
+
+
+class DyingEngine(StandInEngine):
+
+    def search(self, board, multipv=1, **limits):
+        raise EOFError()
+
+
+def test_lost_engine_is_restarted_for_the_next_positions(monkeypatch):
+    engines = iter([DyingEngine(), StandInEngine()])
+    monkeypatch.setattr(scanner, 'start_engine', lambda *args, **options: next(engines))
+    positions = [(str(index), XIANGQI_START_FEN) for index in range(3)]
+
+    scanned = list(scanner.scan_positions('standin', positions, [PLAN], cache_size=0))
+    assert [position.id for position in scanned] == ['0', '1', '2']
+    assert scanned[0].failure.reason == scanner.ENGINE_FAILED
+    assert [position.failure for position in scanned[1:]] == [None, None]
+
+
+def test_standin_engine_starts_in_spawned_workers():
+    assert 'standin' not in ENGINES
+    # A spawned worker only imports the scanner, the stand-in engine is not a real engine
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        engine = pool.apply(scanner.start_engine, ('standin', PLAN), {'latency': 0.5})
+    assert isinstance(engine, StandInEngine) and engine.latency == 0.5
+
+
+def test_invalid_fen_fails_the_position():
+    scanned = scanner.scan_position(StandInEngine(), '1', 'not a fen')
+    assert scanned.puzzle is None
+    assert scanned.failure.reason == scanner.ERROR
+
+
+def test_invalid_move_game_is_scanned_up_to_the_move():
+    game = next(synthetic_games(1, min_plies=20, max_plies=20))
+    moves = game['moves'][:12] + ['a1a9']
+    scanned = scanner.scan_game(StandInEngine(), dict(game, moves=moves), skip_initial=5)
+    assert scanned.failure.reason == scanner.INVALID_MOVE
+    assert scanned.failure.ply == 13
+    # The position after the skipped moves and the 7 positions up to the invalid move
+    assert len(scanned.timeline) == 8
+
+
+def test_game_over_budget_keeps_its_timeline():
+    game = next(synthetic_games(1, min_plies=20, max_plies=20))
+    scanned = scanner.scan_game(StandInEngine(), game, skip_initial=5, budget=GameBudget(None, 3, None))
+    assert scanned.failure == (9, NODES, 'nodes budget exceeded at ply 9')
+    # The position after the skipped moves and the 4 positions searched up to the budget
+    assert len(scanned.timeline) == 5
@@ -0,0 +1,28 @@
+import pytest
+
+from xqpuzzles import scheduler
+from xqpuzzles.scheduler import game_priority, prioritize
+
+
+def _game(game_id, moves, end_reason='resign'):
+    return {'id': game_id, 'moves': moves, 'end_reason': end_reason, 'rrating': '', 'brating': ''}
+
+
+def test_stalemate_is_decisive_but_not_a_mate():
+    moves = ['h3e3', 'h8e8']
+    resigned = game_priority(_game('1', moves))
+    assert game_priority(_game('2', moves, 'checkmate')) == pytest.approx(resigned + 10.0)
+    assert game_priority(_game('3', moves, 'stalemate')) == pytest.approx(resigned)
+    assert game_priority(_game('4', moves, 'agreement')) == pytest.approx(resigned - 10.0)
+
+
+def test_prioritize_orders_windows():
+    games = [_game(str(index), ['h3e3', 'h8e8'][:index % 3]) for index in range(6)]
+    ordered = [game['id'] for game in prioritize(games, window=3)]
+    assert ordered == ['2', '1', '0', '5', '4', '3']
+
+
+def test_prioritize_closes_window_above_max_rss(monkeypatch):
+    monkeypatch.setattr(scheduler, 'process_rss', lambda: 1000)
+    games = [_game(str(index), ['h3e3', 'h8e8'][:index % 3]) for index in range(4)]
+    assert [game['id'] for game in prioritize(games, window=0, max_rss=500)] == ['0', '1', '2', '3']
@@ -0,0 +1,118 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from xqpuzzles.store import PuzzleStore, QueryServer, score_bucket, serve_puzzles
+from xqpuzzles.utils import PuzzleWriter
+
+
+def _puzzle(index):
+    return {'game_id': str(index // 3), 'fen': 'fen %d' % index, 'moves_count': 1 + index % 3,
+            'theme': 'CHECKMATE' if index % 2 else 'CAPTURING', 'score': '#3' if index % 2 else '+%d' % (index * 50),
+            'first_turn': 'w', 'pv': 'h2e2', 'difficulty': 0.5}
+
+
+def _store(path, count=300):
+    store = PuzzleStore(str(path), batch_size=50)
+    store.add([_puzzle(index) for index in range(count)])
+    store.flush()
+    return store
+
+
+def test_score_bucket():
+    assert score_bucket('#3') == 100
+    assert score_bucket('#-3') == -100
+    assert score_bucket('+450') == 4
+    assert score_bucket(-20000) == -99
+
+
+def test_query_pages_and_filters(tmp_path):
+    store = _store(tmp_path / 'puzzles.db')
+    assert store.count() == 300
+    page = store.query(limit=10, theme='CHECKMATE', moves_count=2)
+    assert len(page) == 10
+    assert all(row['theme'] == 'CHECKMATE' and row['moves_count'] == 2 for row in page)
+    following = store.query(limit=10, after=page[-1]['id'], theme='CHECKMATE', moves_count=2)
+    assert following[0]['id'] > page[-1]['id']
+    store.close()
+
+
+def test_sample_draws_independent_puzzles(tmp_path):
+    store = _store(tmp_path / 'puzzles.db')
+    rows = store.query(limit=20, sample=True)
+    ids = sorted(row['id'] for row in rows)
+    assert len(set(ids)) == 20
+    # Not one contiguous run of ids
+    assert ids[-1] - ids[0] > 20
+    assert all(row['theme'] == 'CAPTURING' for row in store.query(limit=20, sample=True, theme='CAPTURING'))
+    # Fewer matches than the limit returns every match once
+    assert len(store.query(limit=20, sample=True, game_id='5')) == 3
+    store.close()
+
+
+def test_unseen_puzzles(tmp_path):
+    store = _store(tmp_path / 'puzzles.db', count=30)
+    first = store.query(limit=20, unseen_by='client')
+    second = store.query(limit=20, unseen_by='client')
+    assert len(first) == 20 and len(second) == 10
+    assert not {row['id'] for row in first} & {row['id'] for row in second}
+    assert store.query(limit=20, unseen_by='client') == []
+    store.close()
+
+
+def test_server_reuses_connections(tmp_path):
+    path = tmp_path / 'puzzles.db'
+    _store(path).close()
+    server = QueryServer(('127.0.0.1', 0), str(path))
+    opened = []
+    init = PuzzleStore.__init__
+
+    def counting_init(store, *args, **kwargs):
+        opened.append(store)
+        init(store, *args, **kwargs)
+
+    PuzzleStore.__init__ = counting_init
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%d/puzzles?theme=CHECKMATE&limit=5' % server.server_address[1]
+        for _ in range(10):
+            with urllib.request.urlopen(url) as response:
+                assert len(json.load(response)['puzzles']) == 5
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url.replace('limit=5', 'limit=-1'))
+        assert error.value.code == 400
+    finally:
+        PuzzleStore.__init__ = init
+        server.shutdown()
+        server.server_close()
+    assert len(opened) == 1
+
+
+def test_limit_must_be_positive(tmp_path):
+    store = _store(tmp_path / 'puzzles.db', count=30)
+    for limit in (0, -1):
+        with pytest.raises(ValueError):
+            store.query(limit=limit)
+    store.close()
+
+
+def test_serve_keeps_regular_files(tmp_path):
+    path = tmp_path / 'puzzles.db'
+    _store(path).close()
+    with pytest.raises(FileExistsError):
+        serve_puzzles(str(path), str(path))
+    assert PuzzleStore(str(path)).count() == 300
+
+
+def test_import_compressed_csv(tmp_path):
+    path = str(tmp_path / 'puzzles.csv.gz')
+    with PuzzleWriter(path) as writer:
+        writer.write([_puzzle(index) for index in range(10)], game_id='7')
+    store = PuzzleStore(str(tmp_path / 'puzzles.db'))
+    assert store.import_csv(path) == 10
+    assert [row['game_id'] for row in store.query(limit=20)] == ['7'] * 10
+    store.close()
@@ -0,0 +1,34 @@
+import io
+import json
+
+import pytest
+
+from xqpuzzles.puzzle_finder import Criteria, find_puzzle_candidates
+from xqpuzzles.synthetic import StandInEngine, synthetic_games
+from xqpuzzles.timeline import reclassify, write_timeline
+
+CRITERIA = Criteria(verify_mates=False)
+
+
+def _record(engine, game):
+    timeline = []
+    puzzles = find_puzzle_candidates(engine, game['moves'], skip_initial=5, criteria=CRITERIA, timeline=timeline)
+    file = io.StringIO()
+    write_timeline(file, game['id'], game['moves'], 5, timeline)
+    return puzzles, json.loads(file.getvalue())
+
+
+def test_reclassify_finds_the_puzzles_of_the_scan():
+    engine = StandInEngine()
+    found = 0
+    for game in synthetic_games(5):
+        puzzles, record = _record(engine, game)
+        assert [p['fen'] for p in reclassify(record, CRITERIA)] == [p['fen'] for p in puzzles]
+        found += len(puzzles)
+    assert found
+
+
+def test_reclassify_requires_an_engine_to_verify_mates():
+    _, record = _record(StandInEngine(), next(synthetic_games(1)))
+    with pytest.raises(ValueError):
+        reclassify(record, Criteria(verify_mates=True))
@@ -0,0 +1,36 @@
+import csv
+
+from xqpuzzles.fileio import open_file
+from xqpuzzles.utils import PuzzleWriter
+
+
+def _puzzle(index):
+    return {'fen': '4k4/9/9/9/9/9/9/9/9/4K4 w - - 0 %d' % index, 'moves_count': 1, 'theme': 'CAPTURING',
+            'score': '+500', 'first_turn': 'w', 'pv': 'e0e1'}
+
+
+def _rows(path):
+    with open_file(str(path)) as file:
+        return list(csv.DictReader(file))
+
+
+def test_writer_flushes_by_rows(tmp_path):
+    path = tmp_path / 'puzzles.csv'
+    with PuzzleWriter(str(path), flush_rows=3, flush_seconds=3600) as writer:
+        writer.write([_puzzle(1), _puzzle(2)], game_id='1')
+        assert path.read_text() == ''
+        writer.write([_puzzle(3)], game_id='2')
+        assert len(_rows(path)) == 3
+        writer.write([_puzzle(4)], game_id='3')
+    assert [row['game_id'] for row in _rows(path)] == ['1', '1', '2', '3']
+
+
+def test_writer_appends_compressed(tmp_path):
+    path = tmp_path / 'puzzles.csv.gz'
+    for game_id in range(3):
+        with PuzzleWriter(str(path)) as writer:
+            for index in range(50):
+                writer.write([_puzzle(index)], game_id=str(game_id))
+    rows = _rows(path)
+    assert len(rows) == 150
+    assert rows[-1]['game_id'] == '2'
@@ -0,0 +1,18 @@
+from xqpuzzles import xqboard
+from xqpuzzles.xqboard import XiangqiBoard
+
+
+def test_facts_are_computed_on_demand(monkeypatch):
+    calls = []
+    for name in ('legal_moves', 'gives_check', 'has_insufficient_material'):
+        function = getattr(xqboard.sf, name)
+        monkeypatch.setattr(xqboard.sf, name, lambda *args, name=name, function=function:
+                            calls.append(name) or function(*args))
+
+    board = XiangqiBoard()
+    board.push(['h3e3', 'h8e8', 'e3e7'])
+    assert board.is_checked() in (True, False)
+    board.is_checked()
+    assert calls == ['gives_check']
+    assert board.legal_moves()
+    assert calls == ['gives_check', 'legal_moves']
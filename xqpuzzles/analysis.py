@@ -3,20 +3,33 @@ import logging
 from collections import namedtuple
 from typing import List
 
-from xqpuzzles.cmd import open_process, uci, setoption, isready, kill_process, set_variant_options, send, go
-from xqpuzzles.constants import MEMORY, THREADS, DEFAULT_DEPTH, DEFAULT_MOVETIME, STOCKFISH_COMMAND, STOCKFISH_DIR, \
-    STOCKFISH_NNUE_FILE, PIKAFISH_COMMAND, PIKAFISH_DIR, PIKAFISH_NNUE_FILE
+from xqpuzzles.cmd import open_process, uci, setoption, isready, kill_process, set_variant_options, send, go, \
+    stop_recording
+from xqpuzzles.constants import MEMORY, THREADS, DEFAULT_DEPTH, DEFAULT_MOVETIME, DEFAULT_NODES, STOCKFISH_COMMAND, \
+    STOCKFISH_DIR, STOCKFISH_NNUE_FILE, PIKAFISH_COMMAND, PIKAFISH_DIR, PIKAFISH_NNUE_FILE
 
-AnalyzedMove = namedtuple("AnalyzedMove", ["move", "move_san", "score", "pv"])
+# The trace is the (depth, best move, score, nodes) of every completed depth of the search
+AnalyzedMove = namedtuple("AnalyzedMove", ["move", "move_san", "score", "pv", "depth", "nodes", "time", "trace"],
+                          defaults=(None, None, None, None))
+
+
+def search_trace(info):
+    """
+    Returns the per-depth trace of a search result with the scores from red's point of view
+    """
+    return [(depth, move, score.white(), nodes) for depth, move, score, nodes in info.get('trace', ())]
 
 
 class Engine(metaclass=abc.ABCMeta):
 
-    def __init__(self, command, engine_dir, nnue_file):
-        self.engine = open_process(command, engine_dir)
+    def __init__(self, command, engine_dir, nnue_file, nodes=DEFAULT_NODES, threads=THREADS, memory=MEMORY, cpus=None):
+        self.nodes = nodes
+        self.threads = threads
+        self.memory = memory
+        self.engine = self.open_engine(command, engine_dir, cpus)
         self.engine_info, _ = uci(self.engine)
         self.engine_info.pop('author', None)
-        logging.info('Started %s engine, pid: %d',
+        logging.info('Started %s engine, pid: %s',
                      self.engine_info.get('name', 'Engine <?>'), self.engine.pid)
 
         self.set_engine_options(nnue_file)
@@ -26,11 +39,28 @@ class Engine(metaclass=abc.ABCMeta):
     def name(self):
         return self.engine_info.get('name', '<?>')
 
+    @property
+    def search_limits(self):
+        """
+        Returns the `go` limits used for every search. A node budget makes the
+        search deterministic, otherwise it depends on the wall-clock movetime
+        """
+        if self.nodes:
+            return {'nodes': self.nodes, 'depth': DEFAULT_DEPTH}
+
+        return {'movetime': DEFAULT_MOVETIME, 'depth': DEFAULT_DEPTH}
+
+    def open_engine(self, command, engine_dir, cpus):
+        """
+        Starts the engine process, the commands are sent to its stdin and read from its stdout
+        """
+        return open_process(command, engine_dir, cpus=cpus)
+
     def set_engine_options(self, nnue_file):
         # Prepare UCI options
         self.engine_info['options'] = {}
-        self.engine_info['options']['threads'] = str(THREADS)
-        self.engine_info['options']['hash'] = str(MEMORY)
+        self.engine_info['options']['threads'] = str(self.threads)
+        self.engine_info['options']['hash'] = str(self.memory)
         self.engine_info['options']['EvalFile'] = nnue_file
 
         # Set UCI options
@@ -41,11 +71,42 @@ class Engine(metaclass=abc.ABCMeta):
         if not self.engine:
             return
 
+        stop_recording(self.engine)
         try:
             kill_process(self.engine)
         except OSError:
             logging.exception('Failed to kill engine process.')
 
+    def abort(self):
+        """
+        Kills the engine from another thread, the search in progress fails with EOFError
+        """
+        kill_process(self.engine, wait=False)
+
+    def search(self, board, multipv=1, new_game=True, **limits) -> List[AnalyzedMove]:
+        """
+        Searches a position with the given `go` limits and returns the analysis of every PV.
+        Without new_game, the hash of the previous search is kept (i.e. to deepen it)
+        """
+        if new_game:
+            self.new_game()
+        infos = go(self.engine, board, multipv=multipv, **limits)
+
+        analyzed_moves = []
+        for info in infos:
+            pv = info.get("pv")
+            move = pv[0] if pv else None
+            analyzed_moves.append(AnalyzedMove(move, board.get_san(move, is_ucci=board.ucci) if move else None,
+                                               info["score"].white(), pv, info.get("depth"), info.get("nodes"),
+                                               info.get("time"), search_trace(info)))
+        return analyzed_moves
+
+    @abc.abstractmethod
+    def new_game(self):
+        """
+        Prepares the engine for a search of a new position
+        """
+
     @abc.abstractmethod
     def is_ucci(self) -> bool:
         """
@@ -59,7 +120,7 @@ class Engine(metaclass=abc.ABCMeta):
         """
 
     @abc.abstractmethod
-    def best_move(self, board, depth) -> AnalyzedMove:
+    def best_move(self, board, limits=None) -> AnalyzedMove:
         """
         Will return the best move on given board position
         """
@@ -67,19 +128,25 @@ class Engine(metaclass=abc.ABCMeta):
 
 class Stockfish(Engine):
 
-    def __init__(self):
-        super().__init__(STOCKFISH_COMMAND, STOCKFISH_DIR, STOCKFISH_NNUE_FILE)
+    def __init__(self, **options):
+        super().__init__(STOCKFISH_COMMAND, STOCKFISH_DIR, STOCKFISH_NNUE_FILE, **options)
 
     def is_ucci(self) -> bool:
         return False
 
+    def new_game(self):
+        set_variant_options(self.engine, 'xiangqi')
+        setoption(self.engine, 'UCI_AnalyseMode', False)
+        send(self.engine, 'ucinewgame')
+        isready(self.engine)
+
     def analysis(self, board, multipv=3) -> List[AnalyzedMove]:
         set_variant_options(self.engine, 'xiangqi')
         setoption(self.engine, 'UCI_AnalyseMode', False)
         send(self.engine, 'ucinewgame')
         isready(self.engine)
 
-        infos = go(self.engine, board, depth=DEFAULT_DEPTH, movetime=DEFAULT_MOVETIME, multipv=multipv)
+        infos = go(self.engine, board, multipv=multipv, **self.search_limits)
         best_moves = []
         for info in infos:
             move = info["pv"][0]
@@ -88,36 +155,43 @@ class Stockfish(Engine):
 
         return infos
 
-    def best_move(self, board) -> AnalyzedMove:
+    def best_move(self, board, limits=None) -> AnalyzedMove:
         set_variant_options(self.engine, 'xiangqi')
         setoption(self.engine, 'UCI_AnalyseMode', False)
         send(self.engine, 'ucinewgame')
         isready(self.engine)
 
-        infos = go(self.engine, board, movetime=DEFAULT_MOVETIME, depth=DEFAULT_DEPTH)
+        infos = go(self.engine, board, **(limits or self.search_limits))
         info = infos[0]
         score = info["score"].white()
         if not info.get("pv"):
-            return AnalyzedMove(None, None, score, None)
+            return AnalyzedMove(None, None, score, None, info.get("depth"), info.get("nodes"), info.get("time"),
+                                search_trace(info))
 
         best_move = info["pv"][0]
-        return AnalyzedMove(best_move, board.get_san(best_move), score, info["pv"])
+        return AnalyzedMove(best_move, board.get_san(best_move), score, info["pv"],
+                            info.get("depth"), info.get("nodes"), info.get("time"), search_trace(info))
 
 
 class Pikafish(Engine):
 
-    def __init__(self):
-        super().__init__(PIKAFISH_COMMAND, PIKAFISH_DIR, PIKAFISH_NNUE_FILE)
+    def __init__(self, **options):
+        super().__init__(PIKAFISH_COMMAND, PIKAFISH_DIR, PIKAFISH_NNUE_FILE, **options)
 
     def is_ucci(self) -> bool:
         return True
 
+    def new_game(self):
+        setoption(self.engine, 'UCI_WDLCentipawn', False)
+        send(self.engine, 'ucinewgame')
+        isready(self.engine)
+
     def analysis(self, board, multipv=3) -> List[AnalyzedMove]:
         setoption(self.engine, 'UCI_WDLCentipawn', False)
         send(self.engine, 'ucinewgame')
         isready(self.engine)
 
-        infos = go(self.engine, board, depth=DEFAULT_DEPTH, movetime=DEFAULT_MOVETIME, multipv=multipv)
+        infos = go(self.engine, board, multipv=multipv, **self.search_limits)
         best_moves = []
         for info in infos:
             move = info["pv"][0]
@@ -126,16 +200,21 @@ class Pikafish(Engine):
 
         return infos
 
-    def best_move(self, board) -> AnalyzedMove:
+    def best_move(self, board, limits=None) -> AnalyzedMove:
         setoption(self.engine, 'UCI_WDLCentipawn', False)
         send(self.engine, 'ucinewgame')
         isready(self.engine)
 
-        infos = go(self.engine, board, movetime=DEFAULT_MOVETIME, depth=DEFAULT_DEPTH)
+        infos = go(self.engine, board, **(limits or self.search_limits))
         info = infos[0]
         score = info["score"].white()
         if not info.get("pv"):
-            return AnalyzedMove(None, None, score, None)
+            return AnalyzedMove(None, None, score, None, info.get("depth"), info.get("nodes"), info.get("time"),
+                                search_trace(info))
 
         best_move = info["pv"][0]
-        return AnalyzedMove(best_move, board.get_san(best_move, is_ucci=board.ucci), score, info["pv"])
\ No newline at end of file
+        return AnalyzedMove(best_move, board.get_san(best_move, is_ucci=board.ucci), score, info["pv"],
+                            info.get("depth"), info.get("nodes"), info.get("time"), search_trace(info))
+
+
+ENGINES = {'pikafish': Pikafish, 'stockfish': Stockfish}
@@ -0,0 +1,178 @@
+import ast
+import mmap
+import struct
+import sys
+from array import array
+
+# Binary game archive:
+#
+#   header   magic, version, columns count, games count, index offset, columns offset
+#   moves    2 bytes per move, (from square << 8) | to square, games laid out contiguously
+#   index    games count + 1 offsets (uint64) of the first move of every game
+#   columns  per metadata column: name, games count + 1 offsets (uint64) and the utf-8 values
+#
+# A square is rank * 9 + file on the 9x10 board, i.e 'a1' is 0 and 'i10' is 89.
+# All numbers are little-endian and every section starts 8 bytes aligned.
+
+MAGIC = b'XQGA'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQQ')
+ARCHIVE_EXTENSION = '.xqg'
+
+FILES = 'abcdefghi'
+SQUARE_NAMES = [f'{FILES[sq % 9]}{sq // 9 + 1}' for sq in range(90)]
+SQUARES = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+
+
+def encode_move(uci):
+    for i in range(2, len(uci)):
+        if uci[i] in FILES:
+            return SQUARES[uci[:i]] << 8 | SQUARES[uci[i:]]
+    raise ValueError(f'Invalid move: {uci}')
+
+
+def decode_move(code):
+    return SQUARE_NAMES[code >> 8] + SQUARE_NAMES[code & 0xff]
+
+
+def _uint64s(values):
+    values = array('Q', values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _pad(f):
+    f.write(b'\0' * (-f.tell() % 8))
+
+
+def write_archive(path, games):
+    """
+    Writes the game rows (dicts with a 'moves' list or its string) into a binary archive,
+    returns the number of written games
+    """
+    offsets = [0]
+    columns = {}
+    with open(path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        for game in games:
+            moves = game['moves']
+            if isinstance(moves, str):
+                moves = ast.literal_eval(moves)
+
+            codes = array('H', [encode_move(m) for m in moves])
+            if sys.byteorder == 'big':
+                codes.byteswap()
+            f.write(codes.tobytes())
+            offsets.append(offsets[-1] + len(codes))
+
+            for name in game:
+                if name != 'moves' and name not in columns:
+                    columns[name] = [''] * (len(offsets) - 2)
+            for name, values in columns.items():
+                value = game.get(name)
+                values.append('' if value is None else str(value))
+
+        _pad(f)
+        index_offset = f.tell()
+        f.write(_uint64s(offsets))
+
+        columns_offset = f.tell()
+        for name, values in columns.items():
+            name = name.encode()
+            f.write(struct.pack('<H', len(name)) + name)
+            _pad(f)
+            data = [value.encode() for value in values]
+            value_offsets = [0]
+            for value in data:
+                value_offsets.append(value_offsets[-1] + len(value))
+            f.write(_uint64s(value_offsets))
+            f.write(b''.join(data))
+            _pad(f)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(columns), len(offsets) - 1, index_offset, columns_offset))
+
+    return len(offsets) - 1
+
+
+class GameArchive(object):
+    """ Memory-mapped binary game archive with random access by game index.
+        A game is returned as a dict of its metadata columns with the 'moves' list
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+
+        magic, version, columns_count, self.games_count, index_offset, columns_offset = \
+            HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a game archive (version {VERSION})')
+
+        self.index = self._uint64s(index_offset, self.games_count + 1)
+        self.columns = {}
+        offset = columns_offset
+        for _ in range(columns_count):
+            name_size, = struct.unpack_from('<H', self.buffer, offset)
+            name = bytes(self.buffer[offset + 2:offset + 2 + name_size]).decode()
+            offset += 2 + name_size
+            offset += -offset % 8
+            value_offsets = self._uint64s(offset, self.games_count + 1)
+            offset += 8 * (self.games_count + 1)
+            self.columns[name] = (offset, value_offsets)
+            offset += value_offsets[-1]
+            offset += -offset % 8
+
+    def _uint64s(self, offset, count):
+        view = self.buffer[offset:offset + 8 * count]
+        if sys.byteorder == 'big':
+            values = array('Q', view)
+            values.byteswap()
+            return values
+        return view.cast('Q')
+
+    def __len__(self):
+        return self.games_count
+
+    def moves(self, i):
+        start, stop = self.index[i], self.index[i + 1]
+        view = self.buffer[HEADER.size + 2 * start:HEADER.size + 2 * stop]
+        if sys.byteorder == 'big':
+            codes = array('H', view)
+            codes.byteswap()
+        else:
+            codes = view.cast('H')
+        return [SQUARE_NAMES[code >> 8] + SQUARE_NAMES[code & 0xff] for code in codes]
+
+    def column(self, name, i):
+        offset, value_offsets = self.columns[name]
+        return bytes(self.buffer[offset + value_offsets[i]:offset + value_offsets[i + 1]]).decode()
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.games_count
+        if not 0 <= i < self.games_count:
+            raise IndexError('game index out of range')
+
+        game = {name: self.column(name, i) for name in self.columns}
+        game['moves'] = self.moves(i)
+        return game
+
+    def __iter__(self):
+        for i in range(self.games_count):
+            yield self[i]
+
+    def close(self):
+        # Views must be released before the map can be closed
+        self.index = None
+        self.columns = {}
+        self.buffer.release()
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
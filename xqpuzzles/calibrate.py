@@ -0,0 +1,47 @@
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import DEFAULT_MOVETIME
+from xqpuzzles.logger import log
+from xqpuzzles.xqboard import XiangqiBoard
+
+# A full game, the benchmark positions are taken at fixed plies of it
+CALIBRATION_MOVES = [
+    'h3h7', 'b8e8', 'b1c3', 'g7g6', 'c4c5', 'h10g8', 'c1e3', 'g8f6', 'b3b7', 'b10c8', 'h7c7', 'h8g8', 'd1e2', 'g6g5',
+    'a1d1', 'g5g4', 'h1i3', 'g4f4', 'c5c6', 'a10b10', 'e4e5', 'f4e4', 'c6b6', 'e4e3', 'd1d6', 'f6h5', 'd6d5', 'h5f4',
+    'c3e4', 'g8h8', 'g1e3', 'h8h3', 'i1h1', 'h3h5', 'd5d9', 'i10h10', 'h1g1', 'h5h4', 'g1g4', 'e8e5', 'e4c5', 'f4e6',
+    'd9d6', 'h4h5', 'g4h4', 'e6g5', 'd6f6', 'c10e8', 'h4g4', 'g5e6', 'c5e6', 'e7e6', 'f6e6', 'e5d5', 'g4g5', 'd5d9',
+]
+CALIBRATION_PLIES = (0, 8, 16, 24, 32, 40, 48, 56)
+
+
+def calibration_boards(ucci=False):
+    """
+    Returns the benchmark positions used for calibration
+    """
+    boards = []
+    for ply in CALIBRATION_PLIES:
+        board = XiangqiBoard(ucci=ucci)
+        board.push(CALIBRATION_MOVES[:ply])
+        boards.append(board)
+
+    return boards
+
+
+def calibrate(engine, movetime=DEFAULT_MOVETIME):
+    """
+    Measures the engine speed (nodes per second) on this machine and returns
+    the measured nps along with the node budget equivalent to given movetime
+    """
+    log(Color.DIM, "Calibrating %s (movetime: %dms)..." % (engine.name, movetime))
+
+    total_nodes = 0
+    total_time = 0.0
+    for board in calibration_boards(ucci=engine.is_ucci()):
+        analysis = engine.best_move(board, {'movetime': movetime})
+        nodes = analysis.nodes or 0
+        elapsed = analysis.time or movetime / 1000.0
+        total_nodes += nodes
+        total_time += elapsed
+        log(Color.DARK_BLUE, "%s => %d nodes in %.3fs (%d nps)" % (board.fen, nodes, elapsed, nodes / elapsed))
+
+    nps = int(total_nodes / total_time) if total_time else 0
+    return nps, nps * movetime // 1000
@@ -3,6 +3,7 @@ import os
 import signal
 import subprocess
 import threading
+import time
 
 from chess.engine import InfoDict, Info, INFO_ALL, INFO_PV, INFO_SCORE, Cp, Mate, PovScore
 
@@ -10,7 +11,7 @@ from xqpuzzles.xqboard import XiangqiBoard
 from xqpuzzles.logger import ENGINE
 
 
-def open_process(command, cwd=None, shell=True, _popen_lock=threading.Lock()):
+def open_process(command, cwd=None, shell=True, cpus=None, _popen_lock=threading.Lock()):
     kwargs = {
         'shell': shell,
         'stdout': subprocess.PIPE,
@@ -30,37 +31,88 @@ def open_process(command, cwd=None, shell=True, _popen_lock=threading.Lock()):
     except AttributeError:
         # Unix
         kwargs['preexec_fn'] = os.setpgrp
+        if cpus:
+            def preexec():
+                os.setpgrp()
+                # Pin the engine (and its threads) to the given CPUs
+                os.sched_setaffinity(0, cpus)
+
+            kwargs['preexec_fn'] = preexec
 
     with _popen_lock:  # Work around Python 2 Popen race condition
         return subprocess.Popen(command, **kwargs)
 
 
-def kill_process(p):
+# Lines received from the engines and the seconds spent waiting for them, only counted while
+# the profiler sets it. The engines of the cross validators are read from other threads
+RECV_STATS = None
+_recv_stats_lock = threading.Lock()
+# Session recorders of the engine processes, see xqpuzzles.replay
+RECORDERS = {}
+
+
+def kill_process(p, wait=True):
     try:
         # Windows
         p.send_signal(signal.CTRL_BREAK_EVENT)
     except AttributeError:
         # Unix
-        os.killpg(p.pid, signal.SIGKILL)
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            # Already killed
+            pass
+
+    if wait:
+        p.communicate()
+
+
+def stop_recording(p):
+    recorder = RECORDERS.pop(p, None)
+    if recorder is not None:
+        recorder.close()
 
-    p.communicate()
+
+def move_recording(p, new_p):
+    recorder = RECORDERS.pop(p, None)
+    if recorder is not None:
+        RECORDERS[new_p] = recorder
 
 
 def send(p, line):
     logging.log(ENGINE, '%s << %s', p.pid, line)
+    if RECORDERS:
+        recorder = RECORDERS.get(p)
+        if recorder is not None:
+            recorder.sent(line)
     p.stdin.write(line + '\n')
     p.stdin.flush()
 
 
+def _timed_readline(p):
+    start = time.perf_counter()
+    line = p.stdout.readline()
+    seconds = time.perf_counter() - start
+    with _recv_stats_lock:
+        if RECV_STATS is not None:
+            RECV_STATS['calls'] += 1
+            RECV_STATS['seconds'] += seconds
+    return line
+
+
 def recv(p):
     while True:
-        line = p.stdout.readline()
+        line = p.stdout.readline() if RECV_STATS is None else _timed_readline(p)
         if line == '':
             raise EOFError()
 
         line = line.rstrip()
 
         logging.log(ENGINE, '%s >> %s', p.pid, line)
+        if RECORDERS:
+            recorder = RECORDERS.get(p)
+            if recorder is not None:
+                recorder.received(line)
 
         if line:
             return line
@@ -200,9 +252,26 @@ def _parse_uci_info(arg: str, root_board: XiangqiBoard, selector: Info = INFO_AL
 
 
 
-def go(p, board: XiangqiBoard, movetime=None, clock=None, depth=None, nodes=None, multipv=1):
+def _trace_depth(pv_info, info):
+    """
+    Keeps the (depth, best move, score, nodes) of the last exact result of every depth
+    """
+    if 'depth' not in info or 'score' not in info or not info.get('pv') \
+            or info.get('lowerbound') or info.get('upperbound'):
+        return
+
+    trace = pv_info.setdefault('trace', [])
+    step = (info['depth'], info['pv'][0], info['score'], info.get('nodes'))
+    if trace and trace[-1][0] == step[0]:
+        trace[-1] = step
+    else:
+        trace.append(step)
+
+
+def go(p, board: XiangqiBoard, movetime=None, clock=None, depth=None, nodes=None, mate=None, multipv=1):
     setoption(p, 'MultiPV', multipv)
-    send(p, 'position fen %s moves %s' % (board.initial_fen, ' '.join(board.stack)))
+    # The current position costs the same to send and parse at any game length
+    send(p, 'position fen %s' % board.fen)
 
     builder = []
     builder.append('go')
@@ -215,6 +284,9 @@ def go(p, board: XiangqiBoard, movetime=None, clock=None, depth=None, nodes=None
     if nodes is not None:
         builder.append('nodes')
         builder.append(str(nodes))
+    if mate is not None:
+        builder.append('mate')
+        builder.append(str(mate))
     if clock is not None:
         builder.append('wtime')
         builder.append(str(clock['wtime'] * 10))
@@ -247,6 +319,8 @@ def go(p, board: XiangqiBoard, movetime=None, clock=None, depth=None, nodes=None
 
             multipv = info.get('multipv', 1)
             pv_infos[multipv - 1].update(info)
+            if multipv == 1:
+                _trace_depth(pv_infos[0], info)
         else:
             logging.warning('Unexpected engine response to go: %s %s', command, arg)
 
@@ -9,9 +9,82 @@ STOCKFISH_COMMAND = './stockfish-x86_64'
 STOCKFISH_NNUE_FILE = 'absolute-nnue-file-path'
 
 # COMMON
+# Engines per scan, threads and hash (MB) per engine, use None to size them from the host resources
+WORKERS = 1
 THREADS = 1
 MEMORY = 256
+# Memory (MB) kept free for the OS and the scanner, and used by every engine besides its hash (NNUE etc.)
+RESERVED_MEMORY = 512
+ENGINE_MEMORY_OVERHEAD = 64
 DEFAULT_DEPTH = 14
 DEFAULT_MOVETIME = 500
+# When set, searches are limited by node count instead of movetime so that results
+# don't depend on machine load. Use `puzzle_maker.py --calibrate` to pick a value.
+DEFAULT_NODES = None
+# Time limit (ms) of a mate search without node budget, nodes of the search which checks that
+# no shorter mate exists and number of cached mate proofs
+MATE_MOVETIME = 1000
+MATE_REFUTE_NODES = 100000
+MATE_PROOF_CACHE = 10000
+
+# PUZZLES
+# Puzzle predicates: score swing (cp) of a capturing puzzle and the maximum winning score
+# after it, longest mate and the maximum difference of major pieces in the position
+MIN_SCORE_SWING = 400
+MAX_WINNING_SCORE = 2000
+MAX_MATE_MOVES = 10
+MAX_MATERIAL_DIFF = 3
+# Prove the shortest forced mate of checkmate puzzles and drop the ones with several mating first moves
+VERIFY_MATES = True
+# Minimum score (cp) of the side to move for the cross-validation engine to agree on a puzzle, the
+# lines it searches and how much worse (cp) than its best line the line of the puzzle move may be
+CROSS_CHECK_MIN_SCORE = 200
+CROSS_CHECK_LINES = 3
+CROSS_CHECK_MARGIN = 100
+
+# SCANNING
+# Size (MB) of the evaluation cache shared by the scanning workers, 0 to disable it
+EVAL_CACHE_SIZE = 64
+# Games ordered at once by the priority scheduler, 0 to order the whole corpus
+PRIORITY_WINDOW = 10000
+# Games per shard of the job queue and seconds a worker holds a shard without a heartbeat. A shard
+# whose scan failed SHARD_ATTEMPTS times is failed, a failed attempt waits SHARD_RETRY_DELAY seconds
+# per attempt before the shard is leased again
+SHARD_SIZE = 100
+SHARD_LEASE = 120
+SHARD_ATTEMPTS = 3
+SHARD_RETRY_DELAY = 60
+# Puzzle rows and seconds after which a puzzles CSV file is flushed, every flush of a compressed
+# file ends a compressed block (a sync flush) and costs some compression
+PUZZLE_FLUSH_ROWS = 1000
+PUZZLE_FLUSH_SECONDS = 10
+# Searches and seconds after which a recorded engine session (--record) is flushed
+RECORD_FLUSH_SEARCHES = 100
+RECORD_FLUSH_SECONDS = 10
+# Positions whose legal moves, check status, material flags and move notations are cached
+POSITION_CACHE_SIZE = 65536
+# Games handed to every worker ahead of the scan, and the resident memory (MB) of the scanning
+# process above which no more games are read until the pending ones are written (None for no limit)
+PENDING_GAMES = 2
+MAX_RSS = None
+# Wall-clock seconds, engine nodes and moves a game may use before it's given up (None for no limit),
+# and seconds a search may run past the wall-clock budget before the engine is killed
+GAME_TIMEOUT = None
+GAME_NODES = None
+MAX_GAME_PLIES = None
+WATCHDOG_GRACE = 30
+# Positions of a FEN list handed to a worker at once
+POSITION_BATCH = 16
+# Reconnections to engine servers before a remote search fails
+REMOTE_RETRIES = 3
+# Seconds an idle connection to an engine server has to answer isready before it's reused
+REMOTE_CHECK_TIMEOUT = 5
+
+# PUZZLE STORE
+# Puzzles written to the puzzle store per transaction and puzzles per query page
+STORE_BATCH_SIZE = 500
+STORE_PAGE_SIZE = 20
+# SQLite connections shared by the threads of the puzzle query server
+STORE_CONNECTIONS = 8
 
 from .local import *
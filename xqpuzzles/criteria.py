@@ -0,0 +1,13 @@
+from collections import namedtuple
+
+from xqpuzzles.constants import MIN_SCORE_SWING, MAX_WINNING_SCORE, MAX_MATE_MOVES, MAX_MATERIAL_DIFF, VERIFY_MATES, \
+    GAME_TIMEOUT, GAME_NODES, MAX_GAME_PLIES
+
+# The puzzle predicates and game budgets are built before any input is read, this module
+# doesn't import the engine and board modules (python-chess, pyffish, NumPy)
+
+Criteria = namedtuple("Criteria", ["min_swing", "max_score", "max_mate", "max_material_diff", "verify_mates"],
+                      defaults=(MIN_SCORE_SWING, MAX_WINNING_SCORE, MAX_MATE_MOVES, MAX_MATERIAL_DIFF, VERIFY_MATES))
+# Wall-clock seconds, engine nodes and moves a game may use, None for no limit
+GameBudget = namedtuple("GameBudget", ["seconds", "nodes", "plies"],
+                        defaults=(GAME_TIMEOUT, GAME_NODES, MAX_GAME_PLIES))
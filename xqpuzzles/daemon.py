@@ -0,0 +1,153 @@
+import ast
+import csv
+import json
+import logging
+import os
+import queue
+import signal
+import socketserver
+import stat
+from contextlib import nullcontext
+
+from xqpuzzles.colors import Color
+from xqpuzzles.criteria import Criteria
+from xqpuzzles.fileio import open_file
+from xqpuzzles.logger import log
+from xqpuzzles.puzzle_finder import find_puzzle_candidates
+from xqpuzzles.scanner import start_engine
+from xqpuzzles.utils import PuzzleWriter
+
+
+def puzzle_to_json(puzzle):
+    return dict(puzzle, score=str(puzzle['score']))
+
+
+class EnginePool(object):
+    """ A pool of warm engines, an engine is checked out for every scan job scanned with the criteria
+    """
+    def __init__(self, engine_name, plans, criteria=Criteria(), **options):
+        self.engine_name = engine_name
+        self.criteria = criteria
+        self.options = options
+        self.idle = queue.Queue()
+        for plan in plans:
+            self.idle.put((plan, start_engine(engine_name, plan, **options)))
+
+    def scan(self, moves, skip_initial):
+        plan, engine = self.idle.get()
+        try:
+            if engine is None:
+                engine = start_engine(self.engine_name, plan, **self.options)
+            return find_puzzle_candidates(engine, moves, skip_initial=skip_initial, criteria=self.criteria)
+        except (EOFError, OSError):
+            # The engine died, replace it so that the pool stays warm
+            logging.exception('Engine failed, restarting it')
+            engine = self.restart(plan, engine)
+            raise
+        finally:
+            self.idle.put((plan, engine))
+
+    def restart(self, plan, engine):
+        """
+        Returns a new engine for the plan of a dead engine, or None if it can't be started:
+        the dead engine is dropped and the next job of the plan starts the engine again
+        """
+        if engine is not None:
+            engine.quit()
+        try:
+            return start_engine(self.engine_name, plan, **self.options)
+        except Exception:
+            logging.exception('Engine restart failed')
+            return None
+
+    def quit(self):
+        while not self.idle.empty():
+            _, engine = self.idle.get()
+            if engine is not None:
+                engine.quit()
+
+
+class ScanHandler(socketserver.StreamRequestHandler):
+    """ Reads one JSON job per line and writes JSON lines back:
+
+        {"moves": ["h3h7", ...], "skip_initial": 5}
+          => {"puzzles": [...]}
+
+        {"games_csv": "games.csv", "out_csv": "puzzles.csv"}
+          => {"game_id": ..., "puzzles": [...]} per game and {"done": true, "games": n, "puzzles": n}
+    """
+    def reply(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                job = json.loads(line)
+                if 'moves' in job:
+                    puzzles = self.server.pool.scan(job['moves'], job.get('skip_initial', 5))
+                    self.reply({'puzzles': [puzzle_to_json(p) for p in puzzles]})
+                elif 'games_csv' in job:
+                    self.scan_csv(job['games_csv'], job.get('out_csv'), job.get('skip_initial', 5))
+                else:
+                    self.reply({'error': 'Unknown job, expected "moves" or "games_csv"'})
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            except Exception as exp:
+                logging.exception(exp)
+                self.reply({'error': str(exp)})
+
+    def scan_csv(self, games_csv, out_csv, skip_initial):
+        games_count, puzzles_count = 0, 0
+        with open_file(games_csv) as file, PuzzleWriter(out_csv) if out_csv else nullcontext() as writer:
+            for game in csv.DictReader(file):
+                try:
+                    puzzles = self.server.pool.scan(ast.literal_eval(game['moves']), skip_initial)
+                except Exception as exp:
+                    logging.info(f'Got exception in game: {game["id"]}')
+                    logging.exception(exp)
+                    continue
+
+                if writer:
+                    writer.write(puzzles, game_id=game['id'])
+                games_count += 1
+                puzzles_count += len(puzzles)
+                self.reply({'game_id': game['id'], 'puzzles': [puzzle_to_json(p) for p in puzzles]})
+
+        self.reply({'done': True, 'games': games_count, 'puzzles': puzzles_count})
+
+
+class ScanServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, pool):
+        self.pool = pool
+        super().__init__(socket_path, ScanHandler)
+
+
+def serve(socket_path, engine_name, plans, criteria=Criteria(), **options):
+    """
+    Keeps the engines loaded and serves scan jobs on a Unix socket until interrupted
+    """
+    if os.path.exists(socket_path):
+        # Only a socket left by a previous daemon is replaced
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            raise FileExistsError(f'{socket_path} exists and is not a socket')
+        os.unlink(socket_path)
+
+    pool = EnginePool(engine_name, plans, criteria, **options)
+    server = ScanServer(socket_path, pool)
+    signal.signal(signal.SIGTERM, _interrupt)
+    log(Color.YELLOW, "Serving scan jobs on %s with %d engines" % (socket_path, len(plans)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.quit()
+        os.unlink(socket_path)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
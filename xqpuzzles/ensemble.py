@@ -0,0 +1,76 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import CROSS_CHECK_MIN_SCORE, CROSS_CHECK_LINES, CROSS_CHECK_MARGIN
+from xqpuzzles.logger import log
+from xqpuzzles.xqboard import ucci_to_uci
+
+AGREE, DISAGREE = 'agree', 'disagree'
+FLAG, DROP = 'flag', 'drop'
+
+# The second engine, its EnginePlan per scanning worker and what to do with disagreements
+Validation = namedtuple("Validation", ["engine_name", "plans", "on_disagreement"])
+
+
+class CrossValidator(object):
+    """ Re-checks accepted puzzle candidates with a second engine. The checks run in a
+        background thread, so both engines search at the same time on their own cores
+    """
+    def __init__(self, engine, on_disagreement=FLAG):
+        self.engine = engine
+        self.on_disagreement = on_disagreement
+        # The engine can only run one search at a time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, board, puzzle):
+        """
+        Returns a future of the checked puzzle, None if it's dropped
+        """
+        return self.executor.submit(self.check, board.copy(), puzzle)
+
+    def wins(self, board, analysis):
+        """
+        Returns if the analysis finds a win for the side to move
+        """
+        sign = 1 if board.turn else -1
+        if analysis.score.is_mate():
+            return sign * analysis.score.mate() > 0
+        return sign * analysis.score.score() >= CROSS_CHECK_MIN_SCORE
+
+    def agrees(self, board, move, analyses):
+        """
+        The second engine agrees if the first move of the puzzle (UCI) is one of its best lines, wins
+        for the side to move and is at most CROSS_CHECK_MARGIN worse than its best line
+        """
+        for analysis in analyses:
+            line_move = ucci_to_uci(analysis.move) if board.ucci and analysis.move else analysis.move
+            if line_move != move:
+                continue
+            if not self.wins(board, analysis):
+                return False
+            best, line = analyses[0].score, analysis.score
+            if line.is_mate() or best.is_mate():
+                # The puzzle move mates, or misses the mate of the best line
+                return line.is_mate()
+            sign = 1 if board.turn else -1
+            return sign * (best.score() - line.score()) <= CROSS_CHECK_MARGIN
+        return False
+
+    def check(self, board, puzzle):
+        move = ucci_to_uci(puzzle['pv'][0]) if board.ucci else puzzle['pv'][0]
+        # The moves of the board are written in the notation of the second engine
+        board.ucci = self.engine.is_ucci()
+        analyses = self.engine.search(board, multipv=CROSS_CHECK_LINES, **self.engine.search_limits)
+        if analyses and self.agrees(board, move, analyses):
+            return dict(puzzle, cross_check=AGREE)
+
+        log(Color.DIM, "%s disagrees on %s (%s)" % (self.engine.name, board.fen,
+                                                   analyses[0].score if analyses else 'no move'))
+        if self.on_disagreement == DROP:
+            return None
+        return dict(puzzle, cross_check=DISAGREE)
+
+    def quit(self):
+        self.executor.shutdown()
+        self.engine.quit()
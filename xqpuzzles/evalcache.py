@@ -0,0 +1,145 @@
+import hashlib
+import multiprocessing
+import struct
+from multiprocessing.shared_memory import SharedMemory
+
+from chess.engine import Cp, Mate
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.archive import encode_move, decode_move
+from xqpuzzles.xqboard import uci_to_ucci, ucci_to_uci
+
+# Slot: position key (0 when empty), nodes, score, score kind, depth, PV length and the PV moves.
+# Longer PVs are truncated, puzzles found from a cached analysis are searched again (see refresh_puzzle)
+SLOT = struct.Struct('<QQiBBBx16H')
+MAX_PV = 16
+WAYS = 4
+CP, MATE = 1, 2
+
+# Per worker counters: lookups, hits, stores and contended lock acquisitions
+STATS = struct.Struct('<QQQQ')
+MAX_WORKERS = 256
+LOCK_STRIPES = 64
+
+
+def position_key(board):
+    """
+    Returns the 64-bit key of the position (pieces and side to move) of a board
+    """
+    position = ' '.join(board.fen.split()[:2])
+    key = int.from_bytes(hashlib.blake2b(position.encode(), digest_size=8).digest(), 'little')
+    return key or 1
+
+
+class SharedEvalCache(object):
+    """ A fixed-size evaluation table in shared memory, shared by the scanning worker processes.
+        Positions are hashed into buckets of WAYS slots and every bucket is guarded by one of
+        the striped locks. The cache must be created before the workers are started
+    """
+    def __init__(self, size_mb):
+        buckets = max(1, size_mb * 1024 * 1024 // (SLOT.size * WAYS))
+        self.buckets = buckets
+        self.table_offset = STATS.size * MAX_WORKERS
+        # New shared memory is zero filled, i.e all slots are empty
+        self.memory = SharedMemory(create=True, size=self.table_offset + buckets * WAYS * SLOT.size)
+        self.locks = [multiprocessing.Lock() for _ in range(LOCK_STRIPES)]
+        self.worker_id = 0
+
+    def _lock(self, bucket):
+        lock = self.locks[bucket % LOCK_STRIPES]
+        if not lock.acquire(block=False):
+            self._count(3)
+            lock.acquire()
+        return lock
+
+    def _count(self, counter):
+        offset = self.worker_id * STATS.size
+        stats = list(STATS.unpack_from(self.memory.buf, offset))
+        stats[counter] += 1
+        STATS.pack_into(self.memory.buf, offset, *stats)
+
+    def get(self, board):
+        """
+        Returns the cached AnalyzedMove of the board position or None
+        """
+        key = position_key(board)
+        bucket = key % self.buckets
+        self._count(0)
+
+        entry = None
+        lock = self._lock(bucket)
+        try:
+            for way in range(WAYS):
+                offset = self.table_offset + (bucket * WAYS + way) * SLOT.size
+                slot = SLOT.unpack_from(self.memory.buf, offset)
+                if slot[0] == key:
+                    entry = slot
+                    break
+        finally:
+            lock.release()
+
+        if entry is None:
+            return None
+
+        self._count(1)
+        _, nodes, value, kind, depth, pv_size = entry[:6]
+        pv = [decode_move(code) for code in entry[6:6 + pv_size]]
+        if board.ucci:
+            pv = [uci_to_ucci(move) for move in pv]
+        score = Mate(value) if kind == MATE else Cp(value)
+        if not pv:
+            return AnalyzedMove(None, None, score, None, depth or None, nodes or None)
+
+        return AnalyzedMove(pv[0], board.get_san(pv[0], is_ucci=board.ucci), score, pv, depth or None, nodes or None)
+
+    def put(self, board, analysis):
+        """
+        Stores the AnalyzedMove of the board position, replacing the oldest entry of a full bucket
+        """
+        key = position_key(board)
+        bucket = key % self.buckets
+
+        pv = (analysis.pv or [])[:MAX_PV]
+        if board.ucci:
+            pv = [ucci_to_uci(move) for move in pv]
+        codes = [encode_move(move) for move in pv]
+        if analysis.score.is_mate():
+            kind, value = MATE, analysis.score.mate()
+        else:
+            kind, value = CP, analysis.score.score()
+        slot = SLOT.pack(key, analysis.nodes or 0, value, kind, min(analysis.depth or 0, 255), len(codes),
+                         *(codes + [0] * (MAX_PV - len(codes))))
+
+        lock = self._lock(bucket)
+        try:
+            base = self.table_offset + bucket * WAYS * SLOT.size
+            ways = [SLOT.unpack_from(self.memory.buf, base + way * SLOT.size)[0] for way in range(WAYS)]
+            if key in ways:
+                way = ways.index(key)
+            elif 0 in ways:
+                way = ways.index(0)
+            else:
+                # Shift the bucket and put the new entry first, the oldest one is dropped
+                self.memory.buf[base + SLOT.size:base + WAYS * SLOT.size] = \
+                    self.memory.buf[base:base + (WAYS - 1) * SLOT.size].tobytes()
+                way = 0
+            self.memory.buf[base + way * SLOT.size:base + (way + 1) * SLOT.size] = slot
+        finally:
+            lock.release()
+
+        self._count(2)
+
+    def stats(self):
+        """
+        Returns the lookups, hits, stores and contended lock acquisitions of all workers
+        """
+        totals = [0, 0, 0, 0]
+        for worker_id in range(MAX_WORKERS):
+            for i, value in enumerate(STATS.unpack_from(self.memory.buf, worker_id * STATS.size)):
+                totals[i] += value
+        return tuple(totals)
+
+    def close(self, unlink=False):
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
@@ -0,0 +1,220 @@
+from collections import namedtuple
+
+from xqpuzzles.features import ADVISOR, CANNON, ELEPHANT, FILES, HORSE, KING, PAWN, PIECE_VALUES, RANKS, ROOK, \
+    encode_fens
+from xqpuzzles.xqboard import ucci_to_uci, uci_to_board_coord
+
+# Material won (pawns) by the side making the first capture, the number of captures of the exchange
+# and the ((rank, file), (rank, file)) recapture expected after the first one (None if there is none)
+Exchange = namedtuple("Exchange", ["gain", "length", "recapture"], defaults=(None,))
+# A king is never traded, it can only take the last piece of an exchange
+KING_VALUE = 100.0
+ORTHOGONAL = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIAGONAL = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+HORSE_JUMPS = ((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2))
+
+
+def _on_board(rank, file):
+    return 0 <= rank < RANKS and 0 <= file < FILES
+
+
+def _own_half(rank, red):
+    # Red starts on the ranks 5-9 (the bottom of the FEN)
+    return rank >= RANKS // 2 if red else rank < RANKS // 2
+
+
+def _in_palace(rank, file, red):
+    return 3 <= file <= 5 and (rank >= 7 if red else rank <= 2)
+
+
+def piece_value(code, rank):
+    """
+    Returns the value of a piece code on a rank, pawns across the river are worth twice as much
+    """
+    piece = abs(code)
+    if piece == KING:
+        return KING_VALUE
+    if piece == PAWN and not _own_half(rank, code > 0):
+        return 2 * PIECE_VALUES[PAWN]
+    return float(PIECE_VALUES[piece])
+
+
+def attackers(squares, rank, file, red):
+    """
+    Returns the (value, rank, file) of the pieces of a side attacking a square: rooks and
+    kings along clear lines, cannons over exactly one screen, horses whose leg is free,
+    elephants whose eye is free on their side of the river, advisors and kings in their
+    palace and pawns forward (and sideways across the river)
+    """
+    sign = 1 if red else -1
+    found = []
+
+    def add(r, c):
+        found.append((piece_value(squares[r][c], r), r, c))
+
+    # Rooks, cannons and kings along the ranks and files
+    for dr, dc in ORTHOGONAL:
+        r, c = rank + dr, file + dc
+        screens = 0
+        while _on_board(r, c):
+            code = squares[r][c]
+            if code:
+                if screens == 0:
+                    if code == sign * ROOK:
+                        add(r, c)
+                    elif code == sign * KING and (r, c) == (rank + dr, file + dc) and _in_palace(rank, file, red):
+                        add(r, c)
+                elif code == sign * CANNON:
+                    add(r, c)
+                    break
+                screens += 1
+                if screens > 1:
+                    break
+            r, c = r + dr, c + dc
+
+    # Horses, the leg is next to the horse towards the long side of the jump
+    for dr, dc in HORSE_JUMPS:
+        r, c = rank + dr, file + dc
+        if _on_board(r, c) and squares[r][c] == sign * HORSE:
+            leg = (r - dr // 2, c) if abs(dr) == 2 else (r, c - dc // 2)
+            if not squares[leg[0]][leg[1]]:
+                add(r, c)
+
+    for dr, dc in DIAGONAL:
+        # Elephants, over an empty eye and without crossing the river
+        r, c = rank + 2 * dr, file + 2 * dc
+        if _on_board(r, c) and squares[r][c] == sign * ELEPHANT and _own_half(rank, red) \
+                and not squares[rank + dr][file + dc]:
+            add(r, c)
+        # Advisors, inside the palace
+        r, c = rank + dr, file + dc
+        if _on_board(r, c) and squares[r][c] == sign * ADVISOR and _in_palace(rank, file, red):
+            add(r, c)
+
+    # Pawns, red pawns move towards the rank 0
+    forward = -1 if red else 1
+    r = rank - forward
+    if _on_board(r, file) and squares[r][file] == sign * PAWN:
+        add(r, file)
+    if not _own_half(rank, red):
+        for c in (file - 1, file + 1):
+            if _on_board(rank, c) and squares[rank][c] == sign * PAWN:
+                add(rank, c)
+
+    return found
+
+
+def static_exchange(squares, source, target):
+    """
+    Returns the Exchange of a capture: both sides keep recapturing on the target square with
+    their least valuable attacker while it wins them material. Pins and checks are ignored
+    """
+    squares = [list(rank) for rank in squares]
+    captured = []
+    (source_rank, source_file), (rank, file) = source, target
+    red = squares[source_rank][source_file] > 0
+
+    captured.append(piece_value(squares[rank][file], rank))
+    mover = squares[source_rank][source_file]
+    recapture = None
+    while True:
+        squares[rank][file] = mover
+        squares[source_rank][source_file] = 0
+        red = not red
+        found = attackers(squares, rank, file, red)
+        if not found or captured[-1] >= KING_VALUE:
+            break
+        _, source_rank, source_file = min(found)
+        if recapture is None:
+            recapture = ((source_rank, source_file), (rank, file))
+        captured.append(piece_value(mover, rank))
+        mover = squares[source_rank][source_file]
+
+    # A side only makes its capture if the rest of the exchange leaves it ahead
+    gain, length = 0.0, 0
+    for value in reversed(captured):
+        if gain > 0:
+            gain, length = value - gain, length + 1
+        else:
+            gain, length = value, 1
+
+    return Exchange(gain, length, recapture if length > 1 else None)
+
+
+def line_exchange(squares, moves):
+    """
+    Returns the Exchange of the captures a line of (source, target) moves starts with, as they're
+    played: the material won by the side making the first capture up to the first quiet move
+    """
+    squares = [list(rank) for rank in squares]
+    gain, length, sign = 0.0, 0, 1
+    for (source_rank, source_file), (rank, file) in moves:
+        if not squares[rank][file]:
+            break
+        gain += sign * piece_value(squares[rank][file], rank)
+        length += 1
+        squares[rank][file] = squares[source_rank][source_file]
+        squares[source_rank][source_file] = 0
+        sign = -sign
+
+    return Exchange(gain, length, moves[1] if length > 1 else None)
+
+
+def line_captures(squares, moves):
+    """
+    Returns the piece codes captured by a line of (source, target) moves as they're played, 0 for
+    the quiet moves
+    """
+    squares = [list(rank) for rank in squares]
+    captured = []
+    for (source_rank, source_file), (rank, file) in moves:
+        captured.append(squares[rank][file])
+        squares[rank][file] = squares[source_rank][source_file]
+        squares[source_rank][source_file] = 0
+    return captured
+
+
+def _coords(board, move):
+    if board.ucci:
+        move = ucci_to_uci(move)
+    return uci_to_board_coord(move)
+
+
+def capture_exchange(board, move):
+    """
+    Returns the Exchange started by a move of the board, or None if the move is not a capture
+    """
+    source, target = _coords(board, move)
+    squares = encode_fens([board.fen])[0].tolist()
+    if not squares[target[0]][target[1]]:
+        return None
+
+    return static_exchange(squares, source, target)
+
+
+def pv_captures(board, pv):
+    """
+    Returns the piece codes captured by the moves of a PV, 0 for the quiet moves
+    """
+    squares = encode_fens([board.fen])[0].tolist()
+    return line_captures(squares, [_coords(board, move) for move in pv or []])
+
+
+def pv_exchange(board, pv):
+    """
+    Returns the Exchange started by the first move of a PV, or None if it's not a capture. The
+    static exchange ignores pins and checks, so an exchange losing material is only trusted
+    when the PV answers with the recapture it expects, otherwise the captures of the PV count
+    """
+    if not pv:
+        return None
+    moves = [_coords(board, move) for move in pv]
+    source, target = moves[0]
+    squares = encode_fens([board.fen])[0].tolist()
+    if not squares[target[0]][target[1]]:
+        return None
+
+    exchange = static_exchange(squares, source, target)
+    if exchange.gain > 0 or (len(moves) > 1 and moves[1] == exchange.recapture):
+        return exchange
+    return line_exchange(squares, moves)
@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+import numpy as np
+
+EMPTY, KING, ADVISOR, ELEPHANT, HORSE, ROOK, CANNON, PAWN = range(8)
+PIECE_CODES = {'k': KING, 'a': ADVISOR, 'b': ELEPHANT, 'e': ELEPHANT, 'n': HORSE, 'h': HORSE, 'r': ROOK,
+               'c': CANNON, 'p': PAWN}
+# Material values by piece code, pawns across the river are worth twice as much
+PIECE_VALUES = np.array([0, 0, 2, 2, 4, 9, 4.5, 1], dtype=np.float32)
+MAJOR_PIECES = (HORSE, ROOK, CANNON)
+RANKS, FILES = 10, 9
+
+# Red pieces are positive and black pieces negative, rank 0 is the black back rank
+_CODES = np.zeros(256, dtype=np.int8)
+for _letter, _code in PIECE_CODES.items():
+    _CODES[ord(_letter)] = -_code
+    _CODES[ord(_letter.upper())] = _code
+_EXPAND = str.maketrans({**{str(n): '.' * n for n in range(1, 10)}, '/': None, '+': None})
+_RANK_INDEX, _FILE_INDEX = np.indices((RANKS, FILES))
+
+# Material balance (red - black), (N, 2, 7) piece counts of red and black by piece code (king to pawn),
+# (N, 2) red and black pieces across the river and (N, 2) enemy pieces attacking the red and black king zones
+BoardFeatures = namedtuple("BoardFeatures", ["material", "counts", "across_river", "king_zone_attackers"])
+
+
+def encode_fens(fens):
+    """
+    Encodes FENs into a (N, 10, 9) int8 array of piece codes
+    """
+    placements = ''.join(fen.split(' ', 1)[0].translate(_EXPAND) for fen in fens)
+    if len(placements) % (RANKS * FILES):
+        raise ValueError('Invalid xiangqi FEN in the batch')
+
+    squares = np.frombuffer(placements.encode('ascii'), dtype=np.uint8)
+    return _CODES[squares].reshape(-1, RANKS, FILES)
+
+
+def encode_boards(boards):
+    """
+    Encodes XiangqiBoards into a (N, 10, 9) int8 array of piece codes
+    """
+    return encode_fens([board.fen for board in boards])
+
+
+def piece_counts(encoded):
+    """
+    Returns the (N, 2, 7) counts of red and black pieces by piece code
+    """
+    n = len(encoded)
+    slots = encoded.reshape(n, -1).astype(np.int64) + PAWN + np.arange(n)[:, None] * (2 * PAWN + 1)
+    counts = np.bincount(slots.ravel(), minlength=n * (2 * PAWN + 1)).reshape(n, 2 * PAWN + 1)
+    return np.stack([counts[:, PAWN + 1:], counts[:, PAWN - 1::-1]], axis=1)
+
+
+def major_piece_diff(encoded):
+    """
+    Returns the absolute difference of rooks, cannons and horses between the sides
+    """
+    counts = piece_counts(encoded)[:, :, [code - 1 for code in MAJOR_PIECES]].sum(axis=2)
+    return np.abs(counts[:, 0] - counts[:, 1])
+
+
+def material_balance(encoded):
+    """
+    Returns the weighted material of red minus the material of black
+    """
+    values = PIECE_VALUES[np.abs(encoded)]
+    crossed = (np.abs(encoded) == PAWN) & _across_river(encoded)
+    values = values + crossed * PIECE_VALUES[PAWN]
+    return (values * np.sign(encoded)).sum(axis=(1, 2))
+
+
+def _across_river(encoded):
+    red_half = _RANK_INDEX >= RANKS // 2
+    return ((encoded > 0) & ~red_half) | ((encoded < 0) & red_half)
+
+
+def king_zone_attackers(encoded):
+    """
+    Returns the (N, 2) numbers of enemy horses, rooks, cannons and pawns within two squares
+    of the red and black kings, and of enemy rooks and cannons on the file of the king
+    """
+    n = len(encoded)
+    attackers = np.zeros((n, 2), dtype=np.int64)
+    for side, sign in enumerate((1, -1)):
+        kings = (encoded == sign * KING).reshape(n, -1)
+        has_king = kings.any(axis=1)
+        king_rank, king_file = np.divmod(kings.argmax(axis=1), FILES)
+
+        enemy = -sign * encoded
+        zone = np.maximum(np.abs(_RANK_INDEX - king_rank[:, None, None]),
+                          np.abs(_FILE_INDEX - king_file[:, None, None])) <= 2
+        on_file = _FILE_INDEX == king_file[:, None, None]
+        hits = (zone & (enemy >= HORSE)) | (on_file & ((enemy == ROOK) | (enemy == CANNON)))
+        attackers[:, side] = hits.sum(axis=(1, 2)) * has_king
+
+    return attackers
+
+
+def board_features(encoded):
+    """
+    Returns the BoardFeatures of a batch of encoded boards
+    """
+    across_river = _across_river(encoded)
+    return BoardFeatures(
+        material=material_balance(encoded),
+        counts=piece_counts(encoded),
+        across_river=np.stack([(across_river & (encoded > 0)).sum(axis=(1, 2)),
+                               (across_river & (encoded < 0)).sum(axis=(1, 2))], axis=1),
+        king_zone_attackers=king_zone_attackers(encoded),
+    )
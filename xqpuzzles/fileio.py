@@ -0,0 +1,45 @@
+import bz2
+import gzip
+import io
+import lzma
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed file formats by extension, other files are plain text
+COMPRESSED_EXTENSIONS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+ZSTD_EXTENSION = '.zst'
+
+
+def _zstd_open(path, mode):
+    if zstandard is None:
+        raise ValueError(f'Install the zstandard module to read or write {path}')
+
+    raw = open(path, mode[0] + 'b')
+    if mode[0] == 'r':
+        stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+    else:
+        stream = zstandard.ZstdCompressor().stream_writer(raw, closefd=True)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8', newline='')
+
+
+def open_file(path, mode='r'):
+    """
+    Opens a text file for streaming, compressed or decompressed on the fly when its
+    extension is .gz, .bz2, .xz or .zst. Appending to a compressed file adds a new stream.
+    With a binary mode ('rb'), the decompressed bytes are read
+    """
+    for extension, open_compressed in COMPRESSED_EXTENSIONS.items():
+        if path.endswith(extension):
+            if 'b' in mode:
+                return open_compressed(path, mode)
+            return open_compressed(path, mode + 't', encoding='utf-8', newline='')
+    if path.endswith(ZSTD_EXTENSION):
+        return _zstd_open(path, mode)
+    if 'b' in mode:
+        return open(path, mode)
+    return open(path, mode, newline='')
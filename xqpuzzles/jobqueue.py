@@ -0,0 +1,316 @@
+import csv
+import itertools
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from xqpuzzles.archive import ARCHIVE_EXTENSION, GameArchive
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import SHARD_LEASE, SHARD_ATTEMPTS, SHARD_RETRY_DELAY
+from xqpuzzles.fileio import open_file
+from xqpuzzles.logger import log
+from xqpuzzles.utils import open_games
+
+# The byte offset is the position of the first game row of a shard in the (decompressed) games CSV file,
+# it's NULL for game archives. The lease_until of a pending shard delays its retry after a failure
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    byte_offset INTEGER,
+    max_attempts INTEGER NOT NULL DEFAULT 3
+)
+'''
+# Columns added to the queues created by earlier versions
+MIGRATIONS = {
+    'byte_offset': 'ALTER TABLE shards ADD COLUMN byte_offset INTEGER',
+    'max_attempts': 'ALTER TABLE shards ADD COLUMN max_attempts INTEGER NOT NULL DEFAULT 3',
+}
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def csv_shards(path, shard_size):
+    """
+    Yields the (start, stop, byte offset) of the shards of a games CSV file
+    """
+    with open_file(path, 'rb') as file:
+        position = 0
+
+        def lines():
+            nonlocal position
+            for line in iter(file.readline, b''):
+                position += len(line)
+                yield line.decode('utf-8')
+
+        # The reader takes the lines of a row only, the position is the end of the last read row
+        reader = csv.reader(lines())
+        next(reader, None)
+        games_count, start, offset = 0, 0, position
+        for _ in reader:
+            games_count += 1
+            if games_count - start == shard_size:
+                yield start, games_count, offset
+                start, offset = games_count, position
+        if games_count > start:
+            yield start, games_count, offset
+
+
+@contextmanager
+def open_shard(source, start, stop, offset=None):
+    """
+    Yields an iterator of the game rows of a shard, read from the shard's game index or byte offset
+    """
+    if source.endswith(ARCHIVE_EXTENSION):
+        with GameArchive(source) as archive:
+            yield (archive[i] for i in range(start, stop))
+    elif offset is None:
+        # Shards enqueued without their offset
+        with open_games(source) as games:
+            yield itertools.islice(games, start, stop)
+    else:
+        with open_file(source, 'rb') as file:
+            header = next(csv.reader([file.readline().decode('utf-8')]))
+            file.seek(offset)
+            lines = (line.decode('utf-8') for line in iter(file.readline, b''))
+            yield itertools.islice(csv.DictReader(lines, fieldnames=header), stop - start)
+
+
+class JobQueue(object):
+    """ Shards of game corpora in a SQLite file, workers on any host with access to the file
+        lease shards, keep their lease alive with heartbeats and record the shard outputs.
+        A lease which is not renewed expires and the shard is leased again by another worker
+    """
+    def __init__(self, path, lease=SHARD_LEASE):
+        self.path = path
+        self.lease = lease
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute(SCHEMA)
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(shards)')}
+        for column, migration in MIGRATIONS.items():
+            if column not in columns:
+                self.db.execute(migration)
+
+    def enqueue(self, source, shard_size, max_attempts=SHARD_ATTEMPTS):
+        """
+        Splits the games of a CSV file or game archive into shards, returns the number of new shards.
+        A shard whose scan fails `max_attempts` times is failed
+        """
+        if source.endswith(ARCHIVE_EXTENSION):
+            with GameArchive(source) as archive:
+                games_count = len(archive)
+            shards = [(start, min(start + shard_size, games_count), None)
+                      for start in range(0, games_count, shard_size)]
+        else:
+            shards = list(csv_shards(source, shard_size))
+
+        source = os.path.abspath(source)
+        rows = [(source, start, stop, offset, max_attempts) for start, stop, offset in shards]
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany('INSERT INTO shards (source, start, stop, byte_offset, max_attempts) '
+                                'VALUES (?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def lease_shard(self, worker):
+        """
+        Leases a pending (or expired) shard to the worker and returns its (id, source, start, stop, byte offset)
+        or None. Expired shards which used all their attempts are failed instead
+        """
+        now = time.time()
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.execute('UPDATE shards SET status = ?, worker = NULL, lease_until = NULL '
+                            'WHERE status = ? AND lease_until < ? AND attempts >= max_attempts', (FAILED, LEASED, now))
+            shard = self.db.execute(
+                'SELECT id, source, start, stop, byte_offset FROM shards '
+                'WHERE (status = ? AND (lease_until IS NULL OR lease_until < ?)) OR (status = ? AND lease_until < ?) '
+                'ORDER BY id LIMIT 1', (PENDING, now, LEASED, now)).fetchone()
+            if shard:
+                self.db.execute('UPDATE shards SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 '
+                                'WHERE id = ?', (LEASED, worker, now + self.lease, shard[0]))
+        return shard
+
+    def heartbeat(self, shard_id, worker):
+        """
+        Renews the lease of a shard, returns False if the worker doesn't own the shard anymore
+        """
+        with self.db:
+            cursor = self.db.execute('UPDATE shards SET lease_until = ? WHERE id = ? AND status = ? AND worker = ?',
+                                     (time.time() + self.lease, shard_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, worker, output):
+        with self.db:
+            cursor = self.db.execute('UPDATE shards SET status = ?, output = ?, lease_until = NULL '
+                                     'WHERE id = ? AND status = ? AND worker = ?',
+                                     (DONE, output, shard_id, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def release(self, shard_id, worker, failed=True, retry_delay=SHARD_RETRY_DELAY):
+        """
+        Gives a shard whose scan failed back to the queue, it's leased again once `retry_delay` seconds
+        per attempt passed, or failed when it used all its attempts. A shard whose scan was
+        stopped (not failed) is pending again right away and the attempt isn't counted
+        """
+        with self.db:
+            if not failed:
+                self.db.execute('UPDATE shards SET status = ?, worker = NULL, lease_until = NULL, '
+                                'attempts = attempts - 1 WHERE id = ? AND status = ? AND worker = ?',
+                                (PENDING, shard_id, LEASED, worker))
+                return
+            self.db.execute('UPDATE shards SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, '
+                            'worker = NULL, lease_until = ? + attempts * ? WHERE id = ? AND status = ? AND worker = ?',
+                            (FAILED, PENDING, time.time(), retry_delay, shard_id, LEASED, worker))
+
+    def progress(self):
+        """
+        Returns the number of shards by status
+        """
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(self.db.execute('SELECT status, COUNT(*) FROM shards GROUP BY status').fetchall())
+        return counts
+
+    def outputs(self):
+        return [row[0] for row in self.db.execute('SELECT output FROM shards WHERE status = ? ORDER BY id', (DONE,))]
+
+    def close(self):
+        self.db.close()
+
+
+class Heartbeat(threading.Thread):
+    """ Renews the lease of a shard until stopped, `lost` is set when the lease was taken over
+    """
+    def __init__(self, queue_path, shard_id, worker, lease):
+        super().__init__(daemon=True)
+        self.queue_path = queue_path
+        self.shard_id = shard_id
+        self.worker = worker
+        self.lease = lease
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+
+    def run(self):
+        # SQLite connections can't be shared between threads
+        queue = JobQueue(self.queue_path, self.lease)
+        try:
+            while not self.stopped.wait(self.lease / 3):
+                if not queue.heartbeat(self.shard_id, self.worker):
+                    self.lost.set()
+                    return
+        except sqlite3.Error:
+            logging.exception('Heartbeat failed')
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(queue_path, shards_dir, scan, lease=SHARD_LEASE, poll=None):
+    """
+    Leases shards and scans them until all shards are done. `scan(games, out_csv)` scans an
+    iterator of game rows into the output CSV and returns early when `games` is exhausted. When
+    it returns False, the scan was stopped (i.e. by a time budget): the shard is given back to
+    the queue and the worker stops
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    queue = JobQueue(queue_path, lease)
+    worker = worker_name()
+    poll = poll or lease / 3
+    try:
+        while True:
+            shard = queue.lease_shard(worker)
+            if shard is None:
+                progress = queue.progress()
+                if not progress[PENDING] and not progress[LEASED]:
+                    return
+                # Other workers hold the remaining shards, wait in case their leases expire
+                time.sleep(poll)
+                continue
+
+            shard_id, source, start, stop, offset = shard
+            log(Color.YELLOW, f"Scanning shard {shard_id}: games {start}-{stop} of {source}")
+            # Outputs are named after their worker, a worker whose lease expired can't overwrite the output
+            # of the worker which took the shard over
+            output = os.path.join(shards_dir, 'shard-%06d.%s.csv' % (shard_id, worker.replace(':', '-')))
+            partial = output + '.partial'
+            heartbeat = Heartbeat(queue_path, shard_id, worker, lease)
+            heartbeat.start()
+            try:
+                with open_shard(source, start, stop, offset) as games:
+                    finished = scan(itertools.takewhile(lambda _: not heartbeat.lost.is_set(), games), partial)
+            except Exception:
+                logging.exception(f'Failed to scan shard {shard_id}')
+                heartbeat.stop()
+                queue.release(shard_id, worker)
+                if os.path.exists(partial):
+                    os.unlink(partial)
+                continue
+            heartbeat.stop()
+
+            if finished is False:
+                log(Color.YELLOW, f"Scan stopped, giving shard {shard_id} back to the queue")
+                queue.release(shard_id, worker, failed=False)
+                if os.path.exists(partial):
+                    os.unlink(partial)
+                return
+            if heartbeat.lost.is_set():
+                logging.warning(f'Lease of shard {shard_id} expired, dropping its output')
+            elif os.path.exists(partial):
+                os.replace(partial, output)
+                if not queue.complete(shard_id, worker, output):
+                    logging.warning(f'Lease of shard {shard_id} expired, dropping its output')
+                    os.unlink(output)
+            else:
+                # No puzzles in this shard
+                queue.complete(shard_id, worker, None)
+            if os.path.exists(partial):
+                os.unlink(partial)
+    finally:
+        queue.close()
+
+
+def merge(queue_path, out_csv):
+    """
+    Combines the outputs of done shards into one CSV file, returns the number of merged shards
+    """
+    queue = JobQueue(queue_path)
+    try:
+        progress = queue.progress()
+        if progress[PENDING] or progress[LEASED]:
+            logging.warning('%d shards are not done yet', progress[PENDING] + progress[LEASED])
+        if progress[FAILED]:
+            logging.warning('%d shards failed, their games are missing', progress[FAILED])
+
+        outputs = [output for output in queue.outputs() if output]
+        with open_file(out_csv, 'w') as f:
+            writer = None
+            for output in outputs:
+                with open_file(output) as shard:
+                    reader = csv.reader(shard)
+                    header = next(reader, None)
+                    if header is None:
+                        continue
+                    if writer is None:
+                        writer = csv.writer(f)
+                        writer.writerow(header)
+                    writer.writerows(reader)
+        return len(outputs)
+    finally:
+        queue.close()
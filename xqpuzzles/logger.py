@@ -1,9 +1,12 @@
 import re
 import sys
 import logging
+from typing import TYPE_CHECKING
 
 from xqpuzzles.colors import Color
-from xqpuzzles.xqboard import XiangqiBoard
+
+if TYPE_CHECKING:
+    from xqpuzzles.xqboard import XiangqiBoard
 
 PROGRESS = 15
 ENGINE = 5
@@ -16,7 +19,7 @@ def configure_logging(level=logging.DEBUG):
 def log(color: str, message: str):
     logging.debug(color + message + Color.ENDC)
 
-def log_board(board: XiangqiBoard, unicode_pieces=True):
+def log_board(board: 'XiangqiBoard', unicode_pieces=True):
     """ Logs the fen string and board representation
     """
     log(Color.VIOLET, board.fen)
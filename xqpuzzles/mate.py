@@ -0,0 +1,98 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import DEFAULT_DEPTH, MAX_MATE_MOVES, MATE_MOVETIME, MATE_REFUTE_NODES, MATE_PROOF_CACHE
+from xqpuzzles.logger import log
+
+# The shortest forced mate found for the side to move, its first move and PV, if no other
+# first move mates as fast and the search trace of the mate
+MateProof = namedtuple("MateProof", ["mate", "move", "pv", "unique", "trace"])
+
+# Proofs by position, a position without a forced mate has a None proof. The daemon verifies
+# mates from several threads
+_proofs = OrderedDict()
+_proofs_lock = threading.Lock()
+
+
+def _mate_for_side_to_move(board, analysis):
+    if analysis is None or not analysis.score.is_mate():
+        return None
+
+    mate = analysis.score.mate() * (1 if board.turn else -1)
+    return mate if mate > 0 else None
+
+
+def _mate_limits(engine):
+    if engine.nodes:
+        return {'nodes': engine.nodes}
+    return {'movetime': MATE_MOVETIME}
+
+
+def _proof(board, analyses, max_mate):
+    """
+    Returns the proof from the analyses of the two best first moves
+    """
+    best = analyses[0] if analyses else None
+    mate = _mate_for_side_to_move(board, best)
+    if not mate or mate > max_mate:
+        return None
+
+    second_mate = _mate_for_side_to_move(board, analyses[1]) if len(analyses) > 1 else None
+    return MateProof(mate, best.move, best.pv, second_mate is None or second_mate > mate, best.trace)
+
+
+def prove_mate(engine, board, max_mate=MAX_MATE_MOVES, mate=None):
+    """
+    Finds the shortest forced mate for the side to move with mate searches (`go mate N`), starting
+    from the expected mate (i.e. the mate found by the scan) or max_mate. Once a mate is found, every
+    search for a shorter mate is stopped after MATE_REFUTE_NODES nodes. If the mate searches find
+    nothing the position is searched deeper (iterative deepening keeping the hash) instead.
+    Returns a MateProof or None when there is no forced mate within max_mate moves
+    """
+    searches = 0
+
+    def search(**limits):
+        nonlocal searches
+        searches += 1
+        # The hash is only cleared before the first search of the position
+        return engine.search(board, multipv=2, new_game=searches == 1, **limits)
+
+    proof = None
+    mate = min(mate or max_mate, max_mate)
+    limits = _mate_limits(engine)
+    while mate > 0:
+        shorter = _proof(board, search(mate=mate, **limits), mate)
+        if shorter is None:
+            break
+        proof = shorter
+        mate = proof.mate - 1
+        limits = {'nodes': MATE_REFUTE_NODES}
+
+    if proof is None:
+        for depth in range(DEFAULT_DEPTH + 2, DEFAULT_DEPTH + 10, 2):
+            proof = _proof(board, search(depth=depth, **_mate_limits(engine)), max_mate)
+            if proof is not None:
+                break
+
+    return proof
+
+
+def verify_mate(engine, board, max_mate=MAX_MATE_MOVES, mate=None):
+    """
+    Returns the cached or new MateProof of a position, the expected mate is the first one searched
+    """
+    key = ' '.join(board.fen.split()[:2])
+    with _proofs_lock:
+        if key in _proofs:
+            _proofs.move_to_end(key)
+            return _proofs[key]
+
+    log(Color.DIM, "Verifying mate of %s..." % board.fen)
+    proof = prove_mate(engine, board, max_mate, mate)
+    with _proofs_lock:
+        _proofs[key] = proof
+        if len(_proofs) > MATE_PROOF_CACHE:
+            _proofs.popitem(last=False)
+
+    return proof
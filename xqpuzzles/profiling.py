@@ -0,0 +1,156 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from xqpuzzles import cmd
+from xqpuzzles.colors import Color
+from xqpuzzles.logger import log
+
+SAMPLING, DETERMINISTIC = 'sampling', 'deterministic'
+# Leaf frame added to the stacks sampled while waiting for the engine output
+ENGINE_WAIT_FRAME = '[engine wait]'
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return '%s:%s' % (os.path.basename(code.co_filename), code.co_name)
+
+
+class Sampler(threading.Thread):
+    """ Samples the stack of a thread at a fixed interval and counts the collapsed stacks
+    """
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            stack = []
+            waiting = False
+            while frame is not None:
+                if frame.f_code is cmd.recv.__code__:
+                    waiting = True
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.reverse()
+            if waiting:
+                stack.append(ENGINE_WAIT_FRAME)
+            self.stacks[';'.join(stack)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+class Profiler(object):
+    """ Profiles a scan in the current process. The sampling mode writes the collapsed stacks
+        (PREFIX.folded, for flamegraph.pl or speedscope) and the deterministic mode a pstats file
+        (PREFIX.prof). Both write a summary (PREFIX.txt) of the hot functions and of the time
+        spent waiting for the engine (cmd.recv) apart from the Python CPU time
+    """
+    def __init__(self, prefix, mode=SAMPLING, interval=0.005, trace_memory=False, top=25):
+        self.prefix = prefix
+        self.mode = mode
+        self.interval = interval
+        self.trace_memory = trace_memory
+        self.top = top
+        self.profile = None
+        self.sampler = None
+        self.snapshot = None
+        self.memory_growth = []
+
+    def __enter__(self):
+        cmd.RECV_STATS = {'calls': 0, 'seconds': 0.0}
+        if self.trace_memory:
+            tracemalloc.start()
+            self.snapshot = tracemalloc.take_snapshot()
+
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.mode == DETERMINISTIC:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        else:
+            self.sampler = Sampler(threading.get_ident(), self.interval)
+            self.sampler.start()
+        return self
+
+    def game_boundary(self, game_id):
+        """
+        Records the memory allocated since the previous game when tracing memory
+        """
+        if not self.trace_memory:
+            return
+
+        snapshot = tracemalloc.take_snapshot()
+        growth = sum(stat.size_diff for stat in snapshot.compare_to(self.snapshot, 'filename'))
+        self.memory_growth.append((game_id, growth, snapshot.compare_to(self.snapshot, 'lineno')[:3]))
+        self.snapshot = snapshot
+
+    def __exit__(self, *args):
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        recv_stats, cmd.RECV_STATS = cmd.RECV_STATS, None
+
+        summary = io.StringIO()
+        summary.write('Wall time: %.2fs, Python CPU time: %.2fs\n' % (wall, cpu))
+        summary.write('Engine wait (cmd.recv): %.2fs over %d lines (%.1f%% of wall time)\n\n' % (
+            recv_stats['seconds'], recv_stats['calls'], 100.0 * recv_stats['seconds'] / max(wall, 1e-9)))
+
+        if self.profile is not None:
+            self.profile.dump_stats(self.prefix + '.prof')
+            stats = pstats.Stats(self.profile, stream=summary)
+            stats.sort_stats('tottime').print_stats(self.top)
+        else:
+            self._write_samples(summary)
+
+        if self.memory_growth:
+            summary.write('\nMemory growth per game (tracemalloc):\n')
+            for game_id, growth, top_lines in self.memory_growth:
+                summary.write('%s: %+d bytes\n' % (game_id, growth))
+                for stat in top_lines:
+                    summary.write('    %s\n' % stat)
+            tracemalloc.stop()
+
+        with open(self.prefix + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        log(Color.YELLOW, "Profile written to %s.*" % self.prefix)
+        log(Color.DIM, summary.getvalue())
+
+    def _write_samples(self, summary):
+        with open(self.prefix + '.folded', 'w') as f:
+            for stack, count in self.sampler.stacks.most_common():
+                f.write('%s %d\n' % (stack, count))
+
+        total = sum(self.sampler.stacks.values()) or 1
+        own = collections.Counter()
+        cumulative = collections.Counter()
+        for stack, count in self.sampler.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for frame in set(frames):
+                cumulative[frame] += count
+
+        summary.write('%d samples every %.1fms\n\nTop functions (own time):\n' % (total, self.interval * 1000))
+        for frame, count in own.most_common(self.top):
+            summary.write('%6.1f%%  %s\n' % (100.0 * count / total, frame))
+        summary.write('\nTop functions (cumulative time):\n')
+        for frame, count in cumulative.most_common(self.top):
+            summary.write('%6.1f%%  %s\n' % (100.0 * count / total, frame))
@@ -1,65 +1,308 @@
-from chess.engine import Score
+import itertools
+import logging
+import time
+
+from chess.engine import Mate, Score
 
 from xqpuzzles.logger import log, log_move
 from xqpuzzles.colors import Color
-from xqpuzzles.constants import DEFAULT_DEPTH
-from xqpuzzles.utils import get_material_diff
-from xqpuzzles.xqboard import XiangqiBoard
+from xqpuzzles.constants import DEFAULT_DEPTH, MIN_SCORE_SWING, MAX_WINNING_SCORE, MAX_MATE_MOVES
+from xqpuzzles.criteria import Criteria
+from xqpuzzles.exchange import pv_captures, pv_exchange
+from xqpuzzles.features import MAJOR_PIECES, encode_boards, encode_fens, major_piece_diff
+from xqpuzzles.mate import verify_mate
+from xqpuzzles.xqboard import InvalidMove, XiangqiBoard, game_boards
+
+TIME, NODES, PLIES = 'time', 'nodes', 'plies'
+# FEN letters of the horses, rooks and cannons
+
+
+class GameBudgetExceeded(Exception):
+
+    def __init__(self, reason, ply):
+        super().__init__('%s budget exceeded at ply %d' % (reason, ply))
+        self.reason = reason
+        self.ply = ply
 
 
-def find_puzzle_candidates(engine, moves, scan_depth=DEFAULT_DEPTH, skip_initial=5):
+def analyse(engine, board, cache=None):
     """
-    finds puzzle candidates from a xiangqi game
+    Returns the best move of a position from the evaluation cache or from the engine,
+    and whether it came from the cache
+    """
+    if cache is not None:
+        analysis = cache.get(board)
+        if analysis is not None:
+            return analysis, True
+
+    analysis = engine.best_move(board)
+    if cache is not None:
+        cache.put(board, analysis)
+
+    return analysis, False
+
+
+def refresh_puzzle(engine, board, analysis, cached, classify):
+    """
+    Returns the analysis and puzzle of a position, searched again when a cached analysis makes
+    it a puzzle: cached PVs are truncated and the cache ignores the moves leading to the
+    position (repetitions), so puzzles are only built from the search of their own game
+    """
+    puzzle = classify(analysis)
+    if puzzle and cached:
+        analysis = engine.best_move(board)
+        puzzle = classify(analysis)
+    return analysis, puzzle
+
+
+def find_puzzle_candidates(engine, moves, scan_depth=DEFAULT_DEPTH, skip_initial=5, criteria=Criteria(),
+                           timeline=None, cache=None, validator=None, budget=None, found=None):
+    """
+    finds puzzle candidates from a xiangqi game, the analysis of every scanned
+    position is appended to the given timeline list. The candidates are re-checked
+    by the CrossValidator while the game is scanned. GameBudgetExceeded is raised
+    once the game uses more than its GameBudget and InvalidMove once the positions
+    before an invalid move are scanned. The puzzles are also appended to the given
+    found list, which keeps the puzzles found before the game failed
     """
     log(Color.DIM, "Scanning game moves for puzzles (depth: %d)..." % scan_depth)
-    puzzles = []
+    if budget is not None and budget.plies and len(moves) > budget.plies:
+        raise GameBudgetExceeded(PLIES, budget.plies + 1)
+    started, nodes = time.monotonic(), 0
 
+    # Replay the whole game first, a game with an invalid move is scanned up to that move
     board = XiangqiBoard(ucci=engine.is_ucci())
-    board.push(moves[:skip_initial])
-
-    prev_score = engine.best_move(board).score
-
-    for move in moves[skip_initial:]:
-        next_board = board.copy()
-        next_board.push([move])
-
-        cur_analysis = engine.best_move(next_board)
-        cur_score = cur_analysis.score
-
-        turn = 'RED' if next_board.turn else 'BLACK'
-        highlight_move = False
-        if get_material_diff(next_board) < 3 and (is_capturing_pos(prev_score, cur_score, next_board)
-                                                  or is_mate_pos(cur_score, next_board)):
-            highlight_move = True
-            puzzle = {
-                'first_turn': turn,
-                'pv': cur_analysis.pv,
-                'fen': next_board.fen,
-                'score': cur_score,
-                'theme': get_theme(next_board, cur_analysis),
-                'moves_count': get_puzzle_moves_count(next_board, cur_analysis)
-            }
-            puzzles.append(puzzle)
-
-        log_move(turn, move, cur_score, highlight=highlight_move)
-        prev_score = cur_score
-        board = next_board
+    invalid = None
+    try:
+        boards = game_boards(board, moves)
+    except InvalidMove as exp:
+        if exp.ply is None or exp.ply <= skip_initial:
+            raise
+        invalid = exp
+        boards = game_boards(board, moves[:exp.ply - 1])
+    if skip_initial and boards:
+        board = boards[min(skip_initial, len(boards)) - 1]
+    boards = boards[skip_initial:]
+
+    puzzles = []
+    try:
+        prev_analysis, _ = analyse(engine, board, cache)
+        if timeline is not None:
+            timeline.append(prev_analysis)
+        prev_score = prev_analysis.score
+
+        # Gate the positions of the whole game at once
+        material_diffs = major_piece_diff(encode_boards(boards)) if boards else []
 
+        for ply, move, next_board, material_diff in zip(itertools.count(skip_initial + 1), moves[skip_initial:],
+                                                        boards, material_diffs):
+            cur_analysis, cached = analyse(engine, next_board, cache)
+            cur_analysis, puzzle = refresh_puzzle(
+                engine, next_board, cur_analysis, cached,
+                lambda analysis: classify_position(prev_score, next_board, analysis, criteria, material_diff))
+            if timeline is not None:
+                timeline.append(cur_analysis)
+            cur_score = cur_analysis.score
+            if budget is not None:
+                nodes += cur_analysis.nodes or 0
+                check_budget(budget, started, nodes, ply)
+
+            turn = 'RED' if next_board.turn else 'BLACK'
+            if puzzle and puzzle['theme'] == 'CHECKMATE' and criteria.verify_mates:
+                puzzle = verify_mate_puzzle(engine, next_board, puzzle, criteria)
+            if puzzle and validator is not None:
+                puzzles.append(validator.submit(next_board, puzzle))
+            elif puzzle:
+                puzzles.append(puzzle)
+
+            log_move(turn, move, cur_score, highlight=puzzle is not None)
+            prev_score = cur_score
+
+        if invalid is not None:
+            raise invalid
+    except Exception:
+        if found is not None:
+            found.extend(validated(puzzles, validator, failed=True))
+        raise
+
+    puzzles = validated(puzzles, validator)
+    if found is not None:
+        found.extend(puzzles)
     return puzzles
 
 
-def is_mate_pos(a: Score, board) -> bool:
+def validated(puzzles, validator, failed=False):
+    """
+    Returns the puzzles kept by the CrossValidator, given the puzzles or their futures. The
+    puzzles of a failed game whose validation failed are dropped
+    """
+    if validator is None:
+        return puzzles
+
+    kept = []
+    for future in puzzles:
+        try:
+            puzzle = future.result()
+        except Exception:
+            if not failed:
+                raise
+            logging.exception('Validation of a puzzle of a failed game failed')
+            continue
+        if puzzle:
+            kept.append(puzzle)
+    return kept
+
+
+def check_budget(budget, started, nodes, ply):
+    if budget.seconds and time.monotonic() - started > budget.seconds:
+        raise GameBudgetExceeded(TIME, ply)
+    if budget.nodes and nodes > budget.nodes:
+        raise GameBudgetExceeded(NODES, ply)
+
+
+def classify_position(prev_score: Score, board, analysis, criteria=Criteria(), material_diff=None):
+    """
+    Returns the puzzle of a position given its analysis and the score before
+    the last move, or None if the position is not a puzzle. The difference of
+    major pieces is computed from the board unless it's given
+    """
+    cur_score = analysis.score
+    if material_diff is None:
+        material_diff = major_piece_diff(encode_fens([board.fen]))[0]
+    if material_diff >= criteria.max_material_diff:
+        return None
+
+    if not (is_capturing_pos(prev_score, cur_score, board, criteria.min_swing, criteria.max_score)
+            or is_mate_pos(cur_score, board, criteria.max_mate)):
+        return None
+
+    return make_puzzle(board, analysis)
+
+
+def make_puzzle(board, analysis):
+    """
+    Returns the puzzle of a position, or None if its first move is a capture which doesn't win material
+    """
+    exchange, captures = None, None
+    if not analysis.score.is_mate():
+        exchange = pv_exchange(board, analysis.pv)
+        # A quiet first move is measured by the captures of the PV, walked once for both
+        captures = pv_captures(board, analysis.pv) if exchange is None else None
+    moves_count = get_puzzle_moves_count(board, analysis, exchange, captures)
+    if not moves_count:
+        log(Color.DIM, "Dropped capturing puzzle: %s doesn't win material" % analysis.move)
+        return None
+
+    return {
+        'first_turn': 'RED' if board.turn else 'BLACK',
+        'pv': analysis.pv,
+        'fen': board.fen,
+        'score': analysis.score,
+        'theme': get_theme(board, analysis, exchange, moves_count, captures),
+        'moves_count': moves_count,
+        'difficulty': estimate_difficulty(analysis.trace),
+    }
+
+
+def find_position_puzzle(engine, board, criteria=Criteria(), cache=None, validator=None):
+    """
+    Returns the puzzle of a single position, or None if the position is not a puzzle
+    """
+    analysis, cached = analyse(engine, board, cache)
+    analysis, puzzle = refresh_puzzle(engine, board, analysis, cached,
+                                      lambda analysis: classify_single_position(board, analysis, criteria))
+    if puzzle and puzzle['theme'] == 'CHECKMATE' and criteria.verify_mates:
+        puzzle = verify_mate_puzzle(engine, board, puzzle, criteria)
+    if puzzle and validator is not None:
+        puzzle = validator.submit(board, puzzle).result()
+
+    return puzzle
+
+
+def classify_single_position(board, analysis, criteria=Criteria()):
+    """
+    Returns the puzzle of a position without the score before the last move: the side to
+    move mates or its best move is a capture winning at least the minimum score swing
+    """
+    if major_piece_diff(encode_fens([board.fen]))[0] >= criteria.max_material_diff:
+        return None
+
+    if not (is_mate_pos(analysis.score, board, criteria.max_mate)
+            or is_winning_capture(board, analysis, criteria.min_swing, criteria.max_score)):
+        return None
+
+    return make_puzzle(board, analysis)
+
+
+def is_winning_capture(board, analysis, min_swing=MIN_SCORE_SWING, max_score=MAX_WINNING_SCORE) -> bool:
+    """
+    Returns whether the best move is a capture whose exchange wins at least the minimum score
+    swing, with the side to move ahead by at most the maximum winning score after it
+    """
+    cp = analysis.score.score()
+    if cp is None or not analysis.move:
+        return False
+
+    sign = 1 if board.turn else -1
+    if not 0 < sign * cp <= max_score:
+        return False
+
+    # The material actually won, a position which was already won doesn't make the capture a puzzle
+    exchange = pv_exchange(board, analysis.pv or [analysis.move])
+    return exchange is not None and exchange.gain * 100 >= min_swing
+
+
+def estimate_difficulty(trace):
+    """
+    Returns the difficulty of a puzzle from the per-depth trace of its search: the depth from
+    which the engine kept the first move of the solution, plus a point per pawn the score swung
+    over the depths (up to 10). None without a trace
+    """
+    if not trace:
+        return None
+
+    solution = trace[-1][1]
+    stable_depth = trace[-1][0]
+    for depth, move, _, _ in reversed(trace):
+        if move != solution:
+            break
+        stable_depth = depth
+
+    scores = [score.score(mate_score=MAX_WINNING_SCORE) for _, _, score, _ in trace]
+    swing = min(max(scores) - min(scores), 1000)
+    return round(stable_depth + swing / 100.0, 1)
+
+
+def verify_mate_puzzle(engine, board, puzzle, criteria=Criteria()):
+    """
+    Returns the checkmate puzzle sized by its proven shortest mate, or None if the
+    mate is not forced or the first move is not unique
+    """
+    score = puzzle['score']
+    mate = score.mate() * (1 if board.turn else -1) if score.is_mate() else None
+    proof = verify_mate(engine, board, criteria.max_mate, mate if mate and mate > 0 else None)
+    if proof is None or not proof.unique:
+        log(Color.DIM, "Dropped checkmate puzzle: %s" % (
+            'no forced mate' if proof is None else 'first move not unique'))
+        return None
+
+    # The puzzle is described by the proof instead of the scan search
+    return dict(puzzle, pv=proof.pv, moves_count=proof.mate, score=Mate(proof.mate if board.turn else -proof.mate),
+                difficulty=estimate_difficulty(proof.trace))
+
+
+def is_mate_pos(a: Score, board, max_mate=MAX_MATE_MOVES) -> bool:
     if not a.is_mate():
         return False
 
     mate = a.mate() * (1 if board.turn else -1)
-    if 0 < mate <= 10:
+    if 0 < mate <= max_mate:
         return True
 
     return False
 
 
-def is_capturing_pos(a: Score, b: Score, b_board) -> bool:
+def is_capturing_pos(a: Score, b: Score, b_board, min_swing=MIN_SCORE_SWING, max_score=MAX_WINNING_SCORE) -> bool:
     """
     Find if a given position could be capturing puzzle or not
     """
@@ -70,39 +313,55 @@ def is_capturing_pos(a: Score, b: Score, b_board) -> bool:
         return False
 
     b_sign = 1 if b_board.turn else -1
-    if abs(b_cp - a_cp) >= 400 and 0 < (b_sign * b_cp) <= 2000:
+    if abs(b_cp - a_cp) >= min_swing and 0 < (b_sign * b_cp) <= max_score:
         return True
 
     return False
 
 
-def get_theme(board, analysis):
+def get_theme(board, analysis, exchange=None, moves_count=None, captures=None):
+    """
+    Returns CHECKMATE for mates, CAPTURING when the first move starts an exchange winning material
+    or a move of the solution captures a major piece, and MIDGAME for the other quiet solutions.
+    The captures of the PV are computed unless they're given
+    """
     if analysis.score.is_mate():
         return 'CHECKMATE'
+    if exchange is not None:
+        return 'CAPTURING' if exchange.gain > 0 else 'MIDGAME'
 
-    # TODO: the puzzles could be Capturing if it the sequence of moves can capture any main pieces
-    # otherwise, it'll be considered as mid-game puzzle
-    return 'CAPTURING'
+    if captures is None:
+        captures = pv_captures(board, analysis.pv)
+    # The moves of the side to move are every other move of the PV
+    if any(abs(code) in MAJOR_PIECES for code in captures[:2 * (moves_count or 1) - 1:2]):
+        return 'CAPTURING'
+    return 'MIDGAME'
 
 
-def get_puzzle_moves_count(cur_board, analysis):
+def get_puzzle_moves_count(cur_board, analysis, exchange=None, captures=None):
+    """
+    Returns the number of moves of the solution: the mate length, the captures of the
+    exchange started by the first move (0 if it doesn't win material) or, when the first
+    move is not a capture, the moves up to the end of the first captures of the PV. The
+    exchange and the captures are computed from the PV unless they're given
+    """
     score = analysis.score
     if score.is_mate():
         return abs(score.mate())
 
-    board = cur_board.copy()
-    pv_captured = []
-    for move in analysis.pv:
-        pv_captured.append(board.get_captured_piece(move, is_ucci=board.ucci))
-        board.push([move], is_ucci=board.ucci)
+    if exchange is None:
+        exchange = pv_exchange(cur_board, analysis.pv)
+    if exchange is not None:
+        return (exchange.length + 1) // 2 if exchange.gain > 0 else 0
 
-    pv_size = len(pv_captured)
-    last_captured = ' '
-    for move_no in range(1, pv_size + 1, 2):
-        if last_captured != ' ' and pv_captured[move_no - 1] == ' ':
-            return (move_no - 1) // 2
+    if captures is None:
+        captures = pv_captures(cur_board, analysis.pv)
+    last_captured = 0
+    for ply in range(0, len(captures), 2):
+        if last_captured and not captures[ply]:
+            return ply // 2
 
-        last_captured = pv_captured[move_no - 1]
+        last_captured = captures[ply]
 
     # Default number of moves will be fixed
     return 2
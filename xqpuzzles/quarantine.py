@@ -0,0 +1,67 @@
+import json
+import os
+
+from xqpuzzles.colors import Color
+from xqpuzzles.fileio import open_file
+from xqpuzzles.logger import log
+from xqpuzzles.puzzle_finder import NODES, PLIES, TIME
+from xqpuzzles.scanner import INVALID_MOVE
+
+# A quarantine file is one JSON line per game which couldn't be scanned:
+#   {"id": <game id>, "ply": <ply of the failing position or null>, "reason": <reason>, "message": <error>}
+# Only the games failing for a reason which repeats on every scan are quarantined: invalid moves and
+# the GameBudget reasons of puzzle_finder. A lost or hung engine, or another error, may not repeat
+QUARANTINED_REASONS = (INVALID_MOVE, PLIES, TIME, NODES)
+
+
+class Quarantine(object):
+    """
+    The games which had invalid moves or ran out of budget in earlier scans, they're skipped by later scans
+    """
+
+    def __init__(self, path):
+        self.game_ids = set()
+        if os.path.isfile(path):
+            with open_file(path) as file:
+                for line in file:
+                    if line.strip():
+                        self.game_ids.add(str(json.loads(line)['id']))
+        self.file = open_file(path, 'a')
+
+    def __contains__(self, game_id):
+        return str(game_id) in self.game_ids
+
+    def skip(self, games):
+        """
+        Yields the game rows which aren't quarantined
+        """
+        skipped = 0
+        for game in games:
+            if game['id'] in self:
+                skipped += 1
+                continue
+            yield game
+        if skipped:
+            log(Color.DIM, f"Skipped {skipped} quarantined games")
+
+    def add(self, game_id, failure):
+        """
+        Quarantines a game with its GameFailure if its reason repeats on every scan, returns whether
+        the game was quarantined. The line is flushed so that it survives a crash of the scan
+        """
+        if failure.reason not in QUARANTINED_REASONS:
+            return False
+        self.game_ids.add(str(game_id))
+        self.file.write(json.dumps({'id': game_id, 'ply': failure.ply, 'reason': failure.reason,
+                                    'message': failure.message}) + '\n')
+        self.file.flush()
+        return True
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,271 @@
+import itertools
+import logging
+import queue
+import socket
+import socketserver
+import threading
+
+from xqpuzzles.analysis import Pikafish, Stockfish
+from xqpuzzles.cmd import isready, move_recording, send, stop_recording, uci
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import REMOTE_RETRIES, REMOTE_CHECK_TIMEOUT
+from xqpuzzles.logger import log
+from xqpuzzles.scanner import start_engine
+
+# The only options a client may set, the others (threads, hash, files) are owned by the engine
+# server: options such as Debug Log File would let any client write or read files of the server
+CLIENT_OPTIONS = ('uci_variant', 'uci_chess960', 'multipv', 'uci_analysemode', 'uci_wdlcentipawn')
+
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def client_option(line):
+    """
+    Returns whether a setoption line only sets an option a client may set
+    """
+    name = line[len('setoption'):].strip()
+    if not name.startswith('name '):
+        return False
+    name = name[len('name '):].split(' value ', 1)[0].strip()
+    return name.lower() in CLIENT_OPTIONS
+
+
+class EngineRelay(socketserver.StreamRequestHandler):
+    """ Relays the engine line protocol between a client and an idle local engine
+    """
+    def handle(self):
+        plan, engine = self.server.idle.get()
+        process = engine.engine
+        closing = threading.Event()
+        log(Color.DIM, "%s:%d connected to engine %s" % (self.client_address + (process.pid,)))
+
+        def relay_output():
+            while True:
+                line = process.stdout.readline()
+                if line == '' or (closing.is_set() and line.strip() == 'readyok'):
+                    return
+                if not closing.is_set():
+                    try:
+                        self.wfile.write(line.encode())
+                        self.wfile.flush()
+                    except OSError:
+                        closing.set()
+
+        output = threading.Thread(target=relay_output, daemon=True)
+        output.start()
+        try:
+            for line in self.rfile:
+                line = line.decode().strip()
+                if line == 'quit':
+                    break
+                if line.startswith('setoption') and not client_option(line):
+                    logging.warning('Ignored option of %s:%d: %s', *self.client_address, line)
+                    continue
+                send(process, line)
+        except OSError:
+            pass
+        finally:
+            closing.set()
+            try:
+                # Stop a running search and wait until the engine output is drained
+                send(process, 'stop')
+                send(process, 'isready')
+                output.join()
+                if process.poll() is not None:
+                    raise EOFError()
+            except (OSError, EOFError):
+                logging.warning('Engine %s died, restarting it', process.pid)
+                engine.quit()
+                engine = start_engine(self.server.engine_name, plan, **self.server.options)
+            self.server.idle.put((plan, engine))
+
+
+class EngineServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, engine_name, plans, **options):
+        self.engine_name = engine_name
+        self.options = options
+        self.idle = queue.Queue()
+        for plan in plans:
+            self.idle.put((plan, start_engine(engine_name, plan, **options)))
+        super().__init__(address, EngineRelay)
+
+    def quit(self):
+        while not self.idle.empty():
+            _, engine = self.idle.get()
+            engine.quit()
+
+
+def serve_engines(address, engine_name, plans, **options):
+    """
+    Serves the local engines over TCP, every connection is relayed to one idle engine. Clients
+    aren't authenticated, the address must be a trusted interface
+    """
+    server = EngineServer(parse_address(address), engine_name, plans, **options)
+    log(Color.YELLOW, "Serving %d engines on %s" % (len(plans), address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.quit()
+
+
+class Connection(object):
+    """ A TCP connection to an engine server which looks like an engine process to the cmd functions
+    """
+    def __init__(self, address):
+        self.address = address
+        self.pid = '%s:%d' % address
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stdin = self.sock.makefile('w', encoding='utf-8', newline='\n')
+        self.stdout = self.sock.makefile('r', encoding='utf-8', newline='\n')
+
+    def check(self):
+        """
+        Returns whether the engine server still answers on this connection
+        """
+        self.sock.settimeout(REMOTE_CHECK_TIMEOUT)
+        try:
+            isready(self)
+        except (EOFError, OSError):
+            return False
+        self.sock.settimeout(None)
+        return True
+
+    def close(self):
+        for f in (self.stdin, self.stdout, self.sock):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+class ConnectionPool(object):
+    """ Hands out connections to the engine servers in turn and keeps the released ones open
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.turn = itertools.count()
+
+    def connect(self, addresses):
+        with self.lock:
+            start = next(self.turn)
+        # Idle connections may have been dropped by the server or the network meanwhile
+        connection = self._idle(addresses)
+        while connection is not None:
+            if connection.check():
+                return connection
+            logging.warning('Dropping stale connection to engine server %s', connection.pid)
+            connection.close()
+            connection = self._idle(addresses)
+
+        errors = []
+        for i in range(len(addresses)):
+            address = addresses[(start + i) % len(addresses)]
+            try:
+                return Connection(address)
+            except OSError as exp:
+                errors.append(f'{address}: {exp}')
+        raise ConnectionError('No engine server available ({})'.format(', '.join(errors)))
+
+    def _idle(self, addresses):
+        with self.lock:
+            for address in addresses:
+                if self.idle.get(address):
+                    return self.idle[address].pop()
+        return None
+
+    def release(self, connection):
+        with self.lock:
+            self.idle.setdefault(connection.address, []).append(connection)
+
+
+POOL = ConnectionPool()
+
+
+class RemoteEngine(object):
+    """ Mixin for the Engine classes which drives an engine of an engine server instead of a
+        local process. A lost connection is replaced by a new one and the search is retried,
+        unless the search was aborted: an aborted engine is replaced, never retried
+    """
+    aborted = False
+
+    def __init__(self, addresses, **options):
+        self.addresses = [parse_address(a) if isinstance(a, str) else a for a in addresses]
+        options.pop('cpus', None)
+        super().__init__(**options)
+
+    def open_engine(self, command, engine_dir, cpus):
+        return POOL.connect(self.addresses)
+
+    def set_engine_options(self, nnue_file):
+        # Threads, hash and the NNUE file are set by the engine server
+        self.engine_info['options'] = {}
+
+    def reconnect(self):
+        self.engine.close()
+        engine, self.engine = self.engine, POOL.connect(self.addresses)
+        # The searches of the new connection are recorded into the same session
+        move_recording(engine, self.engine)
+        uci(self.engine)
+        isready(self.engine)
+
+    def _retry(self, search, *args):
+        lost = False
+        for attempt in range(REMOTE_RETRIES + 1):
+            try:
+                # A failed reconnection is retried like a failed search
+                if lost:
+                    self.reconnect()
+                return search(*args)
+            except (EOFError, OSError):
+                if self.aborted or attempt == REMOTE_RETRIES:
+                    raise
+                logging.warning('Lost connection to engine server %s, reconnecting', self.engine.pid)
+                lost = True
+
+    def best_move(self, board, limits=None):
+        return self._retry(super().best_move, board, limits)
+
+    def analysis(self, board, multipv=3):
+        return self._retry(super().analysis, board, multipv)
+
+    def search(self, board, multipv=1, **limits):
+        return self._retry(lambda: super(RemoteEngine, self).search(board, multipv, **limits))
+
+    def abort(self):
+        # The search in progress reads the end of the connection and fails with EOFError
+        self.aborted = True
+        self.engine.sock.shutdown(socket.SHUT_RDWR)
+
+    def quit(self):
+        if not self.engine:
+            return
+
+        stop_recording(self.engine)
+        try:
+            isready(self.engine)
+            POOL.release(self.engine)
+        except (EOFError, OSError):
+            self.engine.close()
+        self.engine = None
+
+
+class RemotePikafish(RemoteEngine, Pikafish):
+    pass
+
+
+class RemoteStockfish(RemoteEngine, Stockfish):
+    pass
+
+
+REMOTE_ENGINES = {'pikafish': RemotePikafish, 'stockfish': RemoteStockfish}
@@ -0,0 +1,218 @@
+import glob
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from functools import lru_cache
+
+from xqpuzzles.analysis import Pikafish, Stockfish
+from xqpuzzles.constants import RECORD_FLUSH_SEARCHES, RECORD_FLUSH_SECONDS
+from xqpuzzles.fileio import open_file
+
+# A session file is a JSON line {"engine": <engine name>, "name": <engine id name>} followed by a
+# JSON line {"multipv": .., "position": .., "go": .., "lines": [..]} per search. Only the last info
+# line with a PV of every depth and PV is kept, with the bestmove line. Searches are looked up by
+# the pieces and side to move of their position like the evaluation cache (see evalcache.position_key):
+# with several workers, a position found in the shared cache while recording may be searched when replaying
+SESSION_EXTENSION = '.jsonl.gz'
+_sessions = itertools.count()
+
+
+class ReplayMiss(Exception):
+    pass
+
+
+def search_position(line):
+    """
+    Returns a position command without the move counters of its FEN
+    """
+    tokens = line.split()
+    if tokens[:2] == ['position', 'fen'] and 'moves' not in tokens:
+        return ' '.join(tokens[:4])
+    return line
+
+
+class SessionState(object):
+    """ Follows the commands sent to an engine and returns the key of the searches
+    """
+    def __init__(self):
+        self.multipv = '1'
+        self.position = None
+
+    def command(self, line):
+        if line.startswith('setoption name MultiPV value '):
+            self.multipv = line.rsplit(' ', 1)[1]
+        elif line.startswith('position '):
+            self.position = search_position(line)
+        elif line.startswith('go'):
+            return self.multipv, self.position, line
+        return None
+
+
+class SessionRecorder(object):
+    """ Records the searches of an engine session, see cmd.RECORDERS. The file is flushed every
+        RECORD_FLUSH_SEARCHES searches or RECORD_FLUSH_SECONDS seconds, so that a killed process
+        only loses its last searches
+    """
+    def __init__(self, path, engine_name, name):
+        self.file = open_file(path, 'w')
+        self.state = SessionState()
+        self.search = None
+        self.lines = {}
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+        self._write({'engine': engine_name, 'name': name})
+
+    def _write(self, record):
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.unflushed += 1
+        if self.unflushed >= RECORD_FLUSH_SEARCHES or time.monotonic() - self.flushed_at >= RECORD_FLUSH_SECONDS:
+            self.file.flush()
+            self.unflushed = 0
+            self.flushed_at = time.monotonic()
+
+    def sent(self, line):
+        key = self.state.command(line)
+        if key is not None:
+            self.search = key
+            self.lines = {}
+
+    def received(self, line):
+        if self.search is None:
+            return
+
+        if line.startswith('bestmove'):
+            multipv, position, go = self.search
+            self._write({'multipv': multipv, 'position': position, 'go': go,
+                         'lines': list(self.lines.values()) + [line]})
+            self.search = None
+        elif line.startswith('info') and ' pv ' in line:
+            tokens = line.split()
+            depth = tokens[tokens.index('depth') + 1] if 'depth' in tokens else None
+            pv = tokens[tokens.index('multipv') + 1] if 'multipv' in tokens else '1'
+            # Dicts keep the order of the first line of every depth
+            self.lines.pop((depth, pv), None)
+            self.lines[(depth, pv)] = line
+
+    def close(self):
+        self.file.close()
+
+
+def record_session(record_dir, engine_name, engine):
+    """
+    Records the searches of an engine into a new session file of the directory
+    """
+    from xqpuzzles.cmd import RECORDERS
+
+    os.makedirs(record_dir, exist_ok=True)
+    path = os.path.join(record_dir, '%s-%d-%d%s' % (
+        engine_name, os.getpid(), next(_sessions), SESSION_EXTENSION))
+    RECORDERS[engine.engine] = SessionRecorder(path, engine_name, engine.name)
+
+
+def _read_session(path):
+    with open_file(path) as f:
+        try:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        except (EOFError, ValueError):
+            # The recording process was killed, the searches before its last flush are complete
+            logging.warning('Recording %s is truncated', path)
+
+
+@lru_cache(maxsize=None)
+def load_recordings(path):
+    """
+    Returns the recorded searches of the session files of a directory (or of one
+    session file) by engine name, and the recorded engine ids
+    """
+    searches, names = {}, {}
+    paths = sorted(glob.glob(os.path.join(path, '*' + SESSION_EXTENSION))) if os.path.isdir(path) else [path]
+    for session in paths:
+        records = _read_session(session)
+        header = next(records, None)
+        if header is None:
+            continue
+        names.setdefault(header['engine'], header['name'])
+        engine_searches = searches.setdefault(header['engine'], {})
+        for record in records:
+            key = (record['multipv'], search_position(record['position']), record['go'])
+            engine_searches.setdefault(key, record['lines'])
+
+    return searches, names
+
+
+class ReplayPipe(object):
+    """ The stdin and stdout of a replayed engine
+    """
+    def __init__(self, searches, name):
+        self.searches = searches
+        self.name = name
+        self.state = SessionState()
+        self.output = deque()
+
+    def write(self, data):
+        for line in data.splitlines():
+            if line == 'uci':
+                self.output.extend(['id name %s' % self.name, 'uciok'])
+            elif line == 'isready':
+                self.output.append('readyok')
+            else:
+                key = self.state.command(line)
+                if key is None:
+                    continue
+                if key not in self.searches:
+                    raise ReplayMiss('Search not in the recording: %s, %s' % (key[1], key[2]))
+                self.output.extend(self.searches[key])
+
+    def flush(self):
+        pass
+
+    def readline(self):
+        return self.output.popleft() + '\n' if self.output else ''
+
+
+class ReplayProcess(object):
+    """ Looks like an engine process to the cmd functions and answers the recorded searches instantly
+    """
+    pid = 'replay'
+
+    def __init__(self, searches, name):
+        self.stdin = self.stdout = ReplayPipe(searches, name)
+
+
+class ReplayEngine(object):
+    """ Mixin for the Engine classes which replays the searches recorded by --record
+    """
+    engine_name = None
+
+    def __init__(self, recordings, **options):
+        searches, names = load_recordings(recordings)
+        self.searches = searches.get(self.engine_name, {})
+        self.recorded_name = names.get(self.engine_name, self.engine_name)
+        options.pop('cpus', None)
+        super().__init__(**options)
+
+    def open_engine(self, command, engine_dir, cpus):
+        return ReplayProcess(self.searches, self.recorded_name)
+
+    def abort(self):
+        # Replayed searches return instantly
+        pass
+
+    def quit(self):
+        self.engine = None
+
+
+class ReplayPikafish(ReplayEngine, Pikafish):
+    engine_name = 'pikafish'
+
+
+class ReplayStockfish(ReplayEngine, Stockfish):
+    engine_name = 'stockfish'
+
+
+REPLAY_ENGINES = {'pikafish': ReplayPikafish, 'stockfish': ReplayStockfish}
@@ -0,0 +1,143 @@
+import logging
+import os
+from collections import namedtuple
+
+from xqpuzzles.constants import ENGINE_MEMORY_OVERHEAD, RESERVED_MEMORY
+
+EnginePlan = namedtuple("EnginePlan", ["threads", "memory", "cpus"])
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpu_limit():
+    """
+    Returns the number of CPUs allowed by the cgroup quota or None if unlimited
+    """
+    # cgroup v2
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')
+    if cpu_max:
+        quota, period = (cpu_max.split() + ['100000'])[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+
+    # cgroup v1
+    quota = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+    period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+
+    return None
+
+
+def _cgroup_memory_limit():
+    """
+    Returns the memory (MB) still available under the cgroup limit or None if unlimited
+    """
+    for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                   ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                                    '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+        limit = _read(limit_file)
+        if not limit:
+            continue
+        # cgroup v1 reports a huge number when there is no limit
+        if limit == 'max' or int(limit) >= 2 ** 60:
+            return None
+        usage = int(_read(usage_file) or 0)
+        return max(0, int(limit) - usage) // (1024 * 1024)
+
+    return None
+
+
+def available_cpus():
+    """
+    Returns the list of CPU ids this process may run on, limited by the cgroup quota
+    """
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = list(range(os.cpu_count() or 1))
+
+    quota = _cgroup_cpu_limit()
+    if quota:
+        cpus = cpus[:max(1, int(quota))]
+
+    return cpus
+
+
+def available_memory():
+    """
+    Returns the available memory in MB or None if it can't be determined
+    """
+    memory = None
+    meminfo = _read('/proc/meminfo')
+    if meminfo:
+        for line in meminfo.splitlines():
+            if line.startswith('MemAvailable:'):
+                memory = int(line.split()[1]) // 1024
+                break
+
+    cgroup_memory = _cgroup_memory_limit()
+    if cgroup_memory is not None:
+        memory = cgroup_memory if memory is None else min(memory, cgroup_memory)
+
+    return memory
+
+
+def process_rss():
+    """
+    Returns the resident memory of this process in MB
+    """
+    statm = _read('/proc/self/statm')
+    if statm:
+        return int(statm.split()[1]) * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+
+    # Peak instead of current memory where /proc is not available
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+def plan_engines(count=None, threads=None, memory=None, pin_cpus=False):
+    """
+    Returns an EnginePlan per engine. Missing values (None) are sized automatically from
+    the available cores and memory and the given ones are clamped, so that engines never
+    over-subscribe the CPUs or push the host into swap
+    """
+    cpus = available_cpus()
+    free_memory = available_memory()
+
+    if count is None:
+        count = len(cpus)
+    if count > len(cpus):
+        logging.warning('Requested %d engines but only %d CPUs are available', count, len(cpus))
+    count = max(1, min(count, len(cpus)))
+
+    max_threads = max(1, len(cpus) // count)
+    if threads is None:
+        threads = max_threads
+    elif threads > max_threads:
+        logging.warning('Reducing engine threads from %d to %d', threads, max_threads)
+        threads = max_threads
+
+    if free_memory is not None:
+        max_memory = max(1, (free_memory - RESERVED_MEMORY) // count - ENGINE_MEMORY_OVERHEAD)
+        if memory is None:
+            memory = max_memory
+        elif memory > max_memory:
+            logging.warning('Reducing engine hash from %dMB to %dMB', memory, max_memory)
+            memory = max_memory
+    elif memory is None:
+        raise RuntimeError('Can not determine the available memory, please give the engine hash size')
+
+    plans = []
+    for i in range(count):
+        engine_cpus = cpus[i * threads:(i + 1) * threads] if pin_cpus else None
+        plans.append(EnginePlan(threads, memory, engine_cpus))
+
+    return plans
@@ -0,0 +1,319 @@
+import ast
+import itertools
+import logging
+import multiprocessing
+import threading
+from collections import deque, namedtuple
+from multiprocessing.util import Finalize
+
+from xqpuzzles.analysis import ENGINES
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import EVAL_CACHE_SIZE, PENDING_GAMES, MAX_RSS, POSITION_BATCH, WATCHDOG_GRACE
+from xqpuzzles.ensemble import CrossValidator
+from xqpuzzles.evalcache import SharedEvalCache
+from xqpuzzles.logger import log
+from xqpuzzles.puzzle_finder import Criteria, GameBudgetExceeded, find_position_puzzle, find_puzzle_candidates
+from xqpuzzles.resources import process_rss
+from xqpuzzles.xqboard import InvalidMove, XiangqiBoard, cache_stats
+
+# The engine, evaluation cache and cross validator of the current worker process, and the
+# engine name, EnginePlan and options the engine is restarted with after it's lost
+_engine = None
+_cache = None
+_validator = None
+_engine_spec = None
+
+# Why a game couldn't be scanned, besides the budget reasons of puzzle_finder
+INVALID_MOVE, HUNG, ENGINE_FAILED, ERROR = 'invalid-move', 'hung', 'engine', 'error'
+
+# A game which couldn't be scanned: the ply of the failing position (None if unknown) and why
+GameFailure = namedtuple("GameFailure", ["ply", "reason", "message"])
+# A scanned game row, its moves, found puzzles, the analysis of every scanned position
+# and the GameFailure of a game which couldn't be scanned
+ScannedGame = namedtuple("ScannedGame", ["game", "moves", "puzzles", "timeline", "ucci", "failure"],
+                         defaults=(None,))
+# A scanned position of a FEN list, its puzzle (or None) and the GameFailure of a position
+# which couldn't be scanned
+ScannedPosition = namedtuple("ScannedPosition", ["id", "fen", "puzzle", "failure"], defaults=(None,))
+
+
+def start_engine(engine_name, plan, remote=None, record=None, replay=None, **options):
+    """
+    Starts an engine with the threads, hash and CPUs of the given EnginePlan, connects to an
+    engine of one of the remote engine servers or replays recorded searches. With a record
+    directory, the searches of the engine are recorded into a new session file
+    """
+    if replay:
+        from xqpuzzles.replay import REPLAY_ENGINES
+        return REPLAY_ENGINES[engine_name](replay, threads=plan.threads, memory=plan.memory, **options)
+
+    if remote:
+        from xqpuzzles.remote import REMOTE_ENGINES
+        engine = REMOTE_ENGINES[engine_name](remote, threads=plan.threads, memory=plan.memory, **options)
+    elif engine_name in ENGINES:
+        engine = ENGINES[engine_name](threads=plan.threads, memory=plan.memory, cpus=plan.cpus, **options)
+    else:
+        # Imported by the worker processes too, whatever their start method
+        from xqpuzzles.synthetic import SYNTHETIC_ENGINES
+        engine = SYNTHETIC_ENGINES[engine_name](threads=plan.threads, memory=plan.memory, cpus=plan.cpus, **options)
+
+    if record:
+        from xqpuzzles.replay import record_session
+        record_session(record, engine_name, engine)
+    return engine
+
+
+def start_validator(validation, worker_id, **options):
+    """
+    Starts the cross-validation engine of a worker, or returns None without validation
+    """
+    if validation is None:
+        return None
+
+    engine = start_engine(validation.engine_name, validation.plans[worker_id], **options)
+    return CrossValidator(engine, validation.on_disagreement)
+
+
+def _init_worker(engine_name, plans, cache, validation, options):
+    global _engine, _cache, _validator, _engine_spec
+    worker_id, plan = plans.get()
+    if cache is not None:
+        cache.worker_id = worker_id
+    _cache = cache
+    _engine_spec = (engine_name, plan, options)
+    _engine = start_engine(engine_name, plan, **options)
+    _validator = start_validator(validation, worker_id, **options)
+    # Kill the engines when the worker process exits, the engine may have been restarted by then
+    Finalize(None, _quit_engines, exitpriority=10)
+
+
+def _quit_engines():
+    if _engine is not None:
+        _engine.quit()
+    if _validator is not None:
+        _validator.quit()
+
+
+def _restart_engine():
+    global _engine
+    log(Color.YELLOW, "Restarting the engine")
+    _engine.quit()
+    engine_name, plan, options = _engine_spec
+    _engine = start_engine(engine_name, plan, **options)
+
+
+class Watchdog(object):
+    """
+    Kills the engine once a search outlives the wall-clock budget of its game
+    """
+
+    def __init__(self, engine, seconds):
+        self.engine = engine
+        self.fired = False
+        self.lock = threading.Lock()
+        self.timer = threading.Timer(seconds + WATCHDOG_GRACE, self.abort)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def abort(self):
+        with self.lock:
+            if not self.timer.finished.is_set():
+                self.fired = True
+                self.engine.abort()
+
+    def cancel(self):
+        # Taking the lock keeps a late abort from killing the engine of the next game
+        with self.lock:
+            self.timer.cancel()
+
+
+def game_failure(exp, ply, watchdog=None):
+    """
+    Returns the GameFailure of the exception a game failed with at the given ply
+    """
+    if isinstance(exp, GameBudgetExceeded):
+        return GameFailure(exp.ply, exp.reason, str(exp))
+    if watchdog is not None and watchdog.fired:
+        return GameFailure(ply, HUNG, 'engine killed after a search outlived the game budget')
+    if isinstance(exp, InvalidMove):
+        return GameFailure(exp.ply, INVALID_MOVE, str(exp))
+    if isinstance(exp, (EOFError, OSError)):
+        return GameFailure(ply, ENGINE_FAILED, str(exp) or type(exp).__name__)
+    return GameFailure(ply, ERROR, '%s: %s' % (type(exp).__name__, exp))
+
+
+def scan_game(engine, game, skip_initial=5, criteria=Criteria(), cache=None, validator=None, budget=None):
+    """
+    Returns the ScannedGame of a game row, the failure is set if the game can't be scanned and
+    the puzzles and timeline are the ones of the positions scanned before. A search outliving
+    the wall-clock budget of the GameBudget kills the engine
+    """
+    game_moves, timeline, found = [], [], []
+    watchdog = Watchdog(engine, budget.seconds) if budget is not None and budget.seconds else None
+    try:
+        game_moves = game['moves']
+        if isinstance(game_moves, str):
+            game_moves = ast.literal_eval(game_moves)
+        log(Color.DARK_BLUE, str(game_moves))
+        puzzles = find_puzzle_candidates(engine, game_moves, skip_initial=skip_initial, criteria=criteria,
+                                         timeline=timeline, cache=cache, validator=validator, budget=budget,
+                                         found=found)
+        return ScannedGame(game, game_moves, puzzles, timeline, engine.is_ucci())
+    except Exception as exp:
+        logging.info(f'Got exception in game: {game["id"]}')
+        logging.exception(exp)
+        failure = game_failure(exp, skip_initial + len(timeline), watchdog)
+        return ScannedGame(game, game_moves, found, timeline, engine.is_ucci(), failure)
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+
+
+def _scan_game(args):
+    game, skip_initial, criteria, budget = args
+    scanned = scan_game(_engine, game, skip_initial=skip_initial, criteria=criteria, cache=_cache,
+                        validator=_validator, budget=budget)
+    if scanned.failure is not None and scanned.failure.reason in (HUNG, ENGINE_FAILED):
+        _restart_engine()
+    return scanned
+
+
+def scan_games(engine_name, games, plans, skip_initial=5, criteria=Criteria(), cache_size=EVAL_CACHE_SIZE,
+               validation=None, pending_games=PENDING_GAMES, max_rss=MAX_RSS, budget=None, **options):
+    """
+    Scans the games with an engine per EnginePlan and yields a ScannedGame per game in input order.
+    Every engine runs in its own worker process, no engine is started for empty inputs. With a
+    Validation, every worker also re-checks its puzzles with a second engine. Games are read only
+    as the results are consumed: at most `pending_games` per worker are in flight, and none are
+    added while the process uses more than `max_rss` MB. A game using more than its GameBudget
+    is given up, a worker whose engine is lost restarts it for the next game
+    """
+    tasks = ((game, skip_initial, criteria, budget) for game in games)
+    yield from _run(engine_name, _scan_game, tasks, plans, cache_size, validation, pending_games, max_rss, options)
+
+
+def scan_position(engine, position_id, fen, criteria=Criteria(), cache=None, validator=None, seconds=None):
+    """
+    Returns the ScannedPosition of a FEN, without puzzle and with the failure set if the position
+    can't be scanned. A search running longer than the given seconds kills the engine
+    """
+    watchdog = Watchdog(engine, seconds) if seconds else None
+    try:
+        board = XiangqiBoard(fen, validate_fen=True, ucci=engine.is_ucci())
+        puzzle = find_position_puzzle(engine, board, criteria=criteria, cache=cache, validator=validator)
+        return ScannedPosition(position_id, fen, puzzle)
+    except Exception as exp:
+        logging.info(f'Got exception in position: {position_id}')
+        logging.exception(exp)
+        return ScannedPosition(position_id, fen, None, game_failure(exp, None, watchdog))
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+
+
+def _scan_positions(args):
+    positions, criteria, seconds = args
+    results = []
+    for position_id, fen in positions:
+        scanned = scan_position(_engine, position_id, fen, criteria=criteria, cache=_cache, validator=_validator,
+                                seconds=seconds)
+        # The later positions of the batch are scanned by a new engine
+        if scanned.failure is not None and scanned.failure.reason in (HUNG, ENGINE_FAILED):
+            _restart_engine()
+        results.append(scanned)
+    return results
+
+
+def scan_positions(engine_name, positions, plans, criteria=Criteria(), cache_size=EVAL_CACHE_SIZE, validation=None,
+                   batch_size=POSITION_BATCH, pending_games=PENDING_GAMES, max_rss=MAX_RSS, budget=None, **options):
+    """
+    Scans (id, FEN) positions like scan_games and yields a ScannedPosition per position in input
+    order. The positions are handed to the workers in batches of `batch_size`, every position may
+    use the wall-clock seconds of the GameBudget
+    """
+    positions = iter(positions)
+    batches = iter(lambda: list(itertools.islice(positions, batch_size)), [])
+    seconds = budget.seconds if budget is not None else None
+    tasks = ((batch, criteria, seconds) for batch in batches)
+    for scanned in _run(engine_name, _scan_positions, tasks, plans, cache_size, validation, pending_games, max_rss,
+                        options):
+        yield from scanned
+
+
+def _run(engine_name, run_task, tasks, plans, cache_size, validation, pending_tasks, max_rss, options):
+    """
+    Runs the tasks with the engines of the current worker and yields their results in input order
+    """
+    tasks = iter(tasks)
+    first_task = next(tasks, None)
+    if first_task is None:
+        return
+    tasks = itertools.chain([first_task], tasks)
+
+    cache = SharedEvalCache(cache_size) if cache_size else None
+    try:
+        if len(plans) == 1:
+            yield from _run_locally(engine_name, run_task, tasks, plans[0], cache, validation, options)
+        else:
+            yield from _run_in_pool(engine_name, run_task, tasks, plans, cache, validation, options,
+                                    pending_tasks * len(plans), max_rss)
+    finally:
+        if cache is not None:
+            lookups, hits, stores, contended = cache.stats()
+            log(Color.DIM, "Evaluation cache: %d/%d hits (%.1f%%), %d stores, %d contended locks" %
+                (hits, lookups, 100.0 * hits / max(1, lookups), stores, contended))
+            cache.close(unlink=True)
+
+
+def _run_locally(engine_name, run_task, tasks, plan, cache, validation, options):
+    global _engine, _cache, _validator, _engine_spec
+    _cache = cache
+    _engine_spec = (engine_name, plan, options)
+    _engine = start_engine(engine_name, plan, **options)
+    _validator = start_validator(validation, 0, **options)
+    try:
+        for task in tasks:
+            yield run_task(task)
+    finally:
+        _quit_engines()
+        _engine, _cache, _validator, _engine_spec = None, None, None, None
+        for name, stats in cache_stats().items():
+            log(Color.DIM, "Position cache %s: %d/%d hits" % (name, stats['hits'], stats['hits'] + stats['misses']))
+
+
+def _memory_exceeded(max_rss, throttled):
+    exceeded = max_rss is not None and process_rss() > max_rss
+    if exceeded and not throttled:
+        logging.warning('Resident memory above %dMB, throttling the scan', max_rss)
+    return exceeded
+
+
+def _run_in_pool(engine_name, run_task, tasks, plans, cache, validation, options, max_pending, max_rss):
+    plan_queue = multiprocessing.Queue()
+    for worker_id, plan in enumerate(plans):
+        plan_queue.put((worker_id, plan))
+
+    pool = multiprocessing.Pool(len(plans), _init_worker, (engine_name, plan_queue, cache, validation, options))
+    # Unlike Pool.imap, which reads the whole input ahead, a task is submitted once a slot is free
+    pending = deque()
+    throttled = False
+    finished = False
+    try:
+        for task in tasks:
+            while pending:
+                throttled = _memory_exceeded(max_rss, throttled)
+                if len(pending) < max_pending and not throttled:
+                    break
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(run_task, (task,)))
+
+        while pending:
+            yield pending.popleft().get()
+        finished = True
+    finally:
+        if finished:
+            pool.close()
+        else:
+            # Stopped early, the engines exit on their own once the workers close their stdin
+            pool.terminate()
+        pool.join()
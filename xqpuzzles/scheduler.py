@@ -0,0 +1,83 @@
+import ast
+import heapq
+import logging
+
+import numpy as np
+
+from xqpuzzles.constants import MAX_RSS, PRIORITY_WINDOW
+from xqpuzzles.features import encode_boards, piece_counts
+from xqpuzzles.resources import process_rss
+from xqpuzzles.xqboard import XiangqiBoard, game_boards
+
+# End reasons of games which were not decided on the board, a stalemated side loses in xiangqi
+DRAW_END_REASONS = ('draw', 'agreement', 'repetition', 'aborted', 'abandoned')
+# End reasons of games which were mated on the board
+MATE_END_REASONS = ('checkmate', 'mate')
+
+
+def _rating(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def game_priority(game):
+    """
+    Returns a cheap estimate of how many puzzles a game holds: long decisive games with
+    many captures and checks between weaker players make more mistakes to punish
+    """
+    moves = game['moves']
+    if isinstance(moves, str):
+        moves = ast.literal_eval(moves)
+
+    board = XiangqiBoard()
+    boards = game_boards(board, moves)
+    checks = sum(1 for b in boards if b.is_checked())
+    # A capture removes a piece from the board
+    pieces = piece_counts(encode_boards([board] + boards)).sum(axis=(1, 2))
+    captures = int((np.diff(pieces) < 0).sum())
+
+    priority = min(len(moves), 200) / 10.0 + 2.0 * captures + 1.0 * checks
+
+    end_reason = (game.get('end_reason') or '').lower()
+    if end_reason and not any(reason in end_reason for reason in DRAW_END_REASONS):
+        priority += 10.0
+    if end_reason in MATE_END_REASONS:
+        priority += 10.0
+
+    ratings = [r for r in (_rating(game.get('rrating')), _rating(game.get('brating'))) if r]
+    if ratings:
+        # Up to 10 points for players below 2000
+        priority += max(0.0, min(10.0, (2000.0 - sum(ratings) / len(ratings)) / 100.0))
+
+    return priority
+
+
+def prioritize(games, window=PRIORITY_WINDOW, max_rss=MAX_RSS):
+    """
+    Yields the games with the highest priority first, within windows of the given number
+    of games (0 for the whole corpus) so that huge corpora don't have to fit in memory. A
+    window is also closed once the process uses more than `max_rss` MB, like the scan itself
+    """
+    games = iter(games)
+    while True:
+        scored = []
+        for index, game in enumerate(games):
+            try:
+                priority = game_priority(game)
+            except Exception:
+                logging.exception(f'Failed to score game {game.get("id")}')
+                priority = 0.0
+            scored.append((-priority, index, game))
+            if window and len(scored) >= window:
+                break
+            if max_rss is not None and process_rss() > max_rss:
+                logging.warning('Resident memory above %dMB, ordering %d games', max_rss, len(scored))
+                break
+        if not scored:
+            return
+
+        heapq.heapify(scored)
+        while scored:
+            yield heapq.heappop(scored)[2]
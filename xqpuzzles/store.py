@@ -0,0 +1,293 @@
+import csv
+import json
+import logging
+import os
+import random
+import socketserver
+import sqlite3
+import stat
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from xqpuzzles.colors import Color
+from xqpuzzles.constants import STORE_BATCH_SIZE, STORE_CONNECTIONS, STORE_PAGE_SIZE
+from xqpuzzles.fileio import open_file
+from xqpuzzles.logger import log
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY,
+    game_id TEXT,
+    fen TEXT NOT NULL,
+    moves_count INTEGER,
+    theme TEXT,
+    score TEXT,
+    score_bucket INTEGER,
+    first_turn TEXT,
+    pv TEXT,
+    cross_check TEXT,
+    difficulty REAL
+);
+CREATE INDEX IF NOT EXISTS puzzles_theme ON puzzles (theme, moves_count);
+CREATE INDEX IF NOT EXISTS puzzles_moves_count ON puzzles (moves_count);
+CREATE INDEX IF NOT EXISTS puzzles_first_turn ON puzzles (first_turn, theme);
+CREATE INDEX IF NOT EXISTS puzzles_score_bucket ON puzzles (score_bucket);
+CREATE INDEX IF NOT EXISTS puzzles_game_id ON puzzles (game_id);
+CREATE TABLE IF NOT EXISTS seen (
+    client TEXT NOT NULL,
+    puzzle_id INTEGER NOT NULL,
+    PRIMARY KEY (client, puzzle_id)
+) WITHOUT ROWID;
+'''
+COLUMNS = ('game_id', 'fen', 'moves_count', 'theme', 'score', 'score_bucket', 'first_turn', 'pv', 'cross_check',
+           'difficulty')
+FILTERS = ('theme', 'moves_count', 'first_turn', 'score_bucket', 'game_id')
+# Bucket of the mate scores, centipawn scores are bucketed by hundreds between them
+MATE_BUCKET = 100
+# Random ids drawn per sampled puzzle before a sample is returned short
+SAMPLE_ATTEMPTS = 4
+
+
+def score_bucket(score):
+    """
+    Returns the bucket of a score or of its CSV text ('+450', '#-3')
+    """
+    score = str(score)
+    if score.startswith('#'):
+        return -MATE_BUCKET if score[1:].startswith('-') else MATE_BUCKET
+    return max(-MATE_BUCKET + 1, min(MATE_BUCKET - 1, int(int(score) / 100)))
+
+
+class PuzzleStore(object):
+    """ Puzzles in an indexed SQLite file. Puzzles are added in batches, every batch is written
+        in one transaction, and are queried by theme, moves count, first turn, score bucket or game
+    """
+    def __init__(self, path, batch_size=STORE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = []
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def add(self, puzzles, game_id=None):
+        """
+        Adds the puzzles of a game, they're written once a batch is full
+        """
+        for puzzle in puzzles:
+            self.pending.append((
+                game_id if game_id is not None else puzzle.get('game_id'), puzzle['fen'], int(puzzle['moves_count']),
+                puzzle['theme'], str(puzzle['score']), score_bucket(puzzle['score']), puzzle['first_turn'],
+                puzzle['pv'] if isinstance(puzzle['pv'], str) else str(puzzle['pv']), puzzle.get('cross_check', ''),
+                float(puzzle['difficulty']) if puzzle.get('difficulty') not in (None, '') else None,
+            ))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany('INSERT INTO puzzles (%s) VALUES (%s)' % (
+                ', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), self.pending)
+        self.pending = []
+
+    def import_csv(self, csv_file):
+        """
+        Adds the puzzles of a puzzles CSV file (compressed by its extension), returns their number
+        """
+        count = 0
+        with open_file(csv_file) as f:
+            for row in csv.DictReader(f):
+                self.add([row])
+                count += 1
+        self.flush()
+        return count
+
+    def query(self, limit=STORE_PAGE_SIZE, after=None, sample=False, unseen_by=None, **filters):
+        """
+        Returns a page of puzzles matching the filters, ordered by id after the given id or sampled
+        at random. With unseen_by, only the puzzles that client hasn't been given yet are returned
+        and the returned ones are marked as seen
+        """
+        # A negative SQLite LIMIT means no limit
+        if limit < 1:
+            raise ValueError('limit must be positive')
+
+        where, params = [], []
+        for name in FILTERS:
+            if filters.get(name) is not None:
+                where.append('%s = ?' % name)
+                params.append(filters[name])
+        if unseen_by is not None:
+            where.append('NOT EXISTS (SELECT 1 FROM seen WHERE client = ? AND puzzle_id = puzzles.id)')
+            params.append(unseen_by)
+
+        if sample:
+            rows = self._sample(where, params, limit)
+        else:
+            if after is not None:
+                where.append('id > ?')
+                params.append(after)
+            rows = self._select(where, params, limit)
+
+        if unseen_by is not None and rows:
+            with self.db:
+                self.db.execute('BEGIN IMMEDIATE')
+                self.db.executemany('INSERT OR IGNORE INTO seen (client, puzzle_id) VALUES (?, ?)',
+                                    [(unseen_by, row['id']) for row in rows])
+        return rows
+
+    def _sample(self, where, params, limit):
+        # Every sampled puzzle is the first match at or after an independent random id between the
+        # first and the last match, one index seek each instead of sorting every match
+        low, high = self.db.execute('SELECT MIN(id), MAX(id) FROM puzzles %s' % (
+            'WHERE ' + ' AND '.join(where) if where else ''), params).fetchone()
+        rows, ids = [], set()
+        if low is None:
+            return rows
+        for _ in range(limit * SAMPLE_ATTEMPTS):
+            found = self._select(where + ['id >= ?'], params + [random.randint(low, high)], 1)
+            if not found:
+                break
+            if found[0]['id'] not in ids:
+                ids.add(found[0]['id'])
+                rows.append(found[0])
+                if len(rows) == limit:
+                    break
+        return rows
+
+    def _select(self, where, params, limit):
+        cursor = self.db.execute('SELECT id, %s FROM puzzles %s ORDER BY id LIMIT ?' % (
+            ', '.join(COLUMNS), 'WHERE ' + ' AND '.join(where) if where else ''), params + [limit])
+        return [dict(zip(('id',) + COLUMNS, row)) for row in cursor]
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM puzzles').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """ Answers GET /puzzles?theme=CHECKMATE&moves_count=3&limit=20 with a JSON page of puzzles.
+        Other parameters: first_turn, score_bucket, game_id, after (id of the last puzzle of the
+        previous page), random=1 to sample the matches and unseen=CLIENT
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/puzzles':
+            self.reply(404, {'error': 'Unknown path, expected /puzzles'})
+            return
+
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            filters = {name: params[name] for name in FILTERS if name in params}
+            for name in ('moves_count', 'score_bucket'):
+                if name in filters:
+                    filters[name] = int(filters[name])
+            with self.server.store() as store:
+                puzzles = store.query(
+                    limit=min(int(params.get('limit', STORE_PAGE_SIZE)), 1000),
+                    after=int(params['after']) if 'after' in params else None,
+                    sample=params.get('random') in ('1', 'true'),
+                    unseen_by=params.get('unseen'), **filters)
+        except ValueError as exp:
+            self.reply(400, {'error': str(exp)})
+            return
+
+        self.reply(200, {'puzzles': puzzles, 'after': puzzles[-1]['id'] if puzzles else None})
+
+    def reply(self, status, message):
+        body = json.dumps(message).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logging.debug('%s %s' % (self.address_string(), format % args))
+
+
+class StoreConnections(object):
+    """ A bounded pool of store connections for the server threads, which run one per request. A
+        request borrows an idle connection, or opens one while there are fewer than the pool size,
+        and gives it back, so a connection is opened once and is never used by two threads at once
+    """
+    def init_store(self, path, size=STORE_CONNECTIONS):
+        self.store_path = path
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.idle_lock = threading.Lock()
+
+    @contextmanager
+    def store(self):
+        with self.slots:
+            with self.idle_lock:
+                store = self.idle.pop() if self.idle else None
+            if store is None:
+                store = PuzzleStore(self.store_path)
+            try:
+                yield store
+            finally:
+                with self.idle_lock:
+                    self.idle.append(store)
+
+    def server_close(self):
+        super().server_close()
+        with self.idle_lock:
+            for store in self.idle:
+                store.close()
+            self.idle = []
+
+
+class QueryServer(StoreConnections, ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store_path):
+        self.init_store(store_path)
+        super().__init__(address, QueryHandler)
+
+
+class UnixQueryServer(StoreConnections, socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, store_path):
+        self.init_store(store_path)
+        super().__init__(socket_path, QueryHandler)
+
+
+def serve_puzzles(address, store_path):
+    """
+    Serves the puzzle queries over HTTP on HOST:PORT or on a Unix socket path until interrupted
+    """
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        server = QueryServer((host, int(port)), store_path)
+    else:
+        if os.path.exists(address):
+            # Only a socket left by a previous server is replaced
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise FileExistsError(f'{address} exists and is not a socket')
+            os.unlink(address)
+        server = UnixQueryServer(address, store_path)
+
+    log(Color.YELLOW, "Serving puzzle queries of %s on %s" % (store_path, address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if ':' not in address:
+            os.unlink(address)
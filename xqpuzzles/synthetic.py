@@ -0,0 +1,124 @@
+import csv
+import hashlib
+import random
+import time
+
+from chess.engine import Cp, Mate
+
+from xqpuzzles.analysis import AnalyzedMove, Engine
+from xqpuzzles.fileio import open_file
+from xqpuzzles.xqboard import XiangqiBoard
+
+GAME_FIELDS = ['id', 'rplayer', 'bplayer', 'moves_count', 'end_reason', 'rrating', 'brating', 'moves']
+
+
+def random_game(rng, min_plies=20, max_plies=120, capture_bias=0.5):
+    """
+    Plays a legal semi-random game, captures are preferred with the given probability.
+    Returns the uci moves and the end reason
+    """
+    board = XiangqiBoard()
+    moves = []
+    length = rng.randint(min_plies, max_plies)
+    while len(moves) < length:
+        legal_moves = sorted(board.legal_moves())
+        if not legal_moves:
+            return moves, 'checkmate' if board.is_checked() else 'stalemate'
+
+        captures = [m for m in legal_moves if board.get_captured_piece(m) != ' ']
+        if captures and rng.random() < capture_bias:
+            move = rng.choice(captures)
+        else:
+            move = rng.choice(legal_moves)
+        board.push([move])
+        moves.append(move)
+
+    return moves, rng.choice(['resign', 'timeout', 'draw'])
+
+
+def synthetic_games(count, seed=0, min_plies=20, max_plies=120):
+    """
+    Yields deterministic synthetic game rows in the format of fetch_xq_games.py
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        moves, end_reason = random_game(rng, min_plies, max_plies)
+        yield {
+            'id': f'synthetic-{seed}-{i}',
+            'rplayer': f'red-{rng.randint(1, 100)}',
+            'bplayer': f'black-{rng.randint(1, 100)}',
+            'moves_count': len(moves),
+            'end_reason': end_reason,
+            'rrating': rng.randint(800, 2400),
+            'brating': rng.randint(800, 2400),
+            'moves': moves,
+        }
+
+
+def write_synthetic_csv(path, count, seed=0, min_plies=20, max_plies=120):
+    with open_file(path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=GAME_FIELDS)
+        writer.writeheader()
+        for game in synthetic_games(count, seed, min_plies, max_plies):
+            writer.writerow(game)
+
+
+class StandInEngine(Engine):
+    """ An engine without a process for load tests: the score and PV of a position are derived
+        from its FEN, so scans are deterministic, and every search takes `latency` seconds
+    """
+    def __init__(self, nodes=None, latency=0.0, **options):
+        self.nodes = nodes
+        self.latency = latency
+        self.engine = None
+        self.engine_info = {'name': 'Stand-in'}
+
+    def is_ucci(self) -> bool:
+        return False
+
+    def new_game(self):
+        pass
+
+    def search(self, board, multipv=1, **limits):
+        if self.latency:
+            time.sleep(self.latency)
+
+        digest = hashlib.blake2b(board.fen.encode(), digest_size=8).digest()
+        value = int.from_bytes(digest[:4], 'little', signed=True)
+        legal_moves = sorted(board.legal_moves())
+        if not legal_moves:
+            return [AnalyzedMove(None, None, Mate(0), None, 1, 1)]
+
+        # Mostly balanced scores with occasional big swings and mates
+        if value % 50 == 0:
+            score = Mate(1 + abs(value) % 9 if board.turn else -1 - abs(value) % 9)
+        else:
+            score = Cp(value % 1200 - 600 if value % 7 == 0 else value % 200 - 100)
+
+        analyses = []
+        for i in range(min(multipv, len(legal_moves))):
+            move = legal_moves[(digest[4] + i) % len(legal_moves)]
+            board_after = board.copy()
+            board_after.push([move])
+            replies = sorted(board_after.legal_moves())
+            pv = [move] + ([replies[digest[5] % len(replies)]] if replies else [])
+            # The other lines are equal
+            analyses.append(AnalyzedMove(move, board.get_san(move), score if i == 0 else Cp(0), pv, 1, 1))
+        return analyses
+
+    def analysis(self, board, multipv=3):
+        return self.search(board, multipv)
+
+    def best_move(self, board, limits=None):
+        return self.search(board)[0]
+
+    def abort(self):
+        # Searches end after their latency
+        pass
+
+    def quit(self):
+        pass
+
+
+# The engines of the load tests and tests, start_engine only looks them up when the name is not a real engine
+SYNTHETIC_ENGINES = {'standin': StandInEngine}
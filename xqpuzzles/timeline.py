@@ -0,0 +1,86 @@
+import json
+
+from chess.engine import Cp, Mate
+
+from xqpuzzles.analysis import AnalyzedMove
+from xqpuzzles.features import encode_boards, major_piece_diff
+from xqpuzzles.fileio import open_file
+from xqpuzzles.puzzle_finder import Criteria, classify_position, verify_mate_puzzle
+from xqpuzzles.xqboard import XiangqiBoard, game_boards
+
+# A stored timeline is one JSON line per game:
+#   {"id": <game id>, "moves": [<uci moves>], "skip": <skipped moves>, "ucci": <pv notation>,
+#    "plies": [[<score>, <depth>, <nodes>, <pv>, <trace>], ...]}
+# the first ply is the position after the skipped moves, a score is the
+# centipawns (int) or "#<mate>" from red's point of view
+
+
+def score_to_json(score):
+    if score.is_mate():
+        return '#%d' % score.mate()
+    return score.score()
+
+
+def score_from_json(value):
+    if isinstance(value, str):
+        return Mate(int(value[1:]))
+    return Cp(value)
+
+
+def trace_to_json(trace):
+    return [[depth, move, score_to_json(score), nodes] for depth, move, score, nodes in trace or ()]
+
+
+def trace_from_json(trace):
+    return [(depth, move, score_from_json(score), nodes) for depth, move, score, nodes in trace]
+
+
+def write_timeline(file, game_id, moves, skip_initial, timeline, ucci=False):
+    """
+    Appends the analyses of a scanned game to an opened timeline file
+    """
+    plies = [[score_to_json(a.score), a.depth, a.nodes, a.pv, trace_to_json(a.trace)] for a in timeline]
+    record = {'id': game_id, 'moves': moves, 'skip': skip_initial, 'ucci': ucci, 'plies': plies}
+    file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def open_timelines(path, mode='a'):
+    return open_file(path, mode)
+
+
+def read_timelines(path):
+    with open_file(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def reclassify(record, criteria=Criteria(), engine=None):
+    """
+    Returns the puzzles of a stored game timeline with the given predicates. The engine is only
+    needed to verify checkmate puzzles like a scan does, unless criteria.verify_mates is off
+    """
+    if criteria.verify_mates and engine is None:
+        raise ValueError('Verifying checkmate puzzles requires an engine')
+
+    moves, skip_initial, plies = record['moves'], record['skip'], record['plies']
+    board = XiangqiBoard(ucci=record.get('ucci', False))
+    board.push(moves[:skip_initial])
+
+    puzzles = []
+    prev_score = score_from_json(plies[0][0])
+    boards = game_boards(board, moves[skip_initial:len(plies) - 1 + skip_initial])
+    material_diffs = major_piece_diff(encode_boards(boards)) if boards else []
+    for board, ply, material_diff in zip(boards, plies[1:], material_diffs):
+        # Timelines written before the search traces were stored have 4 values per ply
+        score, depth, nodes, pv = ply[:4]
+        trace = trace_from_json(ply[4]) if len(ply) > 4 else None
+        analysis = AnalyzedMove(pv[0] if pv else None, None, score_from_json(score), pv, depth, nodes, None, trace)
+        puzzle = classify_position(prev_score, board, analysis, criteria, material_diff)
+        if puzzle and puzzle['theme'] == 'CHECKMATE' and criteria.verify_mates:
+            puzzle = verify_mate_puzzle(engine, board, puzzle, criteria)
+        if puzzle:
+            puzzles.append(puzzle)
+        prev_score = analysis.score
+
+    return puzzles
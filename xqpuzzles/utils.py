@@ -1,12 +1,22 @@
 import csv
 import os
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
 
-from chess.engine import Score
+from xqpuzzles.archive import ARCHIVE_EXTENSION, GameArchive
+from xqpuzzles.constants import PUZZLE_FLUSH_ROWS, PUZZLE_FLUSH_SECONDS
+from xqpuzzles.fileio import open_file
 
-from xqpuzzles.xqboard import XiangqiBoard
+if TYPE_CHECKING:
+    from chess.engine import Score
 
 
-def sign(score: Score) -> int:
+PUZZLE_FIELDS = ['game_id', 'fen', 'moves_count', 'theme', 'score', 'first_turn', 'pv', 'url', 'cross_check',
+                 'difficulty']
+
+
+def sign(score: 'Score') -> int:
     if score.is_mate():
         s = score.mate()
     else:
@@ -18,31 +28,58 @@ def sign(score: Score) -> int:
     return 0
 
 
-def get_material_diff(board: XiangqiBoard):
-    red = 0
-    black = 0
-    for piece in board.fen.split(' ')[0]:
-        if piece in ('r', 'c', 'n', 'h'):
-            black += 1
-        elif piece in ('R', 'C', 'N', 'H'):
-            red += 1
+@contextmanager
+def open_games(path):
+    """
+    Opens a games CSV file or binary game archive and yields an iterator of its game rows
+    """
+    if path.endswith(ARCHIVE_EXTENSION):
+        with GameArchive(path) as archive:
+            yield iter(archive)
+    else:
+        with open_file(path) as file:
+            yield csv.DictReader(file)
 
-    return abs(red - black)
 
+def read_positions(file):
+    """
+    Yields the (id, FEN) positions of a FEN list: a FEN per line, optionally preceded
+    by an id and a comma or tab. Positions without id are numbered by line
+    """
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        for separator in ('\t', ','):
+            if separator in line:
+                position_id, fen = line.split(separator, 1)
+                yield position_id.strip(), fen.strip()
+                break
+        else:
+            yield str(number), line
 
-def export_puzzles_to_csv(csv_file, puzzles, game_id=None):
-    # Check if the file exists
-    if not os.path.isfile(csv_file):
-        # If it doesn't exist, create a new file and write the header row
-        with open(csv_file, 'w', newline='') as f:
-            fieldnames = ['game_id', 'fen', 'moves_count', 'theme', 'score', 'first_turn', 'pv', 'url']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-
-    with open(csv_file, 'a', newline='') as f:
-        fieldnames = ['game_id', 'fen', 'moves_count', 'theme', 'score', 'first_turn', 'pv', 'url']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
 
+class PuzzleWriter(object):
+    """ Appends puzzle rows to a puzzles CSV file (compressed by its extension) which stays
+        open while the games are scanned, the columns of existing files are kept. The file is
+        flushed every PUZZLE_FLUSH_ROWS rows or PUZZLE_FLUSH_SECONDS seconds and when closed
+    """
+    def __init__(self, csv_file, flush_rows=PUZZLE_FLUSH_ROWS, flush_seconds=PUZZLE_FLUSH_SECONDS):
+        fieldnames = None
+        if os.path.isfile(csv_file):
+            with open_file(csv_file) as f:
+                fieldnames = next(csv.reader(f), None)
+
+        self.file = open_file(csv_file, 'a')
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames or PUZZLE_FIELDS, extrasaction='ignore')
+        if not fieldnames:
+            self.writer.writeheader()
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def write(self, puzzles, game_id=None):
         for puzzle in puzzles:
             row = {
                 'game_id': game_id,
@@ -53,5 +90,29 @@ def export_puzzles_to_csv(csv_file, puzzles, game_id=None):
                 'first_turn': puzzle['first_turn'],
                 'pv': puzzle['pv'],
                 'url': f'https://xiangqi-dev.arbisoft.com/editor/{puzzle["fen"].split()[0]}',
+                'cross_check': puzzle.get('cross_check', ''),
+                'difficulty': puzzle.get('difficulty', ''),
             }
-            writer.writerow(row)
+            self.writer.writerow(row)
+            self.unflushed += 1
+        if self.unflushed >= self.flush_rows or time.monotonic() - self.flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.unflushed = 0
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def export_puzzles_to_csv(csv_file, puzzles, game_id=None):
+    with PuzzleWriter(csv_file) as writer:
+        writer.write(puzzles, game_id=game_id)
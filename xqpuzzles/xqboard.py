@@ -1,4 +1,7 @@
 import re
+from functools import lru_cache
+
+from xqpuzzles.constants import POSITION_CACHE_SIZE
 
 try:
     import pyffish as sf
@@ -12,7 +15,44 @@ MATE, STALEMATE, DRAW = range(1, 4)
 
 
 class InvalidMove(Exception):
-    pass
+
+    def __init__(self, message, ply=None):
+        super().__init__(message)
+        self.ply = ply
+
+
+# Every fact is cached on its own by FEN, a caller only pays for the facts it asks for
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _legal_moves(variant, fen):
+    return tuple(sf.legal_moves(variant, fen, []))
+
+
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _gives_check(variant, fen):
+    return sf.gives_check(variant, fen, [])
+
+
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _insufficient_material(variant, fen):
+    return tuple(sf.has_insufficient_material(variant, fen, []))
+
+
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _get_san(variant, fen, move):
+    return sf.get_san(variant, fen, move, sf.NOTATION_DEFAULT)
+
+
+@lru_cache(maxsize=POSITION_CACHE_SIZE)
+def _get_fen(variant, fen, moves):
+    return sf.get_fen(variant, fen, list(moves))
+
+
+def cache_stats():
+    """
+    Returns the hits, misses and size of the position caches
+    """
+    return {cache.__name__.lstrip('_'): cache.cache_info()._asdict()
+            for cache in (_legal_moves, _gives_check, _insufficient_material, _get_san, _get_fen)}
 
 
 def uci_to_ucci(uci):
@@ -46,6 +86,38 @@ def uci_to_board_coord(uci):
     return (r1, c1), (r2, c2)
 
 
+class MoveHistory(object):
+    """ An immutable list of moves, extending it shares the existing moves with the new
+        history so that boards can be copied in O(1) regardless of the game length
+    """
+    __slots__ = ('move', 'parent', 'length')
+
+    def __init__(self, move=None, parent=None):
+        self.move = move
+        self.parent = parent
+        self.length = parent.length + 1 if parent is not None else 0
+
+    def extend(self, moves):
+        history = self
+        for move in moves:
+            history = MoveHistory(move, history)
+        return history
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        moves = []
+        history = self
+        while history.parent is not None:
+            moves.append(history.move)
+            history = history.parent
+        return reversed(moves)
+
+
+EMPTY_HISTORY = MoveHistory()
+
+
 class XiangqiBoard:
 
     def __init__(self, fen=XIANGQI_START_FEN, validate_fen=False, ucci=False):
@@ -57,7 +129,7 @@ class XiangqiBoard:
         self.ucci = ucci
         self.initial_fen = fen
         self.fen = fen
-        self.uci_stack = []
+        self.history = EMPTY_HISTORY
 
     def __str__(self):
         fen = self.fen
@@ -75,6 +147,10 @@ class XiangqiBoard:
     def turn(self):
         return True if self.fen.split()[1] == 'w' else False
 
+    @property
+    def uci_stack(self):
+        return list(self.history)
+
     @property
     def stack(self):
         if not self.ucci:
@@ -95,8 +171,8 @@ class XiangqiBoard:
             moves = [ucci_to_uci(m) for m in moves]
 
         try:
-            self.fen = sf.get_fen(self.variant, self.fen, moves)
-            self.uci_stack += moves
+            self.fen = _get_fen(self.variant, self.fen, tuple(moves))
+            self.history = self.history.extend(moves)
         except Exception:
             raise InvalidMove('{} is not valid move sequence'.format(moves))
 
@@ -107,19 +183,19 @@ class XiangqiBoard:
         if is_ucci:
             move = ucci_to_uci(move)
 
-        return sf.get_san(self.variant, self.fen, move, sf.NOTATION_DEFAULT)
+        return _get_san(self.variant, self.fen, move)
 
     def legal_moves(self):
         """
         Returns the list of all available legal moves on the board
         """
-        return sf.legal_moves(self.variant, self.fen, [])
+        return list(_legal_moves(self.variant, self.fen))
 
     def is_checked(self):
         """
         Returns the boolean if any of the king is in check or not
         """
-        return sf.gives_check(self.variant, self.fen, [])
+        return _gives_check(self.variant, self.fen)
 
     def insufficient_material(self):
         """
@@ -127,7 +203,7 @@ class XiangqiBoard:
         If both player has insufficient material -> (False, False)
         If red has insufficient material -> (True, False)
         """
-        return sf.has_insufficient_material(self.variant, self.fen, [])
+        return _insufficient_material(self.variant, self.fen)
 
     def is_optional_game_end(self):
         return sf.is_optional_game_end(self.variant, self.fen, [])
@@ -141,8 +217,7 @@ class XiangqiBoard:
             return DRAW
 
         # TODO: Need to add check for rules i.e 50 move or repetition
-        legal_moves = self.legal_moves()
-        if legal_moves:
+        if self.legal_moves():
             return status
 
         if self.is_checked():
@@ -168,7 +243,7 @@ class XiangqiBoard:
         board = type(self)(None)
         board.initial_fen = self.initial_fen
         board.fen = self.fen
-        board.uci_stack = [m for m in self.uci_stack]
+        board.history = self.history
         board.ucci = self.ucci
 
         return board
@@ -184,4 +259,20 @@ class XiangqiBoard:
             board = fen.split()[0]
         board = board.replace('+', '')
         board = re.sub(r'\d', (lambda m: '.' * int(m.group(0))), board)
-        print('', ' '.join(uni_pieces.get(p, p) for p in board))    # noqa T001
\ No newline at end of file
+        print('', ' '.join(uni_pieces.get(p, p) for p in board))    # noqa T001
+
+
+def game_boards(board, moves):
+    """
+    Returns the boards reached by playing the moves one by one from the given board
+    """
+    boards = []
+    for move in moves:
+        board = board.copy()
+        try:
+            board.push([move])
+        except InvalidMove as exp:
+            raise InvalidMove(str(exp), len(board.history) + 1) from exp
+        boards.append(board)
+
+    return boards